@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""Benchmark de vazão e latência de cauda das rotas /ia/*
+
+Dispara as rotas de IA em níveis fixos de concorrência e informa requisições
+por segundo, taxa de erro e p50/p95/p99 (e tempo até o primeiro byte no chat
+em streaming). Pensado para rodar com o backend apontado para o stub local
+(openai_stub_server.py), sem gastar cota da OpenAI.
+
+Uso:
+    python openai_stub_server.py --latencia-chat lognormal:800:0.5 &
+    python benchmark_ia.py --email admin@exemplo.com --senha ... \\
+        --cenarios vencimento,chat,chat_stream --concorrencia 1,8,32 --requisicoes 200
+
+Para medir o caminho até o modelo (e não o cache de respostas), suba o
+backend com LLM_CACHE_ENABLED=false.
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+PERGUNTAS = [
+    'Quais produtos vencem nesta semana?',
+    'Qual categoria tem mais perdas por vencimento?',
+    'Que produtos devo colocar em promoção?',
+    'Como está o giro dos laticínios?',
+    'Quais itens estão abaixo do estoque mínimo?',
+    'Qual o valor em risco de vencimento no mês?',
+]
+
+BUSCAS = ['leite integral', 'pão de forma', 'iogurte natural', 'queijo muçarela', 'suco de laranja']
+
+class Cliente:
+    """Sessão HTTP autenticada (uma por thread, para reaproveitar conexões)"""
+
+    def __init__(self, base_url, token, timeout):
+        self.base_url = base_url
+        self.token = token
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        if not hasattr(self._local, 'session'):
+            session = requests.Session()
+            session.headers['Authorization'] = f'Bearer {self.token}'
+            self._local.session = session
+        return self._local.session
+
+    def request(self, method, path, **kwargs):
+        return self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+
+def autenticar(args):
+    if args.token:
+        return args.token
+    response = requests.post(
+        f'{args.url}{args.prefixo}/auth/login',
+        json={'email': args.email, 'password': args.senha},
+        timeout=30
+    )
+    response.raise_for_status()
+    return response.json()['access_token']
+
+def montar_cenarios(cliente, produto_ids, lote):
+    """Cada cenário é uma função que faz uma requisição e retorna (ok, ttfb_ms ou None)"""
+    sessao = {}
+
+    def amostra():
+        return random.sample(produto_ids, min(lote, len(produto_ids)))
+
+    def simples(method, path, body=None):
+        def executar(i):
+            response = cliente.request(method, path, json=body(i) if body else None)
+            return response.status_code < 400, None
+        return executar
+
+    def chat_sessao():
+        if 'id' not in sessao:
+            response = cliente.request('POST', '/ia/chat/sessoes', json={'titulo': 'Benchmark'})
+            response.raise_for_status()
+            sessao['id'] = response.json()['sessao']['id']
+        return sessao['id']
+
+    def chat(i):
+        response = cliente.request('POST', f'/ia/chat/sessoes/{chat_sessao()}/mensagens',
+                                   json={'mensagem': PERGUNTAS[i % len(PERGUNTAS)]})
+        return response.status_code < 400, None
+
+    def chat_stream(i):
+        inicio = time.perf_counter()
+        ttfb = None
+        ok = False
+        with cliente.session.post(
+            f'{cliente.base_url}/ia/chat/sessoes/{chat_sessao()}/mensagens/stream',
+            json={'mensagem': PERGUNTAS[i % len(PERGUNTAS)]},
+            timeout=cliente.timeout, stream=True
+        ) as response:
+            if response.status_code >= 400:
+                return False, None
+            for linha in response.iter_lines(decode_unicode=True):
+                if not linha or not linha.startswith('data:'):
+                    continue
+                evento = json.loads(linha[5:])
+                if ttfb is None and evento.get('tipo') == 'token':
+                    ttfb = (time.perf_counter() - inicio) * 1000
+                if evento.get('tipo') in ('fim', 'erro'):
+                    ok = evento['tipo'] == 'fim'
+        return ok, ttfb
+
+    return {
+        'vencimento': simples('POST', '/ia/predicoes/vencimento', lambda i: {'produto_ids': amostra()}),
+        'precos': simples('POST', '/ia/sugestoes/precos', lambda i: {'produto_ids': amostra()}),
+        'estoque': simples('POST', '/ia/analise/estoque', lambda i: {}),
+        'alertas': simples('GET', '/ia/alertas/inteligentes'),
+        'busca': simples('POST', '/ia/busca/produtos', lambda i: {'query': BUSCAS[i % len(BUSCAS)], 'limit': 10}),
+        'chat': chat,
+        'chat_stream': chat_stream,
+    }
+
+def executar_nivel(cenario, concorrencia, requisicoes):
+    """Dispara `requisicoes` chamadas com `concorrencia` threads; retorna as métricas do nível"""
+    latencias = []
+    ttfbs = []
+    erros = 0
+    lock = threading.Lock()
+
+    def uma(i):
+        nonlocal erros
+        inicio = time.perf_counter()
+        try:
+            ok, ttfb = cenario(i)
+        except Exception:
+            ok, ttfb = False, None
+        duracao = (time.perf_counter() - inicio) * 1000
+        with lock:
+            latencias.append(duracao)
+            if ttfb is not None:
+                ttfbs.append(ttfb)
+            if not ok:
+                erros += 1
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        list(executor.map(uma, range(requisicoes)))
+    total = time.perf_counter() - inicio
+
+    lat = np.array(latencias)
+    resultado = {
+        'concorrencia': concorrencia,
+        'requisicoes': requisicoes,
+        'erros': erros,
+        'taxa_erro': round(erros / requisicoes, 4),
+        'vazao_rps': round(requisicoes / total, 2),
+        'p50_ms': round(float(np.percentile(lat, 50)), 1),
+        'p95_ms': round(float(np.percentile(lat, 95)), 1),
+        'p99_ms': round(float(np.percentile(lat, 99)), 1),
+        'max_ms': round(float(lat.max()), 1),
+    }
+    if ttfbs:
+        resultado['ttfb_p50_ms'] = round(float(np.percentile(ttfbs, 50)), 1)
+        resultado['ttfb_p95_ms'] = round(float(np.percentile(ttfbs, 95)), 1)
+    return resultado
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--prefixo', default='/api', help='prefixo do blueprint de IA')
+    parser.add_argument('--token', help='JWT já emitido (dispensa --email/--senha)')
+    parser.add_argument('--email')
+    parser.add_argument('--senha')
+    parser.add_argument('--cenarios', default='vencimento,busca,chat',
+                        help='vencimento, precos, estoque, alertas, busca, chat, chat_stream')
+    parser.add_argument('--concorrencia', default='1,4,16', help='níveis separados por vírgula')
+    parser.add_argument('--requisicoes', type=int, default=100, help='requisições por nível')
+    parser.add_argument('--aquecimento', type=int, default=5, help='requisições descartadas antes de cada cenário')
+    parser.add_argument('--produtos', default='1,2,3,4,5,6,7,8,9,10', help='ids usados nas rotas de produtos')
+    parser.add_argument('--lote', type=int, default=5, help='produtos por requisição')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--json', action='store_true', help='imprime o resultado em JSON')
+    args = parser.parse_args()
+
+    if not args.token and not (args.email and args.senha):
+        parser.error('informe --token ou --email e --senha')
+
+    cliente = Cliente(args.url + args.prefixo, autenticar(args), args.timeout)
+    produto_ids = [int(p) for p in args.produtos.split(',') if p]
+    cenarios = montar_cenarios(cliente, produto_ids, args.lote)
+    niveis = [int(c) for c in args.concorrencia.split(',') if c]
+
+    resultados = {}
+    for nome in args.cenarios.split(','):
+        if nome not in cenarios:
+            parser.error(f'cenário desconhecido: {nome}')
+
+        for i in range(args.aquecimento):
+            try:
+                cenarios[nome](i)
+            except Exception:
+                pass
+
+        resultados[nome] = [executar_nivel(cenarios[nome], c, args.requisicoes) for c in niveis]
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+        return
+
+    for nome, linhas in resultados.items():
+        print(f"\n== {nome} ==")
+        print(f"{'conc':>5} {'req/s':>8} {'erros':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9} {'ttfb p95':>9}")
+        for r in linhas:
+            ttfb = f"{r['ttfb_p95_ms']:>9}" if 'ttfb_p95_ms' in r else f"{'-':>9}"
+            print(f"{r['concorrencia']:>5} {r['vazao_rps']:>8} {r['taxa_erro']:>7.1%} "
+                  f"{r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9} {r['max_ms']:>9} {ttfb}")
+
+if __name__ == '__main__':
+    main()
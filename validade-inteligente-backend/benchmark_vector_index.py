@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Benchmark de recall/latência do índice vetorial aproximado (IVF) contra a busca exata
+
+Uso:
+    python benchmark_vector_index.py                 # dados sintéticos
+    python benchmark_vector_index.py --empresa 3     # índice local de uma empresa
+    python benchmark_vector_index.py --quantizacao   # perda de recall de float16/int8/PCA
+"""
+import argparse
+import tempfile
+
+import numpy as np
+
+from src.services.vector_index import LocalVectorIndex, benchmark_recall, benchmark_quantization, get_vector_index
+
+def gerar_indice_sintetico(n, dim, clusters, base_dir):
+    """Cria um índice com vetores agrupados, parecido com catálogos reais"""
+    rng = np.random.default_rng(42)
+    centros = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vetores = centros[rng.integers(0, clusters, n)] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+
+    index = LocalVectorIndex(0, base_dir=base_dir, dim=dim, dtype='float32', pca_dim=0)
+    index.rebuild(list(range(1, n + 1)), vetores)
+    return index, vetores
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--empresa', type=int, help='usa o índice local desta empresa')
+    parser.add_argument('--vetores', type=int, default=50000)
+    parser.add_argument('--dim', type=int, default=1536)
+    parser.add_argument('--consultas', type=int, default=100)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--listas', type=int, default=None)
+    parser.add_argument('--quantizacao', action='store_true', help='compara formatos quantizados')
+    parser.add_argument('--pca', type=int, default=256, help='dimensão PCA testada com --quantizacao')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+
+    if args.empresa is not None:
+        from src.models.main import app
+        from src.models.ia_vectorization import EmbeddingProduto
+        with app.app_context():
+            index = get_vector_index(args.empresa)
+            ids, base = EmbeddingProduto.load_matrix(empresa_id=args.empresa)
+    else:
+        index, base = gerar_indice_sintetico(args.vetores, args.dim, 200, tempfile.mkdtemp())
+        ids = list(range(1, len(base) + 1))
+
+    # Consultas próximas de vetores existentes, como em buscas de produtos parecidos
+    amostra = base[rng.choice(len(base), args.consultas, replace=False)]
+    consultas = amostra + 0.1 * rng.standard_normal(amostra.shape).astype(np.float32)
+
+    if args.quantizacao:
+        configs = [('float16', 0), ('int8', 0), ('float16', args.pca), ('int8', args.pca)]
+        resultado = benchmark_quantization(ids, base, consultas, k=args.k, configs=configs)
+
+        print(f"Vetores: {resultado['vetores']}  float32: {resultado['float32_bytes_por_vetor']} bytes/vetor")
+        for linha in resultado['indice']:
+            pca = f"pca={linha['pca_dim']}" if linha['pca_dim'] else 'sem pca'
+            print(f"{linha['formato']:>8} {pca:>8}  {linha['bytes_por_vetor']:>5} bytes ({linha['reducao']:.1f}x)  "
+                  f"recall@{args.k}={linha['recall']:.3f}  p50 {linha['p50_ms']:.2f}ms")
+        banco = resultado['banco_bytes_por_linha']
+        print('Banco (bytes/linha): ' + '  '.join(f"{formato}={tamanho:.0f}" for formato, tamanho in banco.items()))
+        return
+
+    resultado = benchmark_recall(index, consultas, k=args.k, n_lists=args.listas)
+
+    print(f"Vetores: {resultado['vetores']}  listas: {resultado['n_lists']}  construção: {resultado['build_s']:.1f}s")
+    print(f"Exato: p50 {resultado['exato_p50_ms']:.2f}ms  p95 {resultado['exato_p95_ms']:.2f}ms")
+    for linha in resultado['ivf']:
+        print(f"nprobe={linha['nprobe']:>3}  recall@{args.k}={linha['recall']:.3f}  "
+              f"p50 {linha['p50_ms']:.2f}ms  p95 {linha['p95_ms']:.2f}ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""Servidor local compatível com a API da OpenAI, para testes de carga sem cota nem rede
+
+Implementa os endpoints usados pelo OpenAIService (embeddings e chat
+completions, com e sem streaming), com latência sorteada de uma
+distribuição configurável, contagem de tokens, respostas JSON
+determinísticas (mesmo prompt → mesma resposta) e injeção de erros.
+
+Uso:
+    python openai_stub_server.py --porta 8089 --latencia-chat lognormal:800:0.5 --taxa-erro 0.02
+
+e no backend:
+    init_openai_service('stub', 'http://localhost:8089/v1')
+"""
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+
+import numpy as np
+from flask import Flask, Response, jsonify, request
+
+app = Flask(__name__)
+
+CONFIG = {
+    'latencia_chat': ('lognormal', 800.0, 0.5),
+    'latencia_embeddings': ('lognormal', 120.0, 0.3),
+    'ms_por_token': 15.0,
+    'tokens_resposta': 150,
+    'dim': 1536,
+    'taxa_erro': 0.0,
+    'taxa_429': 0.0,
+    'taxa_travamento': 0.0,
+    'travamento_ms': 60000.0
+}
+
+_contadores = {'requisicoes': 0, 'erros_injetados': 0}
+_contadores_lock = threading.Lock()
+
+def parse_latencia(spec):
+    """'fixa:300', 'normal:500:100' ou 'lognormal:800:0.5' (mediana em ms e sigma)"""
+    partes = spec.split(':')
+    tipo = partes[0]
+    valores = [float(v) for v in partes[1:]]
+    if tipo == 'fixa' and len(valores) == 1:
+        return (tipo, valores[0], 0.0)
+    if tipo in ('normal', 'lognormal') and len(valores) == 2:
+        return (tipo, valores[0], valores[1])
+    raise argparse.ArgumentTypeError(f'Distribuição de latência inválida: {spec}')
+
+def sortear_latencia_ms(dist):
+    tipo, centro, dispersao = dist
+    if tipo == 'fixa':
+        return centro
+    if tipo == 'normal':
+        return max(0.0, random.gauss(centro, dispersao))
+    return random.lognormvariate(np.log(max(centro, 1.0)), dispersao)
+
+def estimar_tokens(texto):
+    return max(1, len(texto) // 4)
+
+def rng_para(texto):
+    """Gerador determinístico a partir do texto (mesma entrada → mesma saída)"""
+    semente = int.from_bytes(hashlib.sha256(texto.encode('utf-8')).digest()[:8], 'little')
+    return np.random.default_rng(semente)
+
+def erro_injetado():
+    """Sorteia uma falha (500, 429 ou travamento); retorna a resposta de erro ou None"""
+    sorteio = random.random()
+    if sorteio < CONFIG['taxa_travamento']:
+        time.sleep(CONFIG['travamento_ms'] / 1000)
+        sorteio = 1.0  # Depois do travamento responde normalmente (o cliente já deve ter desistido)
+    elif sorteio < CONFIG['taxa_travamento'] + CONFIG['taxa_429']:
+        return _erro(429, 'rate_limit_exceeded', 'Rate limit reached (stub)')
+    elif sorteio < CONFIG['taxa_travamento'] + CONFIG['taxa_429'] + CONFIG['taxa_erro']:
+        return _erro(500, 'server_error', 'Internal server error (stub)')
+    return None
+
+def _erro(status, codigo, mensagem):
+    with _contadores_lock:
+        _contadores['erros_injetados'] += 1
+    return jsonify({'error': {'message': mensagem, 'type': codigo, 'code': codigo}}), status
+
+def _contar():
+    with _contadores_lock:
+        _contadores['requisicoes'] += 1
+
+def embedding_deterministico(texto, dim):
+    vetor = rng_para(texto).standard_normal(dim).astype(np.float32)
+    return (vetor / np.linalg.norm(vetor)).tolist()
+
+def resposta_json(prompt):
+    """Resposta no formato esperado por cada prompt do OpenAIService"""
+    rng = rng_para(prompt)
+    niveis = ['baixo', 'medio', 'alto', 'critico']
+
+    def analise_risco():
+        score = round(float(rng.uniform(0, 1)), 2)
+        return {
+            'risco_nivel': niveis[min(3, int(score * 4))],
+            'risco_score': score,
+            'dias_estimados': int(rng.integers(1, 30)),
+            'recomendacoes': ['Aplicar desconto progressivo', 'Reposicionar na gôndola'][:int(rng.integers(1, 3))],
+            'confianca': round(float(rng.uniform(0.6, 0.95)), 2)
+        }
+
+    if '"produtos"' in prompt:
+        # Prompt em lote: tabela com cabeçalho começando por "id|"
+        ids = []
+        linhas = [linha.strip() for linha in prompt.splitlines()]
+        for i, linha in enumerate(linhas):
+            if linha.startswith('id|'):
+                for dado in linhas[i + 1:]:
+                    celula = dado.split('|', 1)[0]
+                    if not celula.isdigit():
+                        break
+                    ids.append(int(celula))
+                break
+        return {'produtos': [dict(analise_risco(), id=produto_id) for produto_id in ids]}
+
+    if 'preco_sugerido' in prompt:
+        precos = [float(p) for p in re.findall(r'preco_venda[:|]\s*([\d.]+)', prompt)] or [10.0]
+        return {
+            'preco_sugerido': round(precos[0] * float(rng.uniform(0.85, 1.1)), 2),
+            'margem_sugerida': round(float(rng.uniform(10, 40)), 1),
+            'estrategia': ['penetracao', 'skimming', 'competitiva', 'valor'][int(rng.integers(0, 4))],
+            'justificativa': 'Resposta determinística do servidor stub',
+            'impacto_estimado': 'moderado',
+            'confianca': round(float(rng.uniform(0.6, 0.95)), 2),
+            'alertas': []
+        }
+
+    if 'score_otimizacao' in prompt:
+        return {
+            'insights': ['Estoque concentrado em poucas categorias'],
+            'padroes_identificados': ['Vendas maiores no fim de semana'],
+            'recomendacoes': ['Revisar estoque mínimo dos itens de baixo giro'],
+            'score_otimizacao': round(float(rng.uniform(0.4, 0.9)), 2),
+            'areas_melhoria': ['Reposição'],
+            'oportunidades': ['Promoções de itens próximos ao vencimento'],
+            'riscos': ['Perdas por vencimento']
+        }
+
+    return analise_risco()
+
+def texto_resposta(prompt, n_tokens):
+    palavras = ['estoque', 'produto', 'validade', 'vendas', 'recomendo', 'desconto',
+                'categoria', 'reposição', 'giro', 'semana', 'risco', 'margem']
+    rng = rng_para(prompt)
+    return ' '.join(palavras[i] for i in rng.integers(0, len(palavras), n_tokens))
+
+@app.route('/v1/embeddings', methods=['POST'])
+def embeddings():
+    _contar()
+    falha = erro_injetado()
+    if falha is not None:
+        return falha
+
+    data = request.get_json()
+    entradas = data['input'] if isinstance(data['input'], list) else [data['input']]
+    time.sleep(sortear_latencia_ms(CONFIG['latencia_embeddings']) / 1000)
+
+    tokens = sum(estimar_tokens(texto) for texto in entradas)
+    return jsonify({
+        'object': 'list',
+        'model': data.get('model'),
+        'data': [
+            {'object': 'embedding', 'index': i, 'embedding': embedding_deterministico(texto, CONFIG['dim'])}
+            for i, texto in enumerate(entradas)
+        ],
+        'usage': {'prompt_tokens': tokens, 'total_tokens': tokens}
+    })
+
+@app.route('/v1/chat/completions', methods=['POST'])
+def chat_completions():
+    _contar()
+    falha = erro_injetado()
+    if falha is not None:
+        return falha
+
+    data = request.get_json()
+    prompt = '\n'.join(m.get('content') or '' for m in data.get('messages', []))
+    tokens_prompt = estimar_tokens(prompt)
+
+    if (data.get('response_format') or {}).get('type') == 'json_object':
+        conteudo = json.dumps(resposta_json(prompt), ensure_ascii=False)
+        tokens_resposta = estimar_tokens(conteudo)
+    else:
+        tokens_resposta = min(CONFIG['tokens_resposta'], data.get('max_tokens') or CONFIG['tokens_resposta'])
+        conteudo = texto_resposta(prompt, tokens_resposta)
+
+    usage = {
+        'prompt_tokens': tokens_prompt,
+        'completion_tokens': tokens_resposta,
+        'total_tokens': tokens_prompt + tokens_resposta
+    }
+    base = {
+        'id': 'chatcmpl-stub-' + hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:12],
+        'created': int(time.time()),
+        'model': data.get('model')
+    }
+    # Latência até o primeiro token; o restante é proporcional ao tamanho da resposta
+    primeiro_token_ms = sortear_latencia_ms(CONFIG['latencia_chat'])
+
+    if data.get('stream'):
+        incluir_uso = (data.get('stream_options') or {}).get('include_usage')
+
+        def eventos():
+            time.sleep(primeiro_token_ms / 1000)
+            for palavra in conteudo.split(' '):
+                chunk = dict(base, object='chat.completion.chunk', choices=[
+                    {'index': 0, 'delta': {'content': palavra + ' '}, 'finish_reason': None}
+                ])
+                yield f'data: {json.dumps(chunk, ensure_ascii=False)}\n\n'
+                time.sleep(CONFIG['ms_por_token'] / 1000)
+            fim = dict(base, object='chat.completion.chunk', choices=[
+                {'index': 0, 'delta': {}, 'finish_reason': 'stop'}
+            ])
+            yield f'data: {json.dumps(fim)}\n\n'
+            if incluir_uso:
+                yield f"data: {json.dumps(dict(base, object='chat.completion.chunk', choices=[], usage=usage))}\n\n"
+            yield 'data: [DONE]\n\n'
+
+        return Response(eventos(), mimetype='text/event-stream')
+
+    time.sleep((primeiro_token_ms + tokens_resposta * CONFIG['ms_por_token']) / 1000)
+    return jsonify(dict(base, object='chat.completion', usage=usage, choices=[{
+        'index': 0,
+        'message': {'role': 'assistant', 'content': conteudo},
+        'finish_reason': 'stop'
+    }]))
+
+@app.route('/stub/estatisticas', methods=['GET'])
+def estatisticas():
+    with _contadores_lock:
+        return jsonify(dict(_contadores, config={k: v for k, v in CONFIG.items()}))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=8089)
+    parser.add_argument('--latencia-chat', type=parse_latencia, default=CONFIG['latencia_chat'],
+                        help="até o primeiro token: fixa:MS, normal:MEDIA:DESVIO ou lognormal:MEDIANA:SIGMA")
+    parser.add_argument('--latencia-embeddings', type=parse_latencia, default=CONFIG['latencia_embeddings'])
+    parser.add_argument('--ms-por-token', type=float, default=CONFIG['ms_por_token'])
+    parser.add_argument('--tokens-resposta', type=int, default=CONFIG['tokens_resposta'],
+                        help='tokens das respostas em texto livre (chat)')
+    parser.add_argument('--dim', type=int, default=CONFIG['dim'])
+    parser.add_argument('--taxa-erro', type=float, default=0.0, help='fração de respostas 500')
+    parser.add_argument('--taxa-429', type=float, default=0.0, help='fração de respostas 429')
+    parser.add_argument('--taxa-travamento', type=float, default=0.0,
+                        help='fração de requisições que demoram --travamento-ms')
+    parser.add_argument('--travamento-ms', type=float, default=CONFIG['travamento_ms'])
+    parser.add_argument('--semente', type=int, default=None, help='semente das latências e erros sorteados')
+    args = parser.parse_args()
+
+    CONFIG.update({
+        'latencia_chat': args.latencia_chat,
+        'latencia_embeddings': args.latencia_embeddings,
+        'ms_por_token': args.ms_por_token,
+        'tokens_resposta': args.tokens_resposta,
+        'dim': args.dim,
+        'taxa_erro': args.taxa_erro,
+        'taxa_429': args.taxa_429,
+        'taxa_travamento': args.taxa_travamento,
+        'travamento_ms': args.travamento_ms
+    })
+    if args.semente is not None:
+        random.seed(args.semente)
+
+    print(f"Stub da OpenAI em http://{args.host}:{args.porta}/v1")
+    app.run(host=args.host, port=args.porta, threaded=True)
+
+if __name__ == '__main__':
+    main()
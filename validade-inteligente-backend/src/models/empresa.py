@@ -97,6 +97,26 @@ class Empresa(db.Model):
             'lojas': plano.limite_lojas
         }
     
+    def get_risk_prefilter_config(self):
+        """Retorna a configuração do pré-filtro de risco (local x IA) do plano da empresa"""
+        from src.services.risk_prefilter import PREFILTRO_PADRAO
+        
+        subscription = self.get_active_subscription()
+        if not subscription or not subscription.plano:
+            return dict(PREFILTRO_PADRAO)
+        
+        funcionalidades = subscription.plano.funcionalidades or {}
+        return {**PREFILTRO_PADRAO, **(funcionalidades.get('prefiltro_risco') or {})}
+    
+    def get_ai_token_quota(self):
+        """Retorna a cota mensal de tokens de IA do plano (None = sem limite)"""
+        subscription = self.get_active_subscription()
+        if not subscription or not subscription.plano:
+            return None
+        
+        funcionalidades = subscription.plano.funcionalidades or {}
+        return funcionalidades.get('cota_tokens_ia_mes')
+    
     def check_usage_limits(self):
         """Verifica se a empresa está dentro dos limites de uso"""
         limits = self.get_usage_limits()
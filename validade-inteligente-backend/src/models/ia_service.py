@@ -3,8 +3,9 @@ import pandas as pd
 from datetime import datetime, date, timedelta
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import LabelEncoder
-from src.models.produto import HistoricoVenda
+from src.models.produto import Produto, HistoricoVenda
 from src.models.user import db
+from src.services.markdown_optimizer import markdown_optimizer
 
 class IAService:
     """Serviço de Inteligência Artificial para sugestões de ações"""
@@ -43,13 +44,12 @@ class IAService:
                     'justificativa': f'Produto deve escoar naturalmente em {dias_para_escoar:.0f} dias'
                 }
             
-            # Produto precisa de ação
-            if dias_vencimento <= 3:
-                return self._sugestao_urgente(produto, historico)
-            elif dias_vencimento <= 7:
-                return self._sugestao_promocao(produto, historico)
-            else:
-                return self._sugestao_promocao_leve(produto, historico)
+            # Produto precisa de ação: desconto e início escolhidos pelo otimizador de markdown
+            planos = markdown_optimizer.otimizar_produtos([produto])
+            if not planos:
+                return self._sugestao_padrao(produto)
+            
+            return self._sugestao_promocao(produto, planos[0])
                 
         except Exception as e:
             print(f"Erro na IA: {e}")
@@ -106,61 +106,55 @@ class IAService:
                 'justificativa': 'Produto sem histórico, monitorar comportamento de vendas'
             }
     
-    def _sugestao_urgente(self, produto, historico):
-        """Sugestão para produtos com vencimento urgente"""
-        return {
-            'acao_recomendada': 'promocao_urgente',
-            'confianca': 0.9,
-            'desconto_sugerido': 40,
-            'preco_promocional': produto.preco_venda * 0.6,
-            'probabilidade_venda': 0.8,
-            'receita_estimada': produto.quantidade * produto.preco_venda * 0.6 * 0.8,
-            'economia_vs_perda': produto.quantidade * produto.preco_venda * 0.6 * 0.8,
-            'justificativa': 'Produto vence em até 3 dias, desconto agressivo necessário',
-            'acoes_alternativas': [
+    def _sugestao_promocao(self, produto, plano):
+        """Sugestão de promoção a partir do plano de markdown otimizado"""
+        dias = produto.dias_para_vencer
+        desconto = plano['desconto_percentual']
+        
+        if desconto == 0:
+            sugestao = {
+                'acao_recomendada': 'monitorar',
+                'confianca': 0.7,
+                'desperdicio_esperado': plano['desperdicio_esperado'],
+                'justificativa': 'Nenhum desconto aumenta o resultado esperado: a demanda responde pouco ao preço'
+            }
+        else:
+            if dias <= 3:
+                acao = 'promocao_urgente'
+            elif desconto >= 15:
+                acao = 'promocao'
+            else:
+                acao = 'promocao_leve'
+            
+            inicio = 'a partir de hoje' if plano['inicio_em_dias'] == 0 else f"em {plano['inicio_em_dias']} dias"
+            sugestao = {
+                'acao_recomendada': acao,
+                'confianca': 0.85,
+                'desconto_sugerido': desconto,
+                'preco_promocional': plano['preco_promocional'],
+                'inicio_em_dias': plano['inicio_em_dias'],
+                'probabilidade_venda': round(plano['vendas_esperadas'] / produto.quantidade, 2),
+                'receita_estimada': plano['receita_esperada'],
+                'economia_vs_perda': plano['ganho_vs_sem_desconto'],
+                'desperdicio_esperado': plano['desperdicio_esperado'],
+                'elasticidade': plano['elasticidade'],
+                'justificativa': (
+                    f"Desconto de {desconto:.0f}% {inicio} maximiza receita menos perdas: "
+                    f"{plano['desperdicio_esperado']:.0f} unidades devem vencer, contra "
+                    f"{plano['desperdicio_sem_desconto']:.0f} sem desconto"
+                )
+            }
+        
+        if dias <= 3 and plano['desperdicio_esperado'] > 0:
+            sugestao['acoes_alternativas'] = [
                 {
                     'tipo': 'doacao',
                     'instituicao': 'Banco de Alimentos',
-                    'beneficio_fiscal': produto.preco_custo * produto.quantidade if produto.preco_custo else 0
+                    'beneficio_fiscal': produto.preco_custo * plano['desperdicio_esperado'] if produto.preco_custo else 0
                 }
             ]
-        }
-    
-    def _sugestao_promocao(self, produto, historico):
-        """Sugestão de promoção moderada"""
-        vendas_media = self._calcular_vendas_media_diaria(historico)
-        
-        # Calcular desconto baseado na urgência e histórico
-        desconto_base = 20
-        if vendas_media < 1:
-            desconto_base = 25
         
-        preco_promocional = produto.preco_venda * (1 - desconto_base / 100)
-        probabilidade_venda = min(0.9, 0.5 + (desconto_base / 100))
-        
-        return {
-            'acao_recomendada': 'promocao',
-            'confianca': 0.85,
-            'desconto_sugerido': desconto_base,
-            'preco_promocional': preco_promocional,
-            'probabilidade_venda': probabilidade_venda,
-            'receita_estimada': produto.quantidade * preco_promocional * probabilidade_venda,
-            'economia_vs_perda': produto.quantidade * preco_promocional * probabilidade_venda,
-            'justificativa': f'Baseado no histórico de vendas, desconto de {desconto_base}% deve acelerar as vendas'
-        }
-    
-    def _sugestao_promocao_leve(self, produto, historico):
-        """Sugestão de promoção leve"""
-        return {
-            'acao_recomendada': 'promocao_leve',
-            'confianca': 0.75,
-            'desconto_sugerido': 10,
-            'preco_promocional': produto.preco_venda * 0.9,
-            'probabilidade_venda': 0.7,
-            'receita_estimada': produto.quantidade * produto.preco_venda * 0.9 * 0.7,
-            'economia_vs_perda': produto.quantidade * produto.preco_venda * 0.9 * 0.7,
-            'justificativa': 'Promoção preventiva para acelerar vendas antes do vencimento'
-        }
+        return sugestao
     
     def _sugestao_padrao(self, produto):
         """Sugestão padrão em caso de erro"""
@@ -246,30 +240,23 @@ class IAService:
             return None
     
     def calcular_preco_otimo(self, produto):
-        """Calcula preço ótimo baseado em elasticidade"""
+        """Calcula preço ótimo com elasticidade ajustada no histórico de vendas"""
         try:
-            # Simulação simples de elasticidade
-            dias = produto.dias_para_vencer
-            preco_base = produto.preco_venda
-            
-            if dias <= 3:
-                fator_desconto = 0.6  # 40% desconto
-            elif dias <= 7:
-                fator_desconto = 0.8  # 20% desconto
-            elif dias <= 15:
-                fator_desconto = 0.9  # 10% desconto
-            else:
-                fator_desconto = 1.0  # Sem desconto
-            
-            preco_otimo = preco_base * fator_desconto
+            planos = markdown_optimizer.otimizar_produtos([produto])
+            if not planos:
+                return None
             
+            plano = planos[0]
             return {
-                'preco_otimo': preco_otimo,
-                'desconto_percentual': (1 - fator_desconto) * 100,
-                'receita_estimada': produto.quantidade * preco_otimo * 0.8  # 80% probabilidade venda
+                'preco_otimo': plano['preco_promocional'],
+                'desconto_percentual': plano['desconto_percentual'],
+                'inicio_em_dias': plano['inicio_em_dias'],
+                'receita_estimada': plano['receita_esperada'],
+                'desperdicio_esperado': plano['desperdicio_esperado'],
+                'elasticidade': plano['elasticidade']
             }
             
         except Exception as e:
             print(f"Erro no cálculo de preço ótimo: {e}")
             return None
-
+    
@@ -1,9 +1,12 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, DECIMAL, ForeignKey, Index
+from sqlalchemy import Column, Integer, BigInteger, String, Date, DateTime, Text, Boolean, DECIMAL, LargeBinary
+from sqlalchemy import ForeignKey, Index, UniqueConstraint
+from sqlalchemy import event, insert, select, update, text, and_
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from src.models.user import db
 import numpy as np
+import os
 
 # Importar extensão vector do PostgreSQL
 try:
@@ -20,9 +23,13 @@ class EmbeddingProduto(db.Model):
     
     id = Column(Integer, primary_key=True)
     produto_id = Column(Integer, ForeignKey('produtos.id', ondelete='CASCADE'), nullable=False)
-    embedding = Column(Vector(1536) if VECTOR_AVAILABLE else Text, nullable=False)
+    embedding = Column(Vector(1536) if VECTOR_AVAILABLE else Text, nullable=not VECTOR_AVAILABLE)
+    # Sem pgvector: vetor empacotado (float16/int8) em vez do JSON, conforme EMBEDDING_STORAGE_FORMAT
+    embedding_binario = Column(LargeBinary)
+    formato_embedding = Column(String(10), default='json')
     metadados = Column(JSONB, default={})
     versao_modelo = Column(String(50), default='text-embedding-ada-002')
+    hash_conteudo = Column(String(64))  # SHA-256 do texto embedado + modelo
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
@@ -33,6 +40,7 @@ class EmbeddingProduto(db.Model):
     __table_args__ = (
         Index('idx_embeddings_produto_id', 'produto_id'),
         Index('idx_embeddings_versao_modelo', 'versao_modelo'),
+        Index('idx_embeddings_hash_conteudo', 'hash_conteudo'),
     )
     
     def __repr__(self):
@@ -44,6 +52,8 @@ class EmbeddingProduto(db.Model):
             'produto_id': self.produto_id,
             'metadados': self.metadados,
             'versao_modelo': self.versao_modelo,
+            'hash_conteudo': self.hash_conteudo,
+            'formato_embedding': self.formato_embedding,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
@@ -52,6 +62,10 @@ class EmbeddingProduto(db.Model):
         """Retorna embedding como array numpy"""
         if VECTOR_AVAILABLE:
             return np.array(self.embedding)
+        elif self.embedding_binario is not None:
+            # Fallback binário: desquantizado só quando lido
+            from src.services.embedding_quantization import decode_vectors
+            return decode_vectors([self.embedding_binario], self.formato_embedding, 1536)[0]
         else:
             # Fallback: assumir que está armazenado como JSON string
             import json
@@ -61,22 +75,112 @@ class EmbeddingProduto(db.Model):
         """Define embedding a partir de array numpy"""
         if VECTOR_AVAILABLE:
             self.embedding = embedding_array.tolist()
-        else:
+            return
+        
+        from src.services.embedding_quantization import STORAGE_FORMAT, encode_vector
+        if STORAGE_FORMAT == 'json':
             # Fallback: armazenar como JSON string
             import json
             self.embedding = json.dumps(embedding_array.tolist())
+            self.embedding_binario = None
+        else:
+            self.embedding = None
+            self.embedding_binario = encode_vector(embedding_array, STORAGE_FORMAT)
+        self.formato_embedding = STORAGE_FORMAT
+    
+    @classmethod
+    def find_by_content_hashes(cls, hashes, versao_modelo):
+        """Retorna {hash_conteudo: embedding} para hashes já calculados (qualquer produto/empresa)"""
+        if not hashes:
+            return {}
+        
+        found = {}
+        for embedding in cls.query.filter(
+            cls.hash_conteudo.in_(list(hashes)),
+            cls.versao_modelo == versao_modelo
+        ).all():
+            found.setdefault(embedding.hash_conteudo, embedding)
+        return found
+    
+    @classmethod
+    def load_matrix(cls, empresa_id=None, produto_ids=None):
+        """Carrega (produto_ids, matriz float32) decodificando os embeddings em bloco"""
+        from src.models.produto import Produto
+        
+        query = db.session.query(cls.produto_id, cls.embedding, cls.embedding_binario, cls.formato_embedding)
+        if empresa_id is not None:
+            query = query.join(Produto, Produto.id == cls.produto_id).filter(Produto.empresa_id == empresa_id)
+        if produto_ids is not None:
+            query = query.filter(cls.produto_id.in_(produto_ids))
+        
+        rows = query.all()
+        ids = [row[0] for row in rows]
+        
+        if not rows:
+            return ids, np.empty((0, 1536), dtype=np.float32)
+        
+        if VECTOR_AVAILABLE:
+            matrix = np.asarray([row[1] for row in rows], dtype=np.float32)
+        else:
+            import json
+            from src.services.embedding_quantization import decode_vectors
+            
+            # Agrupa por formato: um json.loads ou um frombuffer para cada grupo
+            matrix = np.empty((len(rows), 1536), dtype=np.float32)
+            por_formato = {}
+            for i, row in enumerate(rows):
+                formato = row[3] if row[2] is not None else 'json'
+                por_formato.setdefault(formato, []).append(i)
+            
+            for formato, posicoes in por_formato.items():
+                if formato == 'json':
+                    matrix[posicoes] = json.loads('[' + ','.join(rows[i][1] for i in posicoes) + ']')
+                else:
+                    matrix[posicoes] = decode_vectors([rows[i][2] for i in posicoes], formato, 1536)
+        
+        return ids, matrix
     
     @classmethod
-    def find_similar(cls, embedding_vector, limit=10, threshold=0.8):
-        """Encontra embeddings similares usando similaridade de cosseno"""
+    def find_similar(cls, embedding_vector, limit=10, threshold=0.8, empresa_id=None):
+        """Encontra embeddings similares usando similaridade de cosseno
+        
+        Retorna lista de (EmbeddingProduto, similaridade). Sem pgvector, usa o
+        índice vetorial local da empresa.
+        """
         if not VECTOR_AVAILABLE:
-            # Implementação fallback sem pgvector
-            return cls.query.limit(limit).all()
+            if empresa_id is None:
+                return []
+            
+            from src.services.vector_index import search_vector_index
+            matches = search_vector_index(empresa_id, embedding_vector, k=limit)
+            if not matches:
+                return []
+            
+            embeddings = {
+                e.produto_id: e for e in cls.query.filter(
+                    cls.produto_id.in_([produto_id for produto_id, _ in matches])
+                ).all()
+            }
+            return [
+                (embeddings[produto_id], score) for produto_id, score in matches
+                if produto_id in embeddings
+            ]
+        
+        # Listas do IVFFlat sondadas por consulta (mais listas = mais recall, mais latência)
+        db.session.execute(
+            text('SET LOCAL ivfflat.probes = :probes'),
+            {'probes': int(os.getenv('VECTOR_INDEX_NPROBE', '8'))}
+        )
         
         # Query com pgvector para similaridade de cosseno
-        return cls.query.order_by(
-            cls.embedding.cosine_distance(embedding_vector)
-        ).limit(limit).all()
+        distance = cls.embedding.cosine_distance(embedding_vector)
+        query = db.session.query(cls, (1 - distance).label('similaridade'))
+        
+        if empresa_id is not None:
+            from src.models.produto import Produto
+            query = query.join(Produto, Produto.id == cls.produto_id).filter(Produto.empresa_id == empresa_id)
+        
+        return [(embedding, float(score)) for embedding, score in query.order_by(distance).limit(limit).all()]
 
 class PredicaoIA(db.Model):
     """Tabela para armazenar predições da IA"""
@@ -108,6 +212,31 @@ class PredicaoIA(db.Model):
     def __repr__(self):
         return f'<PredicaoIA {self.tipo_predicao} - {self.produto_id}>'
     
+    @classmethod
+    def recentes_por_produto(cls, produto_ids, tipo_predicao, desde):
+        """Predição mais recente de cada produto criada a partir de `desde` (uma consulta com janela)"""
+        if not produto_ids:
+            return {}
+        
+        ordem = func.row_number().over(
+            partition_by=cls.produto_id, order_by=cls.created_at.desc()
+        ).label('ordem')
+        recentes = db.session.query(cls.id.label('id'), ordem).filter(
+            cls.produto_id.in_(produto_ids),
+            cls.tipo_predicao == tipo_predicao,
+            cls.created_at >= desde
+        ).subquery()
+        
+        predicoes = cls.query.join(recentes, cls.id == recentes.c.id).filter(recentes.c.ordem == 1).all()
+        return {predicao.produto_id: predicao for predicao in predicoes}
+    
+    @classmethod
+    def inserir_em_lote(cls, registros):
+        """Insere várias predições em um único INSERT em lote (sem commit)"""
+        if registros:
+            db.session.execute(insert(cls), registros)
+        return len(registros)
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -157,13 +286,17 @@ class SessaoChat(db.Model):
     titulo = Column(String(200))
     contexto = Column(JSONB, default={})
     ativa = Column(Boolean, default=True)
+    total_mensagens = Column(Integer, nullable=False, default=0)  # Contador mantido pelos hooks de MensagemChat
+    resumo_historico = Column(Text)  # Resumo das mensagens antigas, fora da janela do prompt
+    resumo_ate_id = Column(Integer)  # Última mensagem incluída no resumo
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
     # Relacionamentos
     empresa = relationship("Empresa")
     usuario = relationship("Usuario")
-    mensagens = relationship("MensagemChat", back_populates="sessao", cascade="all, delete-orphan")
+    mensagens = relationship("MensagemChat", back_populates="sessao", cascade="all, delete-orphan",
+                             lazy='dynamic', passive_deletes=True)
     
     def __repr__(self):
         return f'<SessaoChat {self.id} - {self.titulo}>'
@@ -176,14 +309,32 @@ class SessaoChat(db.Model):
             'titulo': self.titulo,
             'contexto': self.contexto,
             'ativa': self.ativa,
-            'total_mensagens': len(self.mensagens),
+            'total_mensagens': self.total_mensagens or 0,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
     
     def get_last_messages(self, limit=10):
-        """Retorna últimas mensagens da sessão"""
-        return sorted(self.mensagens, key=lambda x: x.created_at, reverse=True)[:limit]
+        """Retorna últimas mensagens da sessão (ORDER BY created_at DESC LIMIT no banco)"""
+        return self.mensagens.order_by(
+            MensagemChat.created_at.desc(), MensagemChat.id.desc()
+        ).limit(limit).all()
+    
+    def get_messages_between(self, after_id, before_id, limit=50):
+        """Mensagens com id no intervalo (after_id, before_id), da mais antiga para a mais nova"""
+        query = self.mensagens.filter(MensagemChat.id < before_id)
+        if after_id:
+            query = query.filter(MensagemChat.id > after_id)
+        return query.order_by(MensagemChat.id.asc()).limit(limit).all()
+    
+    @classmethod
+    def recalcular_total_mensagens(cls):
+        """Recalcula o contador de mensagens de todas as sessões (ex.: após migração)"""
+        total = select(func.count(MensagemChat.id)).where(
+            MensagemChat.sessao_id == cls.id
+        ).scalar_subquery()
+        db.session.execute(update(cls).values(total_mensagens=total))
+        db.session.commit()
 
 class MensagemChat(db.Model):
     """Tabela para armazenar mensagens do chat com IA"""
@@ -216,6 +367,23 @@ class MensagemChat(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+@event.listens_for(MensagemChat, 'after_insert')
+def _incrementar_total_mensagens(mapper, connection, target):
+    """Mantém SessaoChat.total_mensagens sem carregar as mensagens"""
+    connection.execute(
+        update(SessaoChat.__table__)
+        .where(SessaoChat.__table__.c.id == target.sessao_id)
+        .values(total_mensagens=SessaoChat.__table__.c.total_mensagens + 1)
+    )
+
+@event.listens_for(MensagemChat, 'after_delete')
+def _decrementar_total_mensagens(mapper, connection, target):
+    connection.execute(
+        update(SessaoChat.__table__)
+        .where(SessaoChat.__table__.c.id == target.sessao_id)
+        .values(total_mensagens=SessaoChat.__table__.c.total_mensagens - 1)
+    )
+
 class AnaliseTexto(db.Model):
     """Tabela para armazenar análises de texto com IA"""
     __tablename__ = 'analises_texto'
@@ -330,6 +498,181 @@ class RecomendacaoIA(db.Model):
         }
         return priority_scores.get(self.prioridade, 2)
 
+class UsoIADiario(db.Model):
+    """Consolidação diária do uso da IA por empresa, tipo de chamada e modelo"""
+    __tablename__ = 'uso_ia_diario'
+    
+    id = Column(Integer, primary_key=True)
+    empresa_id = Column(Integer, ForeignKey('empresas.id'))
+    data = Column(Date, nullable=False)
+    tipo_chamada = Column(String(50), nullable=False)  # 'expiry_risk', 'pricing', 'chat', 'embedding', etc.
+    modelo = Column(String(100), nullable=False)
+    chamadas = Column(Integer, default=0)
+    erros = Column(Integer, default=0)
+    cache_hits = Column(Integer, default=0)
+    tokens_prompt = Column(BigInteger, default=0)
+    tokens_completion = Column(BigInteger, default=0)
+    latencia_total_ms = Column(BigInteger, default=0)
+    latencia_histograma = Column(JSONB, default=list)  # contagens por faixa de latência
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    
+    # Índices
+    __table_args__ = (
+        UniqueConstraint('empresa_id', 'data', 'tipo_chamada', 'modelo', name='uq_uso_ia_diario'),
+        Index('idx_uso_ia_empresa_data', 'empresa_id', 'data'),
+    )
+    
+    CONTADORES = ('chamadas', 'erros', 'cache_hits', 'tokens_prompt', 'tokens_completion', 'latencia_total_ms')
+    
+    def __repr__(self):
+        return f'<UsoIADiario {self.empresa_id} {self.data} {self.tipo_chamada}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'empresa_id': self.empresa_id,
+            'data': self.data.isoformat() if self.data else None,
+            'tipo_chamada': self.tipo_chamada,
+            'modelo': self.modelo,
+            'chamadas': self.chamadas,
+            'erros': self.erros,
+            'cache_hits': self.cache_hits,
+            'tokens_prompt': self.tokens_prompt,
+            'tokens_completion': self.tokens_completion,
+            'latencia_total_ms': self.latencia_total_ms,
+            'latencia_histograma': self.latencia_histograma
+        }
+    
+    @classmethod
+    def registrar_lote(cls, agregados):
+        """Soma contadores em memória às linhas diárias, de forma atômica entre processos
+        
+        `agregados` é {(empresa_id, data, tipo_chamada, modelo): {contador: valor, 'latencia_histograma': [...]}}.
+        Cada chave é um UPDATE col = col + :delta; sem linha, um INSERT (num
+        savepoint, que volta ao UPDATE se outro processo inseriu antes). O
+        UPDATE trava a linha até o commit, então o histograma é somado em
+        seguida sem perder incrementos. As chaves vão em ordem fixa para que
+        dois processos não travem linhas em ordem inversa.
+        """
+        if not agregados:
+            return 0
+        
+        from sqlalchemy.exc import IntegrityError
+        
+        chaves = sorted(agregados, key=lambda c: (c[0] is None, c[0] or 0, c[1], c[2], c[3]))
+        for chave in chaves:
+            valores = agregados[chave]
+            empresa_id, data, tipo_chamada, modelo = chave
+            filtro = and_(
+                cls.empresa_id.is_(None) if empresa_id is None else cls.empresa_id == empresa_id,
+                cls.data == data,
+                cls.tipo_chamada == tipo_chamada,
+                cls.modelo == modelo
+            )
+            incrementos = {
+                contador: func.coalesce(getattr(cls, contador), 0) + valores.get(contador, 0)
+                for contador in cls.CONTADORES
+            }
+            novos = valores.get('latencia_histograma', [])
+            
+            if db.session.execute(update(cls).where(filtro).values(**incrementos)).rowcount:
+                cls._somar_histograma(filtro, novos)
+                continue
+            
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(insert(cls).values(
+                        empresa_id=empresa_id, data=data, tipo_chamada=tipo_chamada, modelo=modelo,
+                        latencia_histograma=list(novos),
+                        **{contador: valores.get(contador, 0) for contador in cls.CONTADORES}
+                    ))
+            except IntegrityError:
+                # Outro processo criou a linha do dia entre o UPDATE e o INSERT
+                db.session.execute(update(cls).where(filtro).values(**incrementos))
+                cls._somar_histograma(filtro, novos)
+        
+        db.session.commit()
+        return len(agregados)
+    
+    @classmethod
+    def _somar_histograma(cls, filtro, novos):
+        """Soma o histograma de latência às linhas já travadas pelo UPDATE dos contadores"""
+        if not any(novos):
+            return
+        for uso_id, histograma in db.session.execute(select(cls.id, cls.latencia_histograma).where(filtro)).all():
+            histograma = list(histograma or [])
+            tamanho = max(len(histograma), len(novos))
+            histograma += [0] * (tamanho - len(histograma))
+            somado = [a + b for a, b in zip(histograma, list(novos) + [0] * (tamanho - len(novos)))]
+            db.session.execute(update(cls).where(cls.id == uso_id).values(latencia_histograma=somado))
+
+class GrupoDuplicados(db.Model):
+    """Grupo de produtos candidatos a duplicados, aguardando revisão"""
+    __tablename__ = 'grupos_duplicados'
+
+    id = Column(Integer, primary_key=True)
+    empresa_id = Column(Integer, ForeignKey('empresas.id'), nullable=False)
+    assinatura = Column(String(64), nullable=False)  # SHA-256 dos produto_ids ordenados
+    produto_ids = Column(JSONB, nullable=False)
+    pares = Column(JSONB, default=list)  # [[produto_a, produto_b, similaridade], ...]
+    criterios = Column(JSONB, default=list)  # blocagens que geraram os pares: 'categoria', 'prefixo_codigo'
+    similaridade_min = Column(DECIMAL(5, 4))
+    similaridade_media = Column(DECIMAL(5, 4))
+    status = Column(String(20), default='pendente')  # 'pendente', 'confirmado', 'descartado'
+    produto_principal_id = Column(Integer, ForeignKey('produtos.id', ondelete='SET NULL'))
+    revisado_por = Column(Integer)
+    revisado_em = Column(DateTime)
+    created_at = Column(DateTime, default=func.now())
+
+    # Relacionamentos
+    empresa = relationship("Empresa")
+
+    # Índices
+    __table_args__ = (
+        UniqueConstraint('empresa_id', 'assinatura', name='uq_grupos_duplicados_assinatura'),
+        Index('idx_grupos_duplicados_empresa_status', 'empresa_id', 'status'),
+    )
+
+    STATUS_REVISAO = ('confirmado', 'descartado')
+
+    def __repr__(self):
+        return f'<GrupoDuplicados {self.empresa_id} {self.produto_ids}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'empresa_id': self.empresa_id,
+            'produto_ids': self.produto_ids,
+            'pares': self.pares,
+            'criterios': self.criterios,
+            'similaridade_min': float(self.similaridade_min) if self.similaridade_min is not None else None,
+            'similaridade_media': float(self.similaridade_media) if self.similaridade_media is not None else None,
+            'status': self.status,
+            'produto_principal_id': self.produto_principal_id,
+            'revisado_por': self.revisado_por,
+            'revisado_em': self.revisado_em.isoformat() if self.revisado_em else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+    @staticmethod
+    def calcular_assinatura(produto_ids):
+        """Identifica o grupo pelo conjunto de produtos (independe da ordem)"""
+        import hashlib
+        chave = ','.join(str(produto_id) for produto_id in sorted(produto_ids))
+        return hashlib.sha256(chave.encode('utf-8')).hexdigest()
+
+    def revisar(self, status, usuario_id=None, produto_principal_id=None):
+        """Registra a decisão da revisão (confirmado ou descartado)"""
+        from datetime import datetime
+        if status not in self.STATUS_REVISAO:
+            raise ValueError(f'Status de revisão inválido: {status}')
+        if produto_principal_id is not None and produto_principal_id not in self.produto_ids:
+            raise ValueError('Produto principal não pertence ao grupo')
+        self.status = status
+        self.produto_principal_id = produto_principal_id
+        self.revisado_por = usuario_id
+        self.revisado_em = datetime.now()
+
 # Função para inicializar extensões do PostgreSQL
 def init_vector_extension():
     """Inicializa extensão pgvector no PostgreSQL"""
@@ -344,22 +687,69 @@ def init_vector_extension():
     except Exception as e:
         print(f"Erro ao inicializar extensão pgvector: {str(e)}")
 
+IVF_INDEX_NAME = 'idx_embeddings_produtos_vector'
+
+# Diferença relativa de `lists` a partir da qual o índice IVFFlat é reconstruído
+# (evita reconstruir toda noite só porque a contagem cruzou um milhar)
+IVF_LISTS_TOLERANCIA = 0.2
+
 # Função para criar índices de performance
-def create_vector_indexes():
-    """Cria índices otimizados para busca vetorial"""
+def create_vector_indexes(lists=None):
+    """Cria (ou reconstrói, se `lists` mudou) o índice IVFFlat dos embeddings
+    
+    `CREATE INDEX IF NOT EXISTS` nunca altera um índice existente, então o
+    `lists` atual é lido de pg_class.reloptions. Quando difere do desejado, um
+    índice novo é criado CONCURRENTLY com outro nome e troca de lugar com o
+    antigo, sem janela sem índice. Retorna o `lists` em uso (None sem pgvector).
+    """
     try:
-        if VECTOR_AVAILABLE:
-            # Criar índice IVFFlat para busca aproximada
-            db.session.execute("""
-                CREATE INDEX IF NOT EXISTS idx_embeddings_produtos_vector 
+        if not VECTOR_AVAILABLE:
+            return None
+        
+        # Número de listas proporcional ao volume (linhas/1000 até 1M, raiz acima disso)
+        if lists is None:
+            total = EmbeddingProduto.query.count()
+            lists = max(100, total // 1000 if total <= 1000000 else int(np.sqrt(total)))
+        lists = int(lists)
+        
+        # CONCURRENTLY não roda dentro de transação
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            atual = _ivf_lists_atual(conn, IVF_INDEX_NAME)
+            if atual is not None and abs(atual - lists) <= IVF_LISTS_TOLERANCIA * atual:
+                return atual
+            
+            novo = IVF_INDEX_NAME + '_novo'
+            # Sobra de uma construção interrompida fica INVALID: descarta
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {novo}"))
+            conn.execute(text(f"""
+                CREATE INDEX CONCURRENTLY {novo}
                 ON embeddings_produtos 
                 USING ivfflat (embedding vector_cosine_ops) 
-                WITH (lists = 100);
-            """)
-            db.session.commit()
-            print("Índices vetoriais criados com sucesso")
+                WITH (lists = {lists})
+            """))
+            if atual is not None:
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {IVF_INDEX_NAME}"))
+            conn.execute(text(f"ALTER INDEX {novo} RENAME TO {IVF_INDEX_NAME}"))
+        
+        print(f"Índice vetorial criado com lists={lists} (anterior: {atual})")
+        return lists
     except Exception as e:
         print(f"Erro ao criar índices vetoriais: {str(e)}")
+        return None
+
+def _ivf_lists_atual(conn, nome_indice):
+    """`lists` do índice existente (None se ele não existe)"""
+    reloptions = conn.execute(
+        text("SELECT reloptions FROM pg_class WHERE relname = :nome AND relkind = 'i'"),
+        {'nome': nome_indice}
+    ).first()
+    if reloptions is None:
+        return None
+    for opcao in reloptions[0] or []:
+        chave, _, valor = opcao.partition('=')
+        if chave == 'lists':
+            return int(valor)
+    return 100  # padrão do ivfflat quando o índice foi criado sem WITH
 
 # Adicionar relacionamentos aos modelos existentes
 def add_ai_relationships():
@@ -57,11 +57,15 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
 
 # Importar todos os modelos para criar as tabelas
-from src.models.produto import Produto, Alerta, HistoricoVenda, Gamificacao, Medalha, Meta
+from src.models.produto import Produto, Alerta, DigestAlerta, HistoricoVenda, PrevisaoPerda, Gamificacao, Medalha, Meta
 
 with app.app_context():
     db.create_all()
 
+    # Extensão pg_trgm e índices GIN da busca de produtos (no-op fora do PostgreSQL)
+    from src.services.product_search import create_search_indexes
+    create_search_indexes()
+
 # Endpoint de health check
 @app.route('/api/health')
 def health_check():
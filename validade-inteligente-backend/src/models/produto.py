@@ -1,6 +1,14 @@
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
+from sqlalchemy import case, or_, func
 from src.models.user import db
 
+# Janela (em dias) em que um produto passa a ser considerado próximo do vencimento
+DIAS_PROXIMO_VENCIMENTO = 7
+
+# Candidatos por consulta IN no registro de alertas em lote (abaixo do limite de
+# 999 parâmetros das versões antigas do SQLite)
+LOTE_ALERTAS = 500
+
 class Produto(db.Model):
     __tablename__ = 'produtos'
     
@@ -15,10 +23,15 @@ class Produto(db.Model):
     preco_custo = db.Column(db.Float, nullable=True)
     preco_venda = db.Column(db.Float, nullable=False)
     fornecedor = db.Column(db.String(200), nullable=True)
-    status = db.Column(db.String(50), default='normal')  # normal, proximo_vencimento, vencido
+    status = db.Column(db.String(50), default='normal', index=True)  # normal, proximo_vencimento, vencido
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Índices para performance
+    __table_args__ = (
+        db.Index('idx_produtos_user_status', 'user_id', 'status'),
+    )
+    
     # Relacionamentos
     user = db.relationship('User', backref=db.backref('produtos', lazy=True))
     alertas = db.relationship('Alerta', backref='produto', lazy=True, cascade='all, delete-orphan')
@@ -42,11 +55,33 @@ class Produto(db.Model):
         
         if dias < 0:
             self.status = 'vencido'
-        elif dias <= 7:
+        elif dias <= DIAS_PROXIMO_VENCIMENTO:
             self.status = 'proximo_vencimento'
         else:
             self.status = 'normal'
     
+    @classmethod
+    def atualizar_status_em_lote(cls, user_id=None):
+        """Recalcula o status de todos os produtos com um único UPDATE ... SET status = CASE.
+        
+        Usado pelo job noturno e após importações em massa; só reescreve as
+        linhas cujo status mudou. Retorna a quantidade de produtos atualizados.
+        """
+        hoje = date.today()
+        novo_status = case(
+            (cls.data_validade < hoje, 'vencido'),
+            (cls.data_validade <= hoje + timedelta(days=DIAS_PROXIMO_VENCIMENTO), 'proximo_vencimento'),
+            else_='normal'
+        )
+        
+        query = cls.query.filter(or_(cls.status.is_(None), cls.status != novo_status))
+        if user_id is not None:
+            query = query.filter(cls.user_id == user_id)
+        
+        atualizados = query.update({cls.status: novo_status}, synchronize_session=False)
+        db.session.commit()
+        return atualizados
+    
     def to_dict(self):
         """Converte o produto para dicionário"""
         return {
@@ -82,11 +117,117 @@ class Alerta(db.Model):
     acao_tomada = db.Column(db.String(100), nullable=True)
     detalhes_resolucao = db.Column(db.JSON, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow)  # marca d'água dos digests
     resolved_at = db.Column(db.DateTime, nullable=True)
     
+    # Índices para performance
+    __table_args__ = (
+        db.Index('idx_alertas_produto_tipo_status', 'produto_id', 'tipo', 'status'),
+        db.Index('idx_alertas_user_atualizado', 'user_id', 'atualizado_em'),
+    )
+    
     # Relacionamentos
     user = db.relationship('User', backref=db.backref('alertas', lazy=True))
     
+    # Campos que são atualizados quando já existe alerta ativo para o produto
+    CAMPOS_ATUALIZAVEIS = ('urgencia', 'titulo', 'descricao', 'quantidade_afetada', 'valor_estimado_perda')
+    
+    @staticmethod
+    def dados_alerta_vencimento(produto):
+        """Monta os dados de um alerta de vencimento para o produto"""
+        dias = produto.dias_para_vencer
+        
+        if dias < 0:
+            urgencia = 'alta'
+            titulo = f'Produto vencido há {abs(dias)} dias'
+        elif dias <= 3:
+            urgencia = 'alta'
+            titulo = f'Produto vence em {dias} dias'
+        elif dias <= DIAS_PROXIMO_VENCIMENTO:
+            urgencia = 'media'
+            titulo = f'Produto vence em {dias} dias'
+        else:
+            urgencia = 'baixa'
+            titulo = f'Produto vence em {dias} dias'
+        
+        return {
+            'produto_id': produto.id,
+            'user_id': produto.user_id,
+            'tipo': 'vencimento',
+            'urgencia': urgencia,
+            'titulo': titulo,
+            'descricao': f'{produto.quantidade} unidades do produto {produto.nome} vencem em {dias} dias',
+            'quantidade_afetada': produto.quantidade,
+            'valor_estimado_perda': produto.quantidade * produto.preco_venda
+        }
+    
+    @classmethod
+    def registrar_em_lote(cls, candidatos):
+        """Insere ou atualiza alertas ativos em uma única transação.
+        
+        `candidatos` pode ser qualquer iterável (inclusive um gerador); ele é
+        processado em fatias de LOTE_ALERTAS, cada uma com uma consulta IN por
+        (produto_id, tipo), e o commit acontece uma vez no final. Retorna as contagens.
+        """
+        agora = datetime.utcnow()
+        criados = atualizados = 0
+        lote = []
+        for candidato in candidatos:
+            lote.append(candidato)
+            if len(lote) >= LOTE_ALERTAS:
+                contagem = cls._registrar_fatia(lote, agora)
+                criados += contagem['criados']
+                atualizados += contagem['atualizados']
+                lote = []
+        if lote:
+            contagem = cls._registrar_fatia(lote, agora)
+            criados += contagem['criados']
+            atualizados += contagem['atualizados']
+        
+        if criados or atualizados:
+            db.session.commit()
+        return {'criados': criados, 'atualizados': atualizados}
+    
+    @classmethod
+    def _registrar_fatia(cls, candidatos, agora):
+        """Grava uma fatia de candidatos (flush sem commit) e a retira da sessão"""
+        # Último candidato vence em caso de (produto_id, tipo) repetido na fatia
+        por_chave = {(c['produto_id'], c['tipo']): c for c in candidatos}
+        
+        produto_ids = {produto_id for produto_id, _ in por_chave}
+        tipos = {tipo for _, tipo in por_chave}
+        
+        existentes = cls.query.filter(
+            cls.status == 'ativo',
+            cls.produto_id.in_(produto_ids),
+            cls.tipo.in_(tipos)
+        ).all()
+        
+        atualizados = 0
+        for alerta in existentes:
+            candidato = por_chave.pop((alerta.produto_id, alerta.tipo), None)
+            if candidato is None:
+                continue
+            alterado = False
+            for campo in cls.CAMPOS_ATUALIZAVEIS:
+                if campo in candidato and getattr(alerta, campo) != candidato[campo]:
+                    setattr(alerta, campo, candidato[campo])
+                    alterado = True
+            # Só alertas que mudaram voltam a entrar no próximo digest
+            if alterado:
+                alerta.atualizado_em = agora
+            atualizados += 1
+        
+        novos = [cls(atualizado_em=agora, **candidato) for candidato in por_chave.values()]
+        db.session.add_all(novos)
+        db.session.flush()
+        
+        # Já gravados na transação: não precisam continuar na sessão até o commit
+        for alerta in existentes + novos:
+            db.session.expunge(alerta)
+        
+        return {'criados': len(novos), 'atualizados': atualizados}
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -102,9 +243,79 @@ class Alerta(db.Model):
             'acao_tomada': self.acao_tomada,
             'detalhes_resolucao': self.detalhes_resolucao,
             'created_at': self.created_at.isoformat() if self.created_at else None,
+            'atualizado_em': self.atualizado_em.isoformat() if self.atualizado_em else None,
             'resolved_at': self.resolved_at.isoformat() if self.resolved_at else None
         }
 
+class DigestAlerta(db.Model):
+    """Marca d'água do digest de alertas enviado para cada usuário
+    
+    `ultimo_alerta_em` cobre os alertas (por `Alerta.atualizado_em`) já
+    enviados. Ao enfileirar um digest, o limite superior dele fica reservado
+    em `pendente_ate`; o envio só acontece se conseguir trocar a reserva pela
+    marca d'água, então cada (usuário, limite) é enviado uma vez só.
+    """
+    __tablename__ = 'digests_alertas'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, unique=True)
+    ultimo_alerta_em = db.Column(db.DateTime, nullable=True)
+    pendente_ate = db.Column(db.DateTime, nullable=True)
+    pendente_desde = db.Column(db.DateTime, nullable=True)
+    total_envios = db.Column(db.Integer, default=0)
+    ultimo_envio = db.Column(db.DateTime, nullable=True)
+    
+    @classmethod
+    def reservar(cls, user_id, limite):
+        """Reserva o envio do digest até `limite` (sem commit)"""
+        digest = cls.query.filter_by(user_id=user_id).first()
+        if not digest:
+            digest = cls(user_id=user_id, total_envios=0)
+            db.session.add(digest)
+        
+        digest.pendente_ate = limite
+        digest.pendente_desde = datetime.utcnow()
+        return digest
+    
+    @classmethod
+    def confirmar_envio(cls, user_id, limite):
+        """Troca a reserva pela marca d'água; False se já foi enviado ou a reserva mudou"""
+        resultado = db.session.execute(
+            db.update(cls).where(
+                cls.user_id == user_id,
+                cls.pendente_ate == limite
+            ).values(
+                ultimo_alerta_em=limite,
+                pendente_ate=None,
+                pendente_desde=None,
+                total_envios=func.coalesce(cls.total_envios, 0) + 1,
+                ultimo_envio=datetime.utcnow()
+            )
+        )
+        return resultado.rowcount == 1
+    
+    @classmethod
+    def desfazer_envio(cls, user_id, limite, anterior):
+        """Volta a marca d'água quando o envio confirmado falhou"""
+        db.session.execute(
+            db.update(cls).where(
+                cls.user_id == user_id,
+                cls.ultimo_alerta_em == limite
+            ).values(
+                ultimo_alerta_em=anterior,
+                total_envios=cls.total_envios - 1
+            )
+        )
+    
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'ultimo_alerta_em': self.ultimo_alerta_em.isoformat() if self.ultimo_alerta_em else None,
+            'pendente_ate': self.pendente_ate.isoformat() if self.pendente_ate else None,
+            'total_envios': self.total_envios,
+            'ultimo_envio': self.ultimo_envio.isoformat() if self.ultimo_envio else None
+        }
+
 class HistoricoVenda(db.Model):
     __tablename__ = 'historico_vendas'
     
@@ -131,6 +342,84 @@ class HistoricoVenda(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+class PrevisaoPerda(db.Model):
+    """Previsão diária de perdas por vencimento de cada usuário (simulação de Monte Carlo)"""
+    __tablename__ = 'previsoes_perda'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    data_referencia = db.Column(db.Date, nullable=False)
+    horizonte_dias = db.Column(db.Integer, nullable=False)
+    simulacoes = db.Column(db.Integer, nullable=False)
+    produtos_simulados = db.Column(db.Integer, default=0)
+    unidades_esperadas = db.Column(db.Float, default=0.0)
+    unidades_p90 = db.Column(db.Float, default=0.0)
+    valor_esperado = db.Column(db.Float, default=0.0)  # a preço de venda
+    valor_p90 = db.Column(db.Float, default=0.0)
+    custo_esperado = db.Column(db.Float, default=0.0)  # a preço de custo
+    custo_p90 = db.Column(db.Float, default=0.0)
+    economia_markdown = db.Column(db.Float, default=0.0)  # custo evitado seguindo os descontos sugeridos
+    reducao_desperdicio = db.Column(db.Float, default=0.0)
+    produtos = db.Column(db.JSON, nullable=True)  # produtos com maior perda esperada
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'data_referencia', name='uq_previsoes_perda_user_data'),
+    )
+    
+    CAMPOS = (
+        'horizonte_dias', 'simulacoes', 'produtos_simulados', 'unidades_esperadas', 'unidades_p90',
+        'valor_esperado', 'valor_p90', 'custo_esperado', 'custo_p90', 'economia_markdown',
+        'reducao_desperdicio', 'produtos'
+    )
+    
+    @classmethod
+    def registrar(cls, user_id, resultado):
+        """Grava a previsão do dia do usuário (substitui a existente) e faz commit"""
+        from sqlalchemy.exc import IntegrityError
+        
+        filtro = {'user_id': user_id, 'data_referencia': resultado['data_referencia']}
+        valores = {campo: resultado.get(campo) for campo in cls.CAMPOS}
+        previsao = cls.query.filter_by(**filtro).first()
+        if not previsao:
+            try:
+                with db.session.begin_nested():
+                    previsao = cls(**filtro, **valores)
+                    db.session.add(previsao)
+            except IntegrityError:
+                # Outra execução gravou a previsão do dia entre a consulta e o INSERT
+                previsao = cls.query.filter_by(**filtro).first()
+        
+        for campo, valor in valores.items():
+            setattr(previsao, campo, valor)
+        previsao.created_at = datetime.utcnow()
+        
+        db.session.commit()
+        return previsao
+    
+    @classmethod
+    def mais_recente(cls, user_id):
+        """Última previsão gravada do usuário"""
+        return cls.query.filter_by(user_id=user_id).order_by(cls.data_referencia.desc()).first()
+    
+    def to_dict(self):
+        return {
+            'data_referencia': self.data_referencia.isoformat() if self.data_referencia else None,
+            'horizonte_dias': self.horizonte_dias,
+            'simulacoes': self.simulacoes,
+            'produtos_simulados': self.produtos_simulados,
+            'unidades_esperadas': self.unidades_esperadas,
+            'unidades_p90': self.unidades_p90,
+            'valor_esperado': self.valor_esperado,
+            'valor_p90': self.valor_p90,
+            'custo_esperado': self.custo_esperado,
+            'custo_p90': self.custo_p90,
+            'economia_markdown': self.economia_markdown,
+            'reducao_desperdicio': self.reducao_desperdicio,
+            'produtos': self.produtos or [],
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
 class Gamificacao(db.Model):
     __tablename__ = 'gamificacao'
     
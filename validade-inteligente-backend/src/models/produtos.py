@@ -1,6 +1,6 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from sqlalchemy import or_, and_
 from src.models.user import db
 from src.models.produto import Produto, Alerta, HistoricoVenda
@@ -49,12 +49,8 @@ def listar_produtos():
             page=page, per_page=per_page, error_out=False
         )
         
-        # Atualizar status dos produtos
-        for produto in produtos_paginados.items:
-            produto.atualizar_status()
-        
-        db.session.commit()
-        
+        # Status é mantido por Produto.atualizar_status_em_lote (job noturno),
+        # então a listagem é somente leitura
         return jsonify({
             'produtos': [produto.to_dict() for produto in produtos_paginados.items],
             'pagination': {
@@ -140,9 +136,6 @@ def obter_produto(produto_id):
         if not produto:
             return jsonify({'error': 'Produto não encontrado'}), 404
         
-        produto.atualizar_status()
-        db.session.commit()
-        
         # Buscar histórico de vendas
         historico = HistoricoVenda.query.filter_by(produto_id=produto_id).order_by(
             HistoricoVenda.data_venda.desc()
@@ -260,12 +253,6 @@ def produtos_vencendo():
             )
         ).order_by(Produto.data_validade.asc()).all()
         
-        # Atualizar status
-        for produto in produtos:
-            produto.atualizar_status()
-        
-        db.session.commit()
-        
         return jsonify({
             'produtos': [produto.to_dict() for produto in produtos],
             'total': len(produtos)
@@ -323,48 +310,17 @@ def registrar_venda(produto_id):
         return jsonify({'error': str(e)}), 500
 
 def criar_alerta_vencimento(produto):
-    """Cria alerta de vencimento para um produto"""
+    """Cria ou atualiza o alerta de vencimento de um produto"""
+    return criar_alertas_vencimento([produto])
+
+def criar_alertas_vencimento(produtos):
+    """Cria ou atualiza alertas de vencimento para vários produtos em uma transação"""
     try:
-        dias = produto.dias_para_vencer
-        
-        if dias < 0:
-            urgencia = 'alta'
-            titulo = f'Produto vencido há {abs(dias)} dias'
-        elif dias <= 3:
-            urgencia = 'alta'
-            titulo = f'Produto vence em {dias} dias'
-        elif dias <= 7:
-            urgencia = 'media'
-            titulo = f'Produto vence em {dias} dias'
-        else:
-            urgencia = 'baixa'
-            titulo = f'Produto vence em {dias} dias'
-        
-        # Verifica se já existe alerta ativo para este produto
-        alerta_existente = Alerta.query.filter_by(
-            produto_id=produto.id,
-            tipo='vencimento',
-            status='ativo'
-        ).first()
-        
-        if alerta_existente:
-            return
-        
-        alerta = Alerta(
-            produto_id=produto.id,
-            user_id=produto.user_id,
-            tipo='vencimento',
-            urgencia=urgencia,
-            titulo=titulo,
-            descricao=f'{produto.quantidade} unidades do produto {produto.nome} vencem em {dias} dias',
-            quantidade_afetada=produto.quantidade,
-            valor_estimado_perda=produto.quantidade * produto.preco_venda
+        return Alerta.registrar_em_lote(
+            [Alerta.dados_alerta_vencimento(produto) for produto in produtos]
         )
         
-        db.session.add(alerta)
-        db.session.commit()
-        
     except Exception as e:
-        print(f"Erro ao criar alerta: {e}")
+        print(f"Erro ao criar alertas: {e}")
         db.session.rollback()
-
+        return {'criados': 0, 'atualizados': 0}
@@ -2,6 +2,7 @@ from flask import Blueprint, jsonify, request
 from datetime import datetime, timedelta
 import random
 import math
+from src.services.risk_prefilter import fatores_risco_vencimento
 
 alertas_inteligentes_bp = Blueprint('alertas_inteligentes', __name__)
 
@@ -9,15 +10,10 @@ def calcular_risco_vencimento(produto):
     """Calcula o risco de vencimento baseado em múltiplos fatores"""
     dias_para_vencer = (produto.get('data_vencimento', datetime.now()) - datetime.now()).days
     
-    # Fatores de risco
-    risco_tempo = max(0, min(100, (7 - dias_para_vencer) * 20))  # Risco aumenta nos últimos 7 dias
-    risco_estoque = min(100, produto.get('quantidade', 0) * 2)  # Mais estoque = mais risco
-    risco_rotatividade = 100 - min(100, produto.get('vendas_mes', 1) * 10)  # Baixa rotatividade = alto risco
-    
-    # Peso dos fatores
-    risco_total = (risco_tempo * 0.5 + risco_estoque * 0.3 + risco_rotatividade * 0.2)
-    
-    return min(100, max(0, risco_total))
+    fatores = fatores_risco_vencimento(
+        dias_para_vencer, produto.get('quantidade', 0), produto.get('vendas_mes', 1)
+    )
+    return fatores['total']
 
 def gerar_alertas_inteligentes():
     """Gera alertas inteligentes baseados em IA"""
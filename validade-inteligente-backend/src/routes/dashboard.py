@@ -1,12 +1,22 @@
+import time
+import threading
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime, timedelta, date
 from sqlalchemy import func, and_, or_
 from src.models.user import db
-from src.models.produto import Produto, Alerta, HistoricoVenda, Gamificacao
+from src.models.produto import Produto, Alerta, HistoricoVenda, PrevisaoPerda, Gamificacao
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
+# Previsões enfileiradas por usuário: {user_id: (dia, próxima tentativa)}. Evita um job
+# por carregamento do dashboard e, com a fila fora do ar, uma publicação por carregamento
+_previsoes_agendadas = {}
+_previsoes_lock = threading.Lock()
+
+# Segundos até tentar enfileirar de novo depois de uma falha na fila
+INTERVALO_NOVA_PUBLICACAO = 300
+
 @dashboard_bp.route('/dashboard', methods=['GET'])
 @jwt_required()
 def get_dashboard():
@@ -84,14 +94,25 @@ def get_resumo_dashboard(user_id, data_inicio, data_fim):
         )
     ).count()
     
-    # Valor em risco (produtos vencendo)
-    valor_risco = db.session.query(func.sum(Produto.preco_venda * Produto.quantidade)).filter(
-        and_(
-            Produto.user_id == user_id,
-            Produto.data_validade <= data_limite,
-            Produto.data_validade >= data_fim
-        )
-    ).scalar() or 0
+    # Perdas previstas pela simulação noturna; se a de hoje ainda não existe, serve a
+    # última gravada e enfileira o cálculo (a simulação nunca roda na requisição)
+    previsao = PrevisaoPerda.mais_recente(user_id)
+    previsao_pendente = not previsao or previsao.data_referencia < date.today()
+    if previsao_pendente:
+        agendar_previsao_perdas(user_id)
+    valores_previsao = previsao.to_dict() if previsao else {}
+    
+    if previsao:
+        valor_risco = valores_previsao.get('valor_esperado') or 0
+    else:
+        # Sem nenhuma previsão gravada (usuário novo): valor de venda do que vence na semana
+        valor_risco = db.session.query(func.sum(Produto.preco_venda * Produto.quantidade)).filter(
+            and_(
+                Produto.user_id == user_id,
+                Produto.data_validade <= data_limite,
+                Produto.data_validade >= data_fim
+            )
+        ).scalar() or 0
     
     # Vendas do período
     vendas_periodo = db.session.query(func.sum(HistoricoVenda.receita_total)).filter(
@@ -102,12 +123,6 @@ def get_resumo_dashboard(user_id, data_inicio, data_fim):
         )
     ).scalar() or 0
     
-    # Economia estimada (produtos salvos do desperdício)
-    economia_mes = vendas_periodo * 0.15  # Estimativa de 15% de economia
-    
-    # Redução de desperdício
-    reducao_desperdicio = 0.12  # 12% de redução estimada
-    
     # Alertas ativos
     alertas_ativos = Alerta.query.filter(
         and_(
@@ -120,13 +135,51 @@ def get_resumo_dashboard(user_id, data_inicio, data_fim):
         'total_produtos': total_produtos,
         'produtos_vencendo': produtos_vencendo,
         'produtos_vencidos': produtos_vencidos,
-        'valor_risco': float(valor_risco),
+        'valor_risco': round(float(valor_risco), 2),
+        'valor_risco_p90': round(valores_previsao.get('valor_p90') or 0, 2),
+        'unidades_perda_esperada': round(valores_previsao.get('unidades_esperadas') or 0, 1),
+        'unidades_perda_p90': round(valores_previsao.get('unidades_p90') or 0, 1),
         'vendas_periodo': float(vendas_periodo),
-        'economia_mes': float(economia_mes),
-        'reducao_desperdicio': reducao_desperdicio,
-        'alertas_ativos': alertas_ativos
+        # Custo evitado seguindo os descontos sugeridos, no horizonte da previsão
+        'economia_mes': round(valores_previsao.get('economia_markdown') or 0, 2),
+        'reducao_desperdicio': round(valores_previsao.get('reducao_desperdicio') or 0, 4),
+        'alertas_ativos': alertas_ativos,
+        # Descontos do otimizador de markdown para os produtos de maior perda prevista
+        'promocoes_sugeridas': [p for p in valores_previsao.get('produtos', []) if p.get('markdown')],
+        'previsao_data': valores_previsao.get('data_referencia'),
+        'previsao_pendente': previsao_pendente
     }
 
+def agendar_previsao_perdas(user_id):
+    """Enfileira a simulação de perdas do usuário, no máximo uma vez por dia por processo
+
+    A publicação não repete a conexão com o broker (retry=False): com a fila fora
+    do ar a requisição falha rápido, e novas tentativas para o usuário só
+    acontecem depois de INTERVALO_NOVA_PUBLICACAO segundos.
+    """
+    hoje = date.today()
+    agora = time.monotonic()
+    with _previsoes_lock:
+        dia, proxima_tentativa = _previsoes_agendadas.get(user_id, (None, None))
+        if dia == hoje and (proxima_tentativa is None or agora < proxima_tentativa):
+            return
+        for chave in [c for c, (d, _) in _previsoes_agendadas.items() if d != hoje]:
+            del _previsoes_agendadas[chave]
+        # Reserva antes de publicar: carregamentos simultâneos não publicam de novo
+        _previsoes_agendadas[user_id] = (hoje, agora + INTERVALO_NOVA_PUBLICACAO)
+    
+    try:
+        from src.services.tasks import simular_perdas_vencimento
+        simular_perdas_vencimento.apply_async(args=[user_id], retry=False)
+    except Exception as e:
+        # Sem fila: o dashboard segue com a última previsão até o job noturno rodar
+        # ou a próxima tentativa, que fica reservada até o fim do intervalo
+        print(f"Erro ao agendar previsão de perdas: {str(e)}")
+        return
+    
+    with _previsoes_lock:
+        _previsoes_agendadas[user_id] = (hoje, None)
+
 def get_graficos_dashboard(user_id, data_inicio, data_fim):
     """Obtém dados para gráficos do dashboard"""
     
@@ -1,13 +1,22 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime, timedelta
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import selectinload
 from src.models.user import db
 from src.models.produto import Produto
+from src.models.empresa import Empresa
 from src.models.ia_vectorization import (
     EmbeddingProduto, PredicaoIA, SessaoChat, MensagemChat, 
-    RecomendacaoIA, AnaliseTexto
+    RecomendacaoIA, AnaliseTexto, GrupoDuplicados, VECTOR_AVAILABLE
 )
 from src.services.openai_service import openai_service
+from src.services.vector_index import refresh_vector_index
+from src.services.llm_cache import llm_cache
+from src.services.ai_metering import ai_meter
+from src.services.embedding_pipeline import embedding_pipeline
+from src.services.product_search import product_search
+from src.services.duplicate_detection import duplicate_detector, LIMITE_SINCRONO
 from src.utils.decorators import empresa_access_required, feature_required
 import time
 import json
@@ -31,78 +40,74 @@ def predict_expiry_risk():
         if not openai_service:
             return jsonify({'error': 'Serviço de IA não configurado'}), 500
         
-        results = []
+        # Produtos e predições recentes carregados de uma vez (uma consulta cada)
+        produtos = _carregar_produtos(empresa_id, produto_ids)
+        recentes = PredicaoIA.recentes_por_produto(
+            list(produtos), 'expiry_risk', datetime.now() - timedelta(hours=6)
+        )
         
-        for produto_id in produto_ids:
-            produto = Produto.query.filter_by(
-                id=produto_id, empresa_id=empresa_id
-            ).first()
+        results = [None] * len(produto_ids)
+        pendentes = {}
+        
+        for posicao, produto_id in enumerate(produto_ids):
+            produto = produtos.get(produto_id)
             
             if not produto:
-                results.append({
+                results[posicao] = {
                     'produto_id': produto_id,
                     'erro': 'Produto não encontrado'
-                })
+                }
                 continue
             
-            # Verificar se já existe predição recente
-            predicao_recente = PredicaoIA.query.filter_by(
-                produto_id=produto_id,
-                tipo_predicao='expiry_risk'
-            ).filter(
-                PredicaoIA.created_at >= datetime.now() - timedelta(hours=6)
-            ).first()
-            
+            predicao_recente = recentes.get(produto_id)
             if predicao_recente:
-                results.append({
+                results[posicao] = {
                     'produto_id': produto_id,
                     'produto_nome': produto.nome,
                     'predicao': predicao_recente.resultado,
                     'confianca': float(predicao_recente.confianca) if predicao_recente.confianca else None,
                     'cached': True,
                     'created_at': predicao_recente.created_at.isoformat()
-                })
+                }
                 continue
             
-            # Gerar nova predição
-            start_time = time.time()
-            
-            try:
-                prediction = openai_service.predict_expiry_risk(produto)
-                processing_time = int((time.time() - start_time) * 1000)
-                
-                # Salvar predição no banco
-                predicao = PredicaoIA(
-                    empresa_id=empresa_id,
-                    produto_id=produto_id,
-                    tipo_predicao='expiry_risk',
-                    entrada={
+            # Ids repetidos na requisição geram uma única predição
+            pendentes.setdefault(produto_id, []).append(posicao)
+        
+        # Gerar novas predições em paralelo, respeitando as cotas da API
+        faltantes = [produtos[produto_id] for produto_id in pendentes]
+        predictions = openai_service.predict_expiry_risk_batch(faltantes)
+        
+        novas_predicoes = []
+        for produto, (prediction, processing_time) in zip(faltantes, predictions):
+            # Resultado padrão (circuito aberto, limite de chamadas, erro) não vira predição
+            # "recente": a próxima requisição tenta o modelo de novo
+            if not prediction.get('fallback'):
+                novas_predicoes.append({
+                    'empresa_id': empresa_id,
+                    'produto_id': produto.id,
+                    'tipo_predicao': 'expiry_risk',
+                    'entrada': {
                         'produto_data': openai_service._prepare_product_data(produto)
                     },
-                    resultado=prediction,
-                    confianca=prediction.get('confianca', 0.0),
-                    modelo_utilizado=openai_service.chat_model,
-                    tempo_processamento=processing_time
-                )
-                
-                db.session.add(predicao)
-                
-                results.append({
-                    'produto_id': produto_id,
+                    'resultado': prediction,
+                    'confianca': prediction.get('confianca', 0.0),
+                    'modelo_utilizado': openai_service.chat_model,
+                    'tempo_processamento': processing_time
+                })
+            
+            for posicao in pendentes[produto.id]:
+                results[posicao] = {
+                    'produto_id': produto.id,
                     'produto_nome': produto.nome,
                     'predicao': prediction,
                     'confianca': prediction.get('confianca', 0.0),
                     'cached': False,
                     'processing_time_ms': processing_time
-                })
-                
-            except Exception as e:
-                results.append({
-                    'produto_id': produto_id,
-                    'produto_nome': produto.nome,
-                    'erro': str(e)
-                })
+                }
         
+        # Salvar as predições novas em um único INSERT
+        PredicaoIA.inserir_em_lote(novas_predicoes)
         db.session.commit()
         
         return jsonify({
@@ -115,6 +120,20 @@ def predict_expiry_risk():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+def _carregar_produtos(empresa_id, produto_ids):
+    """Carrega os produtos da empresa com uma consulta IN (relacionamentos usados no prompt junto)"""
+    relacionamentos = sa_inspect(Produto).relationships.keys()
+    opcoes = [
+        selectinload(getattr(Produto, nome))
+        for nome in ('categoria', 'setor', 'fornecedor') if nome in relacionamentos
+    ]
+    
+    produtos = Produto.query.options(*opcoes).filter(
+        Produto.id.in_(set(produto_ids)),
+        Produto.empresa_id == empresa_id
+    ).all()
+    return {produto.id: produto for produto in produtos}
+
 @ia_bp.route('/ia/sugestoes/precos', methods=['POST'])
 @jwt_required()
 @empresa_access_required
@@ -132,29 +151,32 @@ def suggest_pricing():
         if not openai_service:
             return jsonify({'error': 'Serviço de IA não configurado'}), 500
         
-        results = []
+        results = [None] * len(produto_ids)
+        pendentes = []
         
-        for produto_id in produto_ids:
+        for posicao, produto_id in enumerate(produto_ids):
             produto = Produto.query.filter_by(
                 id=produto_id, empresa_id=empresa_id
             ).first()
             
             if not produto:
-                results.append({
+                results[posicao] = {
                     'produto_id': produto_id,
                     'erro': 'Produto não encontrado'
-                })
+                }
                 continue
             
-            try:
-                start_time = time.time()
-                suggestion = openai_service.generate_pricing_suggestions(produto)
-                processing_time = int((time.time() - start_time) * 1000)
-                
-                # Salvar predição
+            pendentes.append((posicao, produto))
+        
+        # Sugestões geradas em paralelo, respeitando as cotas da API
+        suggestions = openai_service.generate_pricing_suggestions_batch([produto for _, produto in pendentes])
+        
+        for (posicao, produto), (suggestion, processing_time) in zip(pendentes, suggestions):
+            # Salvar predição (a sugestão padrão de fallback não é gravada)
+            if not suggestion.get('fallback'):
                 predicao = PredicaoIA(
                     empresa_id=empresa_id,
-                    produto_id=produto_id,
+                    produto_id=produto.id,
                     tipo_predicao='pricing',
                     entrada={
                         'produto_data': openai_service._prepare_product_data(produto)
@@ -166,20 +188,13 @@ def suggest_pricing():
                 )
                 
                 db.session.add(predicao)
-                
-                results.append({
-                    'produto_id': produto_id,
-                    'produto_nome': produto.nome,
-                    'sugestao': suggestion,
-                    'processing_time_ms': processing_time
-                })
-                
-            except Exception as e:
-                results.append({
-                    'produto_id': produto_id,
-                    'produto_nome': produto.nome,
-                    'erro': str(e)
-                })
+            
+            results[posicao] = {
+                'produto_id': produto.id,
+                'produto_nome': produto.nome,
+                'sugestao': suggestion,
+                'processing_time_ms': processing_time
+            }
         
         db.session.commit()
         
@@ -226,19 +241,20 @@ def analyze_inventory():
         analysis = openai_service.analyze_inventory_patterns(empresa_id)
         processing_time = int((time.time() - start_time) * 1000)
         
-        # Salvar análise
-        predicao = PredicaoIA(
-            empresa_id=empresa_id,
-            tipo_predicao='inventory_analysis',
-            entrada={'empresa_id': empresa_id},
-            resultado=analysis,
-            confianca=analysis.get('score_otimizacao', 0.0),
-            modelo_utilizado=openai_service.chat_model,
-            tempo_processamento=processing_time
-        )
-        
-        db.session.add(predicao)
-        db.session.commit()
+        # Salvar análise (a de fallback não é servida como recente nas próximas 12 horas)
+        if not analysis.get('fallback'):
+            predicao = PredicaoIA(
+                empresa_id=empresa_id,
+                tipo_predicao='inventory_analysis',
+                entrada={'empresa_id': empresa_id},
+                resultado=analysis,
+                confianca=analysis.get('score_otimizacao', 0.0),
+                modelo_utilizado=openai_service.chat_model,
+                tempo_processamento=processing_time
+            )
+            
+            db.session.add(predicao)
+            db.session.commit()
         
         return jsonify({
             'analise': analysis,
@@ -264,11 +280,13 @@ def get_smart_alerts():
         if not openai_service:
             return jsonify({'error': 'Serviço de IA não configurado'}), 500
         
-        alerts = openai_service.generate_smart_alerts(empresa_id)
+        report = openai_service.generate_smart_alerts_report(empresa_id)
+        alerts = report['alertas']
         
         return jsonify({
             'alertas': alerts,
             'total': len(alerts),
+            'estatisticas': report['estatisticas'],
             'timestamp': datetime.now().isoformat()
         })
         
@@ -342,13 +360,24 @@ def get_chat_messages(sessao_id):
             usuario_id=user_id
         ).first_or_404()
         
-        mensagens = MensagemChat.query.filter_by(
-            sessao_id=sessao_id
-        ).order_by(MensagemChat.created_at.asc()).all()
+        # Paginação por cursor: as `limite` mensagens anteriores a `antes_de` (ou as últimas)
+        limite = min(request.args.get('limite', 50, type=int), 200)
+        antes_de = request.args.get('antes_de', type=int)
+        
+        query = sessao.mensagens
+        if antes_de:
+            query = query.filter(MensagemChat.id < antes_de)
+        mensagens = query.order_by(
+            MensagemChat.created_at.desc(), MensagemChat.id.desc()
+        ).limit(limite + 1).all()
+        
+        mais_antigas = len(mensagens) > limite
+        mensagens = list(reversed(mensagens[:limite]))
         
         return jsonify({
             'sessao': sessao.to_dict(),
-            'mensagens': [msg.to_dict() for msg in mensagens]
+            'mensagens': [msg.to_dict() for msg in mensagens],
+            'mais_antigas': mais_antigas
         })
         
     except Exception as e:
@@ -377,6 +406,9 @@ def send_chat_message(sessao_id):
         if not openai_service:
             return jsonify({'error': 'Serviço de IA não configurado'}), 500
         
+        # Histórico da sessão (janela recente + resumo), sem a pergunta atual
+        historico = openai_service.build_chat_history(sessao)
+        
         # Salvar mensagem do usuário
         mensagem_user = MensagemChat(
             sessao_id=sessao_id,
@@ -391,7 +423,8 @@ def send_chat_message(sessao_id):
         response = openai_service.chat_with_data(
             empresa_id=empresa_id,
             question=data['mensagem'],
-            context=sessao.contexto
+            context=sessao.contexto,
+            history=historico
         )
         
         processing_time = int((time.time() - start_time) * 1000)
@@ -405,6 +438,7 @@ def send_chat_message(sessao_id):
                 'modelo': response.get('modelo'),
                 'empresa_id': empresa_id
             },
+            tokens_utilizados=response.get('tokens_utilizados'),
             tempo_resposta=processing_time
         )
         db.session.add(mensagem_ia)
@@ -424,6 +458,109 @@ def send_chat_message(sessao_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+def _sse(evento, dados):
+    """Formata um evento Server-Sent Events"""
+    return f"event: {evento}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+@ia_bp.route('/ia/chat/sessoes/<int:sessao_id>/mensagens/stream', methods=['POST'])
+@jwt_required()
+@empresa_access_required
+@feature_required('chat_ia')
+def stream_chat_message(sessao_id):
+    """Envia mensagem no chat e transmite a resposta da IA via SSE"""
+    try:
+        empresa_id = request.empresa_id
+        user_id = request.user_id
+        data = request.get_json()
+        
+        if not data.get('mensagem'):
+            return jsonify({'error': 'Mensagem é obrigatória'}), 400
+        
+        sessao = SessaoChat.query.filter_by(
+            id=sessao_id,
+            empresa_id=empresa_id,
+            usuario_id=user_id
+        ).first_or_404()
+        
+        if not openai_service:
+            return jsonify({'error': 'Serviço de IA não configurado'}), 500
+        
+        # Histórico da sessão (janela recente + resumo), sem a pergunta atual
+        historico = openai_service.build_chat_history(sessao)
+        
+        # Salvar mensagem do usuário antes de iniciar o streaming
+        mensagem_user = MensagemChat(
+            sessao_id=sessao_id,
+            tipo='user',
+            conteudo=data['mensagem']
+        )
+        db.session.add(mensagem_user)
+        db.session.commit()
+        
+        start_time = time.time()
+        eventos = openai_service.stream_chat_with_data(
+            empresa_id=empresa_id,
+            question=data['mensagem'],
+            context=sessao.contexto,
+            history=historico
+        )
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+    
+    def gerar():
+        partes = []
+        final = None
+        primeiro_token_ms = None
+        
+        try:
+            yield _sse('mensagem_user', mensagem_user.to_dict())
+            
+            for evento in eventos:
+                if evento['tipo'] == 'token':
+                    if primeiro_token_ms is None:
+                        primeiro_token_ms = int((time.time() - start_time) * 1000)
+                    partes.append(evento['conteudo'])
+                    yield _sse('token', {'conteudo': evento['conteudo']})
+                else:
+                    final = evento
+        finally:
+            # Persistir a resposta quando o stream fecha (inclusive se o cliente desconectar)
+            metadados = {
+                'modelo': openai_service.chat_model,
+                'empresa_id': empresa_id,
+                'streaming': True,
+                'tempo_primeiro_token_ms': primeiro_token_ms
+            }
+            if final is None:
+                metadados['interrompido'] = True
+            elif final['tipo'] == 'erro':
+                metadados['erro'] = final['erro']
+            
+            mensagem_ia = MensagemChat(
+                sessao_id=sessao_id,
+                tipo='assistant',
+                conteudo=final['resposta'] if final else ''.join(partes),
+                metadados=metadados,
+                tokens_utilizados=final.get('tokens_utilizados') if final else None,
+                tempo_resposta=int((time.time() - start_time) * 1000)
+            )
+            db.session.add(mensagem_ia)
+            sessao.updated_at = datetime.now()
+            db.session.commit()
+        
+        yield _sse('erro' if final['tipo'] == 'erro' else 'fim', {
+            'mensagem_ia': mensagem_ia.to_dict(),
+            'processing_time_ms': mensagem_ia.tempo_resposta
+        })
+    
+    return Response(
+        stream_with_context(gerar()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @ia_bp.route('/ia/recomendacoes', methods=['GET'])
 @jwt_required()
 @empresa_access_required
@@ -517,65 +654,32 @@ def generate_product_embeddings():
                 Produto.id.in_(produto_ids),
                 Produto.empresa_id == empresa_id
             ).all()
-        
-        results = []
-        
-        for produto in produtos:
-            try:
-                # Verificar se já existe embedding
-                existing_embedding = EmbeddingProduto.query.filter_by(
-                    produto_id=produto.id
-                ).first()
-                
-                if existing_embedding and not force_regenerate:
-                    results.append({
-                        'produto_id': produto.id,
-                        'status': 'skipped',
-                        'message': 'Embedding já existe'
-                    })
-                    continue
-                
-                # Gerar embedding
-                embedding_vector = openai_service.generate_product_embedding(produto)
-                
-                if existing_embedding:
-                    # Atualizar embedding existente
-                    existing_embedding.set_embedding_array(np.array(embedding_vector))
-                    existing_embedding.updated_at = datetime.now()
-                    existing_embedding.versao_modelo = openai_service.embedding_model
-                else:
-                    # Criar novo embedding
-                    new_embedding = EmbeddingProduto(
-                        produto_id=produto.id,
-                        versao_modelo=openai_service.embedding_model,
-                        metadados={
-                            'produto_nome': produto.nome,
-                            'categoria': produto.categoria.nome if produto.categoria else None
-                        }
-                    )
-                    new_embedding.set_embedding_array(np.array(embedding_vector))
-                    db.session.add(new_embedding)
-                
-                results.append({
-                    'produto_id': produto.id,
-                    'produto_nome': produto.nome,
-                    'status': 'success'
-                })
-                
-            except Exception as e:
-                results.append({
-                    'produto_id': produto.id,
-                    'produto_nome': produto.nome,
-                    'status': 'error',
-                    'error': str(e)
-                })
+
+        # Modo assíncrono: enfileira no pipeline de embeddings e responde sem esperar a API
+        if data.get('assincrono') and not force_regenerate:
+            embedding_pipeline.enqueue([(empresa_id, p.id) for p in produtos])
+            return jsonify({
+                'enfileirados': len(produtos),
+                'fila': len(embedding_pipeline.queue)
+            }), 202
+
+        results = openai_service.upsert_product_embeddings(
+            produtos, force_regenerate=force_regenerate
+        )
         
         db.session.commit()
         
+        # Manter o índice vetorial local atualizado quando não há pgvector
+        if not VECTOR_AVAILABLE:
+            refresh_vector_index(
+                empresa_id, [r['produto_id'] for r in results if r['status'] == 'success']
+            )
+        
         return jsonify({
             'results': results,
             'total_processed': len(results),
             'successful': len([r for r in results if r['status'] == 'success']),
+            'cache_hits': len([r for r in results if r.get('cached')]),
             'errors': len([r for r in results if r['status'] == 'error'])
         })
         
@@ -588,39 +692,38 @@ def generate_product_embeddings():
 @empresa_access_required
 @feature_required('busca_inteligente')
 def search_products_by_similarity():
-    """Busca produtos por similaridade semântica"""
+    """Busca produtos por código, nome e similaridade semântica"""
     try:
         empresa_id = request.empresa_id
         data = request.get_json()
         
         query_text = data.get('query')
         limit = min(data.get('limit', 10), 50)
+        modo = data.get('modo', 'auto')
         
         if not query_text:
             return jsonify({'error': 'Texto de busca é obrigatório'}), 400
         
-        if not openai_service:
-            return jsonify({'error': 'Serviço de IA não configurado'}), 500
+        if modo not in ('auto', 'lexica', 'hibrida'):
+            return jsonify({'error': 'Modo de busca inválido'}), 400
         
-        # Gerar embedding da consulta
-        query_embedding = openai_service.generate_embedding(query_text)
+        if modo == 'hibrida' and not openai_service:
+            return jsonify({'error': 'Serviço de IA não configurado'}), 500
         
-        # Buscar produtos similares
-        similar_embeddings = EmbeddingProduto.find_similar(
-            query_embedding, limit=limit
+        # Código de barras e nome são resolvidos no banco; embeddings só com pouco recall léxico
+        busca = product_search.search(
+            empresa_id, query_text, limit=limit, modo=modo, ai_service=openai_service
         )
         
-        # Filtrar por empresa e obter produtos
         results = []
-        for embedding in similar_embeddings:
-            produto = embedding.produto
-            if produto and produto.empresa_id == empresa_id and produto.status == 'ativo':
-                produto_data = produto.to_dict()
-                produto_data['similarity_score'] = 0.8  # Placeholder - calcular similaridade real
-                results.append(produto_data)
+        for produto, info in busca['resultados']:
+            produto_data = produto.to_dict()
+            produto_data.update(info)
+            results.append(produto_data)
         
         return jsonify({
             'query': query_text,
+            'estrategia': busca['estrategia'],
             'results': results,
             'total': len(results)
         })
@@ -628,6 +731,116 @@ def search_products_by_similarity():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@ia_bp.route('/ia/duplicados', methods=['GET'])
+@jwt_required()
+@empresa_access_required
+@feature_required('busca_inteligente')
+def list_duplicate_groups():
+    """Lista grupos de produtos candidatos a duplicados"""
+    try:
+        empresa_id = request.empresa_id
+        status = request.args.get('status', 'pendente')
+        page = request.args.get('page', 1, type=int)
+        per_page = min(request.args.get('per_page', 20, type=int), 100)
+        
+        query = GrupoDuplicados.query.filter_by(empresa_id=empresa_id)
+        
+        if status:
+            query = query.filter(GrupoDuplicados.status == status)
+        
+        grupos = query.order_by(
+            GrupoDuplicados.similaridade_min.desc(),
+            GrupoDuplicados.id
+        ).paginate(page=page, per_page=per_page, error_out=False)
+        
+        # Nomes dos produtos da página em uma consulta
+        produto_ids = {produto_id for grupo in grupos.items for produto_id in grupo.produto_ids}
+        nomes = dict(
+            db.session.query(Produto.id, Produto.nome).filter(Produto.id.in_(produto_ids)).all()
+        ) if produto_ids else {}
+        
+        grupos_data = []
+        for grupo in grupos.items:
+            grupo_data = grupo.to_dict()
+            grupo_data['produtos'] = [
+                {'id': produto_id, 'nome': nomes.get(produto_id)} for produto_id in grupo.produto_ids
+            ]
+            grupos_data.append(grupo_data)
+        
+        return jsonify({
+            'grupos': grupos_data,
+            'total': grupos.total,
+            'pages': grupos.pages,
+            'current_page': page
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@ia_bp.route('/ia/duplicados/detectar', methods=['POST'])
+@jwt_required()
+@empresa_access_required
+@feature_required('busca_inteligente')
+def detect_duplicate_products():
+    """Dispara a detecção de produtos quase duplicados"""
+    try:
+        empresa_id = request.empresa_id
+        data = request.get_json(silent=True) or {}
+        
+        # Síncrono só para catálogos pequenos; os grandes levam minutos e vão para a fila
+        if data.get('sincrono') and duplicate_detector.contar_produtos(empresa_id) <= LIMITE_SINCRONO:
+            resultado = duplicate_detector.detectar(empresa_id)
+            if resultado.get('em_andamento'):
+                return jsonify({'error': 'Detecção de duplicados já em andamento'}), 409
+            return jsonify(resultado)
+        
+        from src.services.tasks import detectar_produtos_duplicados
+        tarefa = detectar_produtos_duplicados.delay(empresa_id)
+        
+        return jsonify({
+            'message': 'Detecção de duplicados iniciada',
+            'tarefa_id': tarefa.id
+        }), 202
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@ia_bp.route('/ia/duplicados/<int:grupo_id>/revisar', methods=['POST'])
+@jwt_required()
+@empresa_access_required
+@feature_required('busca_inteligente')
+def review_duplicate_group(grupo_id):
+    """Confirma ou descarta um grupo de duplicados"""
+    try:
+        empresa_id = request.empresa_id
+        data = request.get_json()
+        
+        grupo = GrupoDuplicados.query.filter_by(
+            id=grupo_id,
+            empresa_id=empresa_id
+        ).first_or_404()
+        
+        try:
+            grupo.revisar(
+                data.get('status'),
+                usuario_id=request.user_id,
+                produto_principal_id=data.get('produto_principal_id')
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        db.session.commit()
+        
+        return jsonify({
+            'message': 'Revisão registrada',
+            'grupo': grupo.to_dict()
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @ia_bp.route('/ia/historico/predicoes', methods=['GET'])
 @jwt_required()
 @empresa_access_required
@@ -670,3 +883,59 @@ def get_prediction_history():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@ia_bp.route('/ia/cache/estatisticas', methods=['GET'])
+@jwt_required()
+@empresa_access_required
+def get_llm_cache_stats():
+    """Obtém acertos, falhas e tokens economizados pelo cache de respostas da IA"""
+    try:
+        return jsonify({
+            'backend': 'redis' if llm_cache._redis is not None else 'disco',
+            'ttl_segundos': llm_cache.ttl,
+            'estatisticas': llm_cache.stats(request.empresa_id)
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@ia_bp.route('/ia/uso', methods=['GET'])
+@jwt_required()
+@empresa_access_required
+def get_ai_usage():
+    """Obtém o uso da IA da empresa: chamadas, tokens, cache, erros e latência p50/p95"""
+    try:
+        empresa_id = request.empresa_id
+        dias = min(max(request.args.get('dias', 30, type=int), 1), 365)
+        
+        uso = ai_meter.resumo(empresa_id, dias)
+        
+        # Consumo do mês corrente frente à cota do plano
+        inicio_mes = datetime.now().date().replace(day=1)
+        empresa = Empresa.query.get(empresa_id)
+        cota = empresa.get_ai_token_quota() if empresa else None
+        consumido = ai_meter.tokens_consumidos(empresa_id, inicio_mes)
+        
+        uso['mes_atual'] = {
+            'tokens_consumidos': consumido,
+            'cota_tokens': cota,
+            'percentual_cota': round(consumido / cota * 100, 2) if cota else None
+        }
+        
+        return jsonify(uso)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@ia_bp.route('/ia/saude', methods=['GET'])
+@jwt_required()
+@empresa_access_required
+def get_ai_health():
+    """Obtém o estado dos circuitos da API de IA (fechado, aberto ou meio-aberto)"""
+    try:
+        if not openai_service:
+            return jsonify({'error': 'Serviço de IA não configurado'}), 500
+        
+        return jsonify(openai_service.resilience.status())
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,210 @@
+import os
+import time
+import atexit
+import threading
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+from flask import current_app, has_app_context
+
+# Limites superiores (ms) das faixas do histograma de latência; a última faixa é aberta
+LATENCIA_BUCKETS_MS = [50, 100, 200, 300, 500, 750, 1000, 1500, 2000, 3000,
+                       5000, 7500, 10000, 15000, 20000, 30000, 60000]
+
+class AIUsageMeter:
+    """Medição de uso da IA por empresa, em buffer na memória
+
+    Cada chamada soma contadores (chamadas, erros, cache, tokens, latência) na
+    chave (empresa, dia, tipo de chamada, modelo); o buffer é consolidado em
+    UsoIADiario por uma thread em segundo plano a cada `flush_interval`
+    segundos ou `flush_max_keys` chaves, sem escrita no banco por chamada.
+    A latência entra em um histograma de faixas fixas, que pode ser somado
+    entre processos e dias para calcular p50/p95.
+    """
+
+    def __init__(self, flush_interval: int = None, flush_max_keys: int = 500):
+        self.flush_interval = flush_interval or int(os.getenv('IA_METERING_FLUSH_SECONDS', '60'))
+        self.flush_max_keys = flush_max_keys
+        self._buffer: Dict[tuple, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._flush_thread = None
+        self._app = None
+
+    def record(self, empresa_id: Optional[int], tipo: str, modelo: str, latencia_ms: int,
+               tokens_prompt: int = 0, tokens_completion: int = 0,
+               cache_hit: bool = False, erro: bool = False) -> None:
+        """Registra uma chamada (ou acerto de cache) no buffer"""
+        self.bind_current_app()
+
+        chave = (empresa_id, date.today(), tipo, modelo or 'desconhecido')
+        with self._lock:
+            valores = self._buffer.get(chave)
+            if valores is None:
+                valores = self._buffer[chave] = self._empty()
+
+            valores['chamadas'] += 1
+            valores['erros'] += int(erro)
+            valores['cache_hits'] += int(cache_hit)
+            valores['tokens_prompt'] += tokens_prompt or 0
+            valores['tokens_completion'] += tokens_completion or 0
+            valores['latencia_total_ms'] += latencia_ms
+            valores['latencia_histograma'][self._bucket(latencia_ms)] += 1
+
+            due = (len(self._buffer) >= self.flush_max_keys or
+                   time.monotonic() - self._last_flush >= self.flush_interval)
+
+        if due:
+            self._flush_in_background()
+
+    def bind_current_app(self) -> None:
+        """Guarda a aplicação atual para gravar o buffer fora do contexto da requisição"""
+        if self._app is None and has_app_context():
+            self._app = current_app._get_current_object()
+
+    def flush(self) -> int:
+        """Consolida o buffer em UsoIADiario (requer contexto da aplicação)"""
+        from src.models.ia_vectorization import UsoIADiario
+
+        with self._lock:
+            agregados = self._buffer
+            self._buffer = {}
+            self._last_flush = time.monotonic()
+
+        try:
+            return UsoIADiario.registrar_lote(agregados)
+        except Exception as e:
+            print(f"Erro ao gravar medição de uso da IA: {str(e)}")
+            from src.models.user import db
+            db.session.rollback()
+
+            # Devolve ao buffer para a próxima tentativa
+            with self._lock:
+                for chave, valores in agregados.items():
+                    self._merge(self._buffer.setdefault(chave, self._empty()), valores)
+            return 0
+
+    def resumo(self, empresa_id: int, dias: int = 30) -> Dict[str, Any]:
+        """Uso por tipo de chamada no período: chamadas, erros, cache, tokens e p50/p95 de latência"""
+        from src.models.ia_vectorization import UsoIADiario
+
+        inicio = date.today() - timedelta(days=dias - 1)
+        por_tipo: Dict[str, Dict[str, Any]] = {}
+
+        linhas = [
+            (uso.tipo_chamada, uso.to_dict())
+            for uso in UsoIADiario.query.filter(
+                UsoIADiario.empresa_id == empresa_id,
+                UsoIADiario.data >= inicio
+            ).all()
+        ]
+        with self._lock:
+            linhas += [
+                (chave[2], valores) for chave, valores in self._buffer.items()
+                if chave[0] == empresa_id and chave[1] >= inicio
+            ]
+
+        for tipo, valores in linhas:
+            self._merge(por_tipo.setdefault(tipo, self._empty()), valores)
+
+        tipos = {}
+        for tipo, valores in por_tipo.items():
+            chamadas_api = valores['chamadas'] - valores['cache_hits']
+            tipos[tipo] = {
+                'chamadas': valores['chamadas'],
+                'erros': valores['erros'],
+                'cache_hits': valores['cache_hits'],
+                'tokens_prompt': valores['tokens_prompt'],
+                'tokens_completion': valores['tokens_completion'],
+                'tokens_total': valores['tokens_prompt'] + valores['tokens_completion'],
+                'latencia_media_ms': round(valores['latencia_total_ms'] / valores['chamadas']) if valores['chamadas'] else 0,
+                'latencia_p50_ms': self._percentile(valores['latencia_histograma'], 0.5),
+                'latencia_p95_ms': self._percentile(valores['latencia_histograma'], 0.95),
+                'taxa_erro': round(valores['erros'] / chamadas_api, 4) if chamadas_api > 0 else 0.0
+            }
+
+        return {
+            'periodo_dias': dias,
+            'tokens_total': sum(t['tokens_total'] for t in tipos.values()),
+            'tipos': tipos
+        }
+
+    def tokens_consumidos(self, empresa_id: int, desde: date) -> int:
+        """Tokens gastos pela empresa desde a data (consolidado + buffer), para cotas de plano"""
+        from sqlalchemy import func
+        from src.models.user import db
+        from src.models.ia_vectorization import UsoIADiario
+
+        total = db.session.query(
+            func.coalesce(func.sum(UsoIADiario.tokens_prompt + UsoIADiario.tokens_completion), 0)
+        ).filter(
+            UsoIADiario.empresa_id == empresa_id,
+            UsoIADiario.data >= desde
+        ).scalar()
+
+        with self._lock:
+            total += sum(
+                valores['tokens_prompt'] + valores['tokens_completion']
+                for chave, valores in self._buffer.items()
+                if chave[0] == empresa_id and chave[1] >= desde
+            )
+
+        return int(total)
+
+    def _flush_in_background(self) -> None:
+        if self._app is None:
+            return
+        if self._flush_thread is not None and self._flush_thread.is_alive():
+            return
+
+        def run():
+            with self._app.app_context():
+                self.flush()
+
+        self._flush_thread = threading.Thread(target=run, daemon=True)
+        self._flush_thread.start()
+
+    def _flush_at_exit(self) -> None:
+        if self._app is not None and self._buffer:
+            with self._app.app_context():
+                self.flush()
+
+    @staticmethod
+    def _empty() -> Dict[str, Any]:
+        return {
+            'chamadas': 0, 'erros': 0, 'cache_hits': 0,
+            'tokens_prompt': 0, 'tokens_completion': 0, 'latencia_total_ms': 0,
+            'latencia_histograma': [0] * (len(LATENCIA_BUCKETS_MS) + 1)
+        }
+
+    @staticmethod
+    def _merge(destino: Dict[str, Any], origem: Dict[str, Any]) -> None:
+        for contador in ('chamadas', 'erros', 'cache_hits', 'tokens_prompt', 'tokens_completion', 'latencia_total_ms'):
+            destino[contador] += origem.get(contador) or 0
+        for i, quantidade in enumerate(origem.get('latencia_histograma') or []):
+            if i < len(destino['latencia_histograma']):
+                destino['latencia_histograma'][i] += quantidade
+
+    @staticmethod
+    def _bucket(latencia_ms: int) -> int:
+        for i, limite in enumerate(LATENCIA_BUCKETS_MS):
+            if latencia_ms <= limite:
+                return i
+        return len(LATENCIA_BUCKETS_MS)
+
+    @staticmethod
+    def _percentile(histograma: List[int], p: float) -> Optional[int]:
+        """Percentil aproximado: limite superior da faixa que contém o p-ésimo valor"""
+        total = sum(histograma)
+        if total == 0:
+            return None
+
+        acumulado = 0
+        for i, quantidade in enumerate(histograma):
+            acumulado += quantidade
+            if acumulado >= p * total:
+                return LATENCIA_BUCKETS_MS[i] if i < len(LATENCIA_BUCKETS_MS) else LATENCIA_BUCKETS_MS[-1] * 2
+        return LATENCIA_BUCKETS_MS[-1] * 2
+
+# Instância global do medidor
+ai_meter = AIUsageMeter()
+atexit.register(ai_meter._flush_at_exit)
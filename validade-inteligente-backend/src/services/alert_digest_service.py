@@ -0,0 +1,158 @@
+import os
+from typing import List, Dict, Any
+from datetime import datetime, timedelta
+from sqlalchemy import func, or_
+from src.models.user import db, User
+from src.models.produto import Produto, Alerta, DigestAlerta
+
+class AlertDigestService:
+    """Serviço que agrupa alertas novos em um único e-mail (digest) por usuário"""
+
+    URGENCIA_ORDEM = {'alta': 0, 'media': 1, 'baixa': 2}
+
+    def __init__(self):
+        self.batch_size = int(os.getenv('DIGEST_BATCH_SIZE', '100'))
+        self.max_alertas_por_email = int(os.getenv('DIGEST_MAX_ALERTAS', '50'))
+        # Reservas mais antigas que isso são consideradas perdidas e o digest é refeito
+        self.reserva_timeout = timedelta(minutes=int(os.getenv('DIGEST_RESERVA_MINUTOS', '60')))
+        # Folga para transações ainda abertas com atualizado_em anterior ao corte
+        self.atraso_corte = timedelta(seconds=60)
+
+    def coletar_digests(self) -> List[Dict[str, Any]]:
+        """Agrupa, por usuário, os alertas ativos criados ou alterados após a marca d'água do último digest"""
+        agora = datetime.utcnow()
+        rows = db.session.query(
+            Alerta, Produto.nome, User.email, User.nome_estabelecimento, DigestAlerta.ultimo_alerta_em
+        ).join(
+            Produto, Produto.id == Alerta.produto_id
+        ).join(
+            User, User.id == Alerta.user_id
+        ).outerjoin(
+            DigestAlerta, DigestAlerta.user_id == Alerta.user_id
+        ).filter(
+            Alerta.status == 'ativo',
+            Alerta.atualizado_em > func.coalesce(DigestAlerta.ultimo_alerta_em, datetime(1970, 1, 1)),
+            Alerta.atualizado_em <= agora - self.atraso_corte,
+            # Usuários com digest já enfileirado ficam de fora até o envio (ou a reserva expirar)
+            or_(DigestAlerta.pendente_ate.is_(None), DigestAlerta.pendente_desde < agora - self.reserva_timeout)
+        ).order_by(Alerta.user_id, Alerta.atualizado_em).all()
+
+        digests = {}
+        for alerta, produto_nome, email, nome_estabelecimento, marca_anterior in rows:
+            digest = digests.get(alerta.user_id)
+            if digest is None:
+                digest = digests[alerta.user_id] = {
+                    'user_id': alerta.user_id,
+                    'email': email,
+                    'nome_estabelecimento': nome_estabelecimento,
+                    'alertas': [],
+                    'marca_anterior': marca_anterior,
+                    'limite': alerta.atualizado_em
+                }
+
+            digest['alertas'].append({
+                'id': alerta.id,
+                'produto_nome': produto_nome,
+                'tipo': alerta.tipo,
+                'urgencia': alerta.urgencia,
+                'titulo': alerta.titulo,
+                'quantidade_afetada': alerta.quantidade_afetada,
+                'valor_estimado_perda': alerta.valor_estimado_perda or 0
+            })
+            digest['limite'] = max(digest['limite'], alerta.atualizado_em)
+
+        return [d for d in digests.values() if d['email']]
+
+    def montar_mensagem(self, digest: Dict[str, Any]) -> Dict[str, Any]:
+        """Renderiza o e-mail de digest com a tabela-resumo dos alertas"""
+        from src.services.email_service import email_service
+
+        alertas = sorted(
+            digest['alertas'],
+            key=lambda a: (self.URGENCIA_ORDEM.get(a['urgencia'], 3), -a['valor_estimado_perda'])
+        )
+
+        template_data = {
+            'nome_estabelecimento': digest['nome_estabelecimento'],
+            'alertas': alertas[:self.max_alertas_por_email],
+            'alertas_omitidos': max(0, len(alertas) - self.max_alertas_por_email),
+            'total_alertas': len(alertas),
+            'total_alta': len([a for a in alertas if a['urgencia'] == 'alta']),
+            'valor_total_risco': sum(a['valor_estimado_perda'] for a in alertas),
+            'data_atual': datetime.now().strftime('%d/%m/%Y %H:%M')
+        }
+
+        html_body, text_body = email_service.render_template('digest_alertas', template_data)
+
+        return {
+            'to_emails': [digest['email']],
+            'subject': f"{len(alertas)} novos alertas de validade - {digest['nome_estabelecimento']}",
+            'html_body': html_body,
+            'text_body': text_body,
+            'user_id': digest['user_id'],
+            # Datas em ISO: a mensagem passa pela fila do Celery
+            'limite': digest['limite'].isoformat(),
+            'marca_anterior': digest['marca_anterior'].isoformat() if digest['marca_anterior'] else None
+        }
+
+    def enfileirar_digests(self) -> Dict[str, Any]:
+        """Monta os digests pendentes, reserva cada um e os enfileira em lotes para o envio assíncrono
+
+        As reservas são gravadas antes de enfileirar: uma nova execução do job
+        (ou um retry) não monta o mesmo digest de novo enquanto a reserva valer.
+        """
+        from src.services.tasks import enviar_lote_digests
+
+        digests = self.coletar_digests()
+        for digest in digests:
+            DigestAlerta.reservar(digest['user_id'], digest['limite'])
+        db.session.commit()
+
+        mensagens = [self.montar_mensagem(digest) for digest in digests]
+
+        lotes = 0
+        for inicio in range(0, len(mensagens), self.batch_size):
+            enviar_lote_digests.delay(mensagens[inicio:inicio + self.batch_size])
+            lotes += 1
+
+        return {'digests': len(mensagens), 'lotes': lotes}
+
+    def enviar_lote(self, mensagens: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Envia um lote de digests em uma sessão SMTP
+
+        Cada digest só é enviado se a sua reserva ainda estiver de pé; a marca
+        d'água avança antes do envio e volta se o e-mail falhar. Reenviar o
+        mesmo lote (retry do Celery) não duplica e-mails.
+        """
+        from src.services.email_service import email_service
+
+        confirmadas = [
+            mensagem for mensagem in mensagens
+            if DigestAlerta.confirmar_envio(mensagem['user_id'], datetime.fromisoformat(mensagem['limite']))
+        ]
+        db.session.commit()
+
+        resultados = email_service.send_bulk_emails(confirmadas)
+
+        enviados = 0
+        for mensagem, resultado in zip(confirmadas, resultados):
+            if resultado['success']:
+                enviados += 1
+                continue
+            anterior = mensagem.get('marca_anterior')
+            DigestAlerta.desfazer_envio(
+                mensagem['user_id'],
+                datetime.fromisoformat(mensagem['limite']),
+                datetime.fromisoformat(anterior) if anterior else None
+            )
+
+        db.session.commit()
+
+        return {
+            'enviados': enviados,
+            'falhas': len(confirmadas) - enviados,
+            'ignorados': len(mensagens) - len(confirmadas)
+        }
+
+# Instância global do serviço
+alert_digest_service = AlertDigestService()
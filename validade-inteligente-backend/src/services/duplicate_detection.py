@@ -0,0 +1,307 @@
+import os
+import time
+import threading
+import numpy as np
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Tuple
+from src.models.user import db
+from src.models.produto import Produto
+from src.models.ia_vectorization import EmbeddingProduto, GrupoDuplicados
+from src.services.product_search import coluna_codigo_barras
+
+# Similaridade de cosseno mínima para um par virar candidato
+SIMILARIDADE_MINIMA = float(os.getenv('DUPLICADOS_SIMILARIDADE_MINIMA', '0.93'))
+
+# Vizinhos mais próximos considerados por produto dentro de cada bloco
+VIZINHOS_POR_PRODUTO = int(os.getenv('DUPLICADOS_VIZINHOS', '5'))
+
+# Dígitos iniciais do código de barras usados na blocagem (prefixo GS1 do fabricante)
+PREFIXO_CODIGO = int(os.getenv('DUPLICADOS_PREFIXO_CODIGO', '7'))
+
+# Grupos maiores que isso são reagrupados com um corte de similaridade mais alto
+TAMANHO_MAXIMO_GRUPO = 20
+
+# Elementos da matriz de similaridade calculados por vez (~64 MB em float32)
+ELEMENTOS_POR_LOTE = 16 * 1024 * 1024
+
+# Ids por consulta ao carregar embeddings
+IDS_POR_CONSULTA = 5000
+
+# Catálogo máximo (produtos com embedding) para rodar a detecção dentro da requisição
+LIMITE_SINCRONO = int(os.getenv('DUPLICADOS_LIMITE_SINCRONO', '2000'))
+
+# Primeira chave do advisory lock do Postgres (a segunda é o empresa_id)
+CLASSE_TRAVA_DUPLICADOS = 4801
+
+# Empresas com detecção em andamento neste processo (bancos sem advisory lock)
+_empresas_em_deteccao = set()
+_empresas_lock = threading.Lock()
+
+@contextmanager
+def _trava_empresa(empresa_id: int):
+    """Garante uma detecção por empresa por vez; produz False se outra já está rodando
+
+    No Postgres usa pg_try_advisory_xact_lock, liberado no commit/rollback da
+    transação que grava os grupos, então vale entre a task semanal e a rota em
+    qualquer worker. Nos outros bancos a trava é só do processo.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        obtida = db.session.execute(
+            db.text('SELECT pg_try_advisory_xact_lock(:classe, :empresa_id)'),
+            {'classe': CLASSE_TRAVA_DUPLICADOS, 'empresa_id': empresa_id}
+        ).scalar()
+        try:
+            yield bool(obtida)
+        finally:
+            # Sem commit (não obtida ou erro) a transação ainda segura a trava
+            db.session.rollback()
+        return
+
+    with _empresas_lock:
+        obtida = empresa_id not in _empresas_em_deteccao
+        _empresas_em_deteccao.add(empresa_id)
+    try:
+        yield obtida
+    finally:
+        if obtida:
+            with _empresas_lock:
+                _empresas_em_deteccao.discard(empresa_id)
+
+def _coluna_categoria():
+    """Coluna de categoria do modelo de produto"""
+    return getattr(Produto, 'categoria_id', None) or getattr(Produto, 'categoria', None)
+
+def vizinhos_acima_do_limiar(matriz: np.ndarray, k: int, limiar: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Pares (i, j, similaridade), i < j, entre os k vizinhos de cada linha com similaridade >= limiar
+
+    `matriz` deve estar normalizada. A matriz de similaridade é calculada em
+    faixas de linhas (produto de matrizes + argpartition), sem laço por par.
+    """
+    n = len(matriz)
+    if n < 2 or k <= 0:
+        vazio = np.empty(0, dtype=np.int64)
+        return vazio, vazio, np.empty(0, dtype=np.float32)
+
+    k = min(k, n - 1)
+    linhas_por_lote = max(1, min(n, ELEMENTOS_POR_LOTE // n))
+    origens, destinos, scores = [], [], []
+
+    for inicio in range(0, n, linhas_por_lote):
+        fim = min(n, inicio + linhas_por_lote)
+        sim = matriz[inicio:fim] @ matriz.T
+        sim[np.arange(fim - inicio), np.arange(inicio, fim)] = -np.inf
+
+        top = np.argpartition(-sim, k - 1, axis=1)[:, :k]
+        top_sim = np.take_along_axis(sim, top, axis=1)
+        linhas, colunas = np.nonzero(top_sim >= limiar)
+
+        i = linhas + inicio
+        j = top[linhas, colunas]
+        origens.append(np.minimum(i, j))
+        destinos.append(np.maximum(i, j))
+        scores.append(top_sim[linhas, colunas])
+
+    i = np.concatenate(origens)
+    j = np.concatenate(destinos)
+    s = np.concatenate(scores)
+
+    # a→b e b→a aparecem uma vez só
+    _, unicos = np.unique(i.astype(np.int64) * n + j, return_index=True)
+    return i[unicos], j[unicos], s[unicos]
+
+def agrupar_pares(pares: Dict[Tuple[int, int], float], tamanho_maximo: int = TAMANHO_MAXIMO_GRUPO) -> List[List[Tuple[int, int]]]:
+    """Componentes conexos dos pares; componentes grandes demais perdem as arestas mais fracas
+
+    Retorna as arestas de cada grupo. O corte evita que encadeamentos
+    (A~B, B~C, C~D...) juntem produtos diferentes num grupo só.
+    """
+    grupos = []
+    pendentes = [list(pares)]
+
+    while pendentes:
+        arestas = pendentes.pop()
+        for componente in _componentes(arestas):
+            nos = {n for par in componente for n in par}
+            if len(nos) <= tamanho_maximo:
+                grupos.append(componente)
+                continue
+            mais_fraca = min(pares[par] for par in componente)
+            restantes = [par for par in componente if pares[par] > mais_fraca]
+            if restantes:
+                pendentes.append(restantes)
+
+    return grupos
+
+def _componentes(arestas: List[Tuple[int, int]]) -> List[List[Tuple[int, int]]]:
+    """Union-find sobre as arestas; retorna as arestas de cada componente"""
+    pai = {}
+
+    def raiz(n):
+        pai.setdefault(n, n)
+        while pai[n] != n:
+            pai[n] = pai[pai[n]]
+            n = pai[n]
+        return n
+
+    for a, b in arestas:
+        ra, rb = raiz(a), raiz(b)
+        if ra != rb:
+            pai[ra] = rb
+
+    componentes = defaultdict(list)
+    for a, b in arestas:
+        componentes[raiz(a)].append((a, b))
+    return list(componentes.values())
+
+class DuplicateDetector:
+    """Detecta produtos quase duplicados de uma empresa pelos embeddings
+
+    Os produtos são divididos em blocos (mesma categoria; mesmo prefixo de
+    código de barras) e só são comparados dentro de cada bloco, com top-k
+    vetorizado. Os pares acima do limiar viram grupos candidatos gravados em
+    GrupoDuplicados para revisão; pares já descartados numa revisão não voltam.
+    """
+
+    def __init__(self, limiar: float = None, vizinhos: int = None, prefixo_codigo: int = None):
+        self.limiar = SIMILARIDADE_MINIMA if limiar is None else limiar
+        self.vizinhos = VIZINHOS_POR_PRODUTO if vizinhos is None else vizinhos
+        self.prefixo_codigo = PREFIXO_CODIGO if prefixo_codigo is None else prefixo_codigo
+
+    def detectar(self, empresa_id: int) -> Dict[str, Any]:
+        """Roda a detecção e substitui os grupos pendentes da empresa
+
+        Execuções simultâneas da mesma empresa (task semanal e rota) são
+        serializadas: a que chega depois retorna `em_andamento` sem gravar.
+        """
+        with _trava_empresa(empresa_id) as obtida:
+            if not obtida:
+                return {'empresa_id': empresa_id, 'em_andamento': True, 'grupos': 0}
+            return self._detectar(empresa_id)
+
+    def contar_produtos(self, empresa_id: int) -> int:
+        """Produtos ativos da empresa com embedding (tamanho da detecção)"""
+        return db.session.query(db.func.count(Produto.id)).join(
+            EmbeddingProduto, EmbeddingProduto.produto_id == Produto.id
+        ).filter(Produto.empresa_id == empresa_id, Produto.status == 'ativo').scalar() or 0
+
+    def _detectar(self, empresa_id: int) -> Dict[str, Any]:
+        inicio = time.perf_counter()
+
+        blocos = self._blocos(empresa_id)
+        descartados = self._pares_descartados(empresa_id)
+
+        pares: Dict[Tuple[int, int], float] = {}
+        criterios: Dict[Tuple[int, int], set] = defaultdict(set)
+        comparacoes = 0
+
+        for criterio, ids in blocos:
+            produto_ids, matriz = self._carregar_vetores(ids)
+            if len(produto_ids) < 2:
+                continue
+            comparacoes += len(produto_ids) * min(self.vizinhos, len(produto_ids) - 1)
+
+            i, j, scores = vizinhos_acima_do_limiar(matriz, self.vizinhos, self.limiar)
+            for a, b, score in zip(i.tolist(), j.tolist(), scores.tolist()):
+                par = tuple(sorted((produto_ids[a], produto_ids[b])))
+                if par in descartados:
+                    continue
+                pares[par] = max(pares.get(par, 0.0), score)
+                criterios[par].add(criterio)
+
+        grupos = agrupar_pares(pares)
+        gravados = self._gravar(empresa_id, grupos, pares, criterios)
+
+        return {
+            'empresa_id': empresa_id,
+            'blocos': len(blocos),
+            'comparacoes': comparacoes,
+            'pares_candidatos': len(pares),
+            'grupos': gravados,
+            'tempo_ms': int((time.perf_counter() - inicio) * 1000)
+        }
+
+    def _blocos(self, empresa_id: int) -> List[Tuple[str, List[int]]]:
+        """[(critério, produto_ids)] com pelo menos dois produtos com embedding"""
+        categoria = _coluna_categoria()
+        codigo = coluna_codigo_barras()
+        colunas = [Produto.id, categoria if categoria is not None else db.null(),
+                   codigo if codigo is not None else db.null()]
+
+        rows = db.session.query(*colunas).join(
+            EmbeddingProduto, EmbeddingProduto.produto_id == Produto.id
+        ).filter(Produto.empresa_id == empresa_id, Produto.status == 'ativo').all()
+
+        por_categoria = defaultdict(list)
+        por_prefixo = defaultdict(list)
+        for produto_id, valor_categoria, valor_codigo in rows:
+            if valor_categoria is not None:
+                por_categoria[valor_categoria].append(produto_id)
+            valor_codigo = (valor_codigo or '').strip()
+            if len(valor_codigo) >= self.prefixo_codigo and valor_codigo[:self.prefixo_codigo].isdigit():
+                por_prefixo[valor_codigo[:self.prefixo_codigo]].append(produto_id)
+
+        return (
+            [('categoria', ids) for ids in por_categoria.values() if len(ids) > 1] +
+            [('prefixo_codigo', ids) for ids in por_prefixo.values() if len(ids) > 1]
+        )
+
+    def _carregar_vetores(self, ids: List[int]) -> Tuple[List[int], np.ndarray]:
+        """Embeddings normalizados do bloco, carregados em consultas de até IDS_POR_CONSULTA ids"""
+        produto_ids, matrizes = [], []
+        for inicio in range(0, len(ids), IDS_POR_CONSULTA):
+            lote_ids, matriz = EmbeddingProduto.load_matrix(produto_ids=ids[inicio:inicio + IDS_POR_CONSULTA])
+            produto_ids.extend(lote_ids)
+            matrizes.append(matriz)
+
+        matriz = np.vstack(matrizes) if matrizes else np.empty((0, 1536), dtype=np.float32)
+        normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+        normas[normas == 0] = 1.0
+        return produto_ids, matriz / normas
+
+    def _pares_descartados(self, empresa_id: int) -> set:
+        """Pares de produtos que estavam juntos em grupos descartados na revisão"""
+        pares = set()
+        grupos = GrupoDuplicados.query.filter_by(empresa_id=empresa_id, status='descartado').all()
+        for grupo in grupos:
+            ids = sorted(grupo.produto_ids or [])
+            pares.update((a, b) for n, a in enumerate(ids) for b in ids[n + 1:])
+        return pares
+
+    def _gravar(self, empresa_id: int, grupos: List[List[Tuple[int, int]]],
+                pares: Dict[Tuple[int, int], float], criterios: Dict[Tuple[int, int], set]) -> int:
+        """Substitui os grupos pendentes; grupos já revisados com os mesmos produtos são mantidos"""
+        GrupoDuplicados.query.filter_by(empresa_id=empresa_id, status='pendente').delete(synchronize_session=False)
+
+        revisados = {
+            assinatura for (assinatura,) in db.session.query(GrupoDuplicados.assinatura).filter(
+                GrupoDuplicados.empresa_id == empresa_id
+            ).all()
+        }
+
+        novos = []
+        for arestas in grupos:
+            produto_ids = sorted({n for par in arestas for n in par})
+            assinatura = GrupoDuplicados.calcular_assinatura(produto_ids)
+            if assinatura in revisados:
+                continue
+            revisados.add(assinatura)
+
+            scores = [pares[par] for par in arestas]
+            novos.append(GrupoDuplicados(
+                empresa_id=empresa_id,
+                assinatura=assinatura,
+                produto_ids=produto_ids,
+                pares=[[a, b, round(pares[(a, b)], 4)] for a, b in sorted(arestas, key=lambda par: -pares[par])],
+                criterios=sorted({c for par in arestas for c in criterios[par]}),
+                similaridade_min=round(min(scores), 4),
+                similaridade_media=round(sum(scores) / len(scores), 4),
+                status='pendente'
+            ))
+
+        db.session.add_all(novos)
+        db.session.commit()
+        return len(novos)
+
+# Instância global do detector
+duplicate_detector = DuplicateDetector()
@@ -41,27 +41,7 @@ class EmailService:
                     'code': 'EMAIL_NOT_CONFIGURED'
                 }
             
-            # Criar mensagem
-            msg = MIMEMultipart('alternative')
-            msg['From'] = f"{self.from_name} <{self.from_email}>"
-            msg['To'] = ', '.join(to_emails)
-            msg['Subject'] = subject
-            
-            if reply_to:
-                msg['Reply-To'] = reply_to
-            
-            # Adicionar corpo do e-mail
-            if text_body:
-                text_part = MIMEText(text_body, 'plain', 'utf-8')
-                msg.attach(text_part)
-            
-            html_part = MIMEText(html_body, 'html', 'utf-8')
-            msg.attach(html_part)
-            
-            # Adicionar anexos
-            if attachments:
-                for attachment in attachments:
-                    self._add_attachment(msg, attachment)
+            msg = self._build_message(to_emails, subject, html_body, text_body, attachments, reply_to)
             
             # Enviar e-mail
             context = ssl.create_default_context()
@@ -106,22 +86,89 @@ class EmailService:
                 'code': 'EMAIL_SEND_ERROR'
             }
     
+    def send_bulk_emails(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Envia vários e-mails reutilizando uma única sessão SMTP
+        
+        Cada mensagem é um dict com to_emails, subject, html_body e,
+        opcionalmente, text_body e reply_to. Retorna um resultado por mensagem.
+        """
+        if not messages:
+            return []
+        
+        if not self.smtp_username or not self.smtp_password:
+            return [{
+                'success': False,
+                'error': 'Configurações de e-mail não definidas',
+                'code': 'EMAIL_NOT_CONFIGURED'
+            } for _ in messages]
+        
+        results = []
+        try:
+            context = ssl.create_default_context()
+            
+            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
+                server.starttls(context=context)
+                server.login(self.smtp_username, self.smtp_password)
+                
+                for message in messages:
+                    try:
+                        msg = self._build_message(
+                            message['to_emails'],
+                            message['subject'],
+                            message['html_body'],
+                            message.get('text_body'),
+                            reply_to=message.get('reply_to')
+                        )
+                        server.send_message(msg)
+                        results.append({'success': True, 'recipients': message['to_emails']})
+                    except smtplib.SMTPServerDisconnected:
+                        raise
+                    except Exception as e:
+                        results.append({
+                            'success': False,
+                            'error': f'Erro ao enviar e-mail: {str(e)}',
+                            'code': 'EMAIL_SEND_ERROR'
+                        })
+        
+        except Exception as e:
+            # Mensagens não processadas antes da falha da sessão
+            results.extend({
+                'success': False,
+                'error': f'Erro na sessão SMTP: {str(e)}',
+                'code': 'EMAIL_SEND_ERROR'
+            } for _ in messages[len(results):])
+        
+        LogAuditoria.log_system_event(
+            'email_bulk_sent',
+            details={
+                'total': len(messages),
+                'enviados': len([r for r in results if r['success']])
+            },
+            nivel='info'
+        )
+        
+        return results
+    
+    def render_template(self, template_name: str, template_data: Dict[str, Any]):
+        """Renderiza os templates HTML e texto (opcional) de um e-mail"""
+        html_template = self.jinja_env.get_template(f"{template_name}.html")
+        html_body = html_template.render(**template_data)
+        
+        text_body = None
+        try:
+            text_template = self.jinja_env.get_template(f"{template_name}.txt")
+            text_body = text_template.render(**template_data)
+        except jinja2.TemplateNotFound:
+            pass
+        
+        return html_body, text_body
+    
     def send_template_email(self, template_name: str, to_emails: List[str], 
                           subject: str, template_data: Dict[str, Any],
                           attachments: List[Dict] = None) -> Dict[str, Any]:
         """Envia e-mail usando template"""
         try:
-            # Carregar template HTML
-            html_template = self.jinja_env.get_template(f"{template_name}.html")
-            html_body = html_template.render(**template_data)
-            
-            # Tentar carregar template de texto
-            text_body = None
-            try:
-                text_template = self.jinja_env.get_template(f"{template_name}.txt")
-                text_body = text_template.render(**template_data)
-            except jinja2.TemplateNotFound:
-                pass
+            html_body, text_body = self.render_template(template_name, template_data)
             
             return self.send_email(
                 to_emails=to_emails,
@@ -404,6 +451,33 @@ class EmailService:
                 'code': 'EXPIRY_EMAIL_ERROR'
             }
     
+    def _build_message(self, to_emails: List[str], subject: str, html_body: str,
+                       text_body: str = None, attachments: List[Dict] = None,
+                       reply_to: str = None) -> MIMEMultipart:
+        """Monta a mensagem MIME do e-mail"""
+        msg = MIMEMultipart('alternative')
+        msg['From'] = f"{self.from_name} <{self.from_email}>"
+        msg['To'] = ', '.join(to_emails)
+        msg['Subject'] = subject
+        
+        if reply_to:
+            msg['Reply-To'] = reply_to
+        
+        # Adicionar corpo do e-mail
+        if text_body:
+            text_part = MIMEText(text_body, 'plain', 'utf-8')
+            msg.attach(text_part)
+        
+        html_part = MIMEText(html_body, 'html', 'utf-8')
+        msg.attach(html_part)
+        
+        # Adicionar anexos
+        if attachments:
+            for attachment in attachments:
+                self._add_attachment(msg, attachment)
+        
+        return msg
+    
     def _add_attachment(self, msg: MIMEMultipart, attachment: Dict[str, Any]):
         """Adiciona anexo ao e-mail"""
         try:
@@ -0,0 +1,257 @@
+import os
+import time
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+class EmbeddingQueue:
+    """Fila com debounce de produtos cujo texto de embedding mudou
+
+    Cada alteração grava (empresa, produto) com o horário da última mudança;
+    um produto só sai da fila depois de `debounce` segundos sem novas
+    mudanças, de modo que várias edições seguidas viram um único embedding.
+    Usa um sorted set no Redis (compartilhado entre web e workers Celery) ou,
+    sem Redis, um dicionário em memória processado por uma thread local.
+    """
+
+    REDIS_KEY = 'embedding_queue'
+
+    def __init__(self, debounce: float = None, redis_url: str = None):
+        self.debounce = debounce if debounce is not None else float(os.getenv('EMBEDDING_QUEUE_DEBOUNCE', '30'))
+        self._pending: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._redis = None
+
+        redis_url = redis_url or os.getenv('REDIS_URL')
+        if REDIS_AVAILABLE and redis_url:
+            try:
+                client = redis.Redis.from_url(redis_url, socket_timeout=0.5)
+                client.ping()
+                self._redis = client
+            except Exception as e:
+                print(f"Fila de embeddings: Redis indisponível, usando memória ({str(e)})")
+
+    @property
+    def shared(self) -> bool:
+        """Indica se a fila é compartilhada entre processos (Redis)"""
+        return self._redis is not None
+
+    def push(self, items: List[Tuple[int, int]]) -> None:
+        """Enfileira (empresa_id, produto_id), reiniciando o prazo de debounce"""
+        if not items:
+            return
+        now = time.time()
+        members = {f'{empresa_id}:{produto_id}': now for empresa_id, produto_id in items}
+
+        if self._redis is not None:
+            try:
+                self._redis.zadd(self.REDIS_KEY, members)
+                return
+            except Exception as e:
+                print(f"Erro ao enfileirar embeddings no Redis: {str(e)}")
+
+        with self._lock:
+            self._pending.update(members)
+
+    def pop_due(self, limit: int = 1000) -> List[Tuple[int, int]]:
+        """Retira da fila os produtos sem mudanças há `debounce` segundos"""
+        cutoff = time.time() - self.debounce
+
+        if self._redis is not None:
+            try:
+                members = self._redis.zrangebyscore(self.REDIS_KEY, '-inf', cutoff, start=0, num=limit)
+                if not members:
+                    return []
+                # Só fica com os itens que este processo conseguiu remover (vários workers)
+                pipe = self._redis.pipeline()
+                for member in members:
+                    pipe.zrem(self.REDIS_KEY, member)
+                removed = pipe.execute()
+                return [self._parse(m.decode()) for m, ok in zip(members, removed) if ok]
+            except Exception as e:
+                print(f"Erro ao ler fila de embeddings no Redis: {str(e)}")
+
+        with self._lock:
+            due = [member for member, changed_at in self._pending.items() if changed_at <= cutoff][:limit]
+            for member in due:
+                del self._pending[member]
+        return [self._parse(member) for member in due]
+
+    def __len__(self):
+        if self._redis is not None:
+            try:
+                return self._redis.zcard(self.REDIS_KEY)
+            except Exception:
+                pass
+        with self._lock:
+            return len(self._pending)
+
+    @staticmethod
+    def _parse(member: str) -> Tuple[int, int]:
+        empresa_id, produto_id = member.split(':')
+        return int(empresa_id), int(produto_id)
+
+class EmbeddingPipeline:
+    """Mantém embeddings e índice vetorial atualizados a partir das mudanças em Produto
+
+    Hooks after_insert/after_update/after_delete anotam os produtos alterados
+    na sessão; só depois do commit eles vão para a fila (rollback descarta).
+    O processamento agrupa a fila por empresa, regera em lote apenas os
+    textos que mudaram (hash de conteúdo) e atualiza o índice de forma
+    incremental, sem nenhuma requisição esperar pela API de embeddings.
+    """
+
+    SESSION_KEY = 'embedding_pendentes'
+
+    def __init__(self, queue: EmbeddingQueue = None, batch_size: int = 500):
+        self.queue = queue if queue is not None else EmbeddingQueue()
+        self.batch_size = batch_size
+        self.enabled = os.getenv('EMBEDDING_PIPELINE_ENABLED', 'true').lower() == 'true'
+        self._registered = False
+        self._app = None
+        self._worker = None
+        self._wakeup = threading.Event()
+
+    def register(self, produto_model, text_fields: Tuple[str, ...]) -> None:
+        """Registra os hooks do modelo de produto (campos que compõem o texto do embedding)"""
+        if self._registered or not self.enabled:
+            return
+
+        mapper_columns = {attr.key for attr in inspect(produto_model).attrs}
+        tracked = [field for field in text_fields if field in mapper_columns]
+
+        def on_change(mapper, connection, target):
+            # Mudanças em campos fora do texto (ex.: status) não geram novo embedding
+            state = inspect(target)
+            if any(state.attrs[field].history.has_changes() for field in tracked):
+                self._mark(target)
+
+        def on_insert_or_delete(mapper, connection, target):
+            self._mark(target)
+
+        event.listen(produto_model, 'after_insert', on_insert_or_delete)
+        event.listen(produto_model, 'after_update', on_change)
+        event.listen(produto_model, 'after_delete', on_insert_or_delete)
+        event.listen(Session, 'after_commit', self._after_commit)
+        event.listen(Session, 'after_rollback', self._after_rollback)
+        self._registered = True
+
+    def enqueue(self, items: List[Tuple[int, int]]) -> None:
+        """Enfileira (empresa_id, produto_id) e garante que a fila será processada
+
+        Com Redis, o job processar_fila_embeddings consome a fila; sem Redis,
+        a thread local do processo é iniciada (ou acordada).
+        """
+        if not items:
+            return
+        self.queue.push(items)
+
+        if not self.queue.shared:
+            self._start_local_worker()
+
+    def process_due(self) -> Dict[str, int]:
+        """Processa os produtos vencidos do debounce (requer contexto da aplicação)"""
+        from src.models.user import db
+        from src.models.produto import Produto
+        from src.models.ia_vectorization import VECTOR_AVAILABLE
+        from src.services.openai_service import get_openai_service
+        from src.services.vector_index import refresh_vector_index
+
+        openai_service = get_openai_service()
+        if openai_service is None:
+            return {'produtos': 0, 'embeddings_gerados': 0, 'erros': 0}
+
+        stats = {'produtos': 0, 'embeddings_gerados': 0, 'erros': 0}
+
+        while True:
+            items = self.queue.pop_due(self.batch_size)
+            if not items:
+                break
+
+            por_empresa = defaultdict(list)
+            for empresa_id, produto_id in items:
+                por_empresa[empresa_id].append(produto_id)
+
+            for empresa_id, produto_ids in por_empresa.items():
+                try:
+                    produtos = Produto.query.filter(Produto.id.in_(produto_ids)).all()
+                    results = openai_service.upsert_product_embeddings(produtos)
+                    db.session.commit()
+                except Exception as e:
+                    print(f"Erro ao atualizar embeddings da empresa {empresa_id}: {str(e)}")
+                    db.session.rollback()
+                    self.queue.push([(empresa_id, produto_id) for produto_id in produto_ids])
+                    stats['erros'] += len(produto_ids)
+                    continue
+
+                stats['produtos'] += len(produto_ids)
+                stats['embeddings_gerados'] += len([r for r in results if r['status'] == 'success'])
+
+                # Falhas da API voltam para a fila na próxima rodada
+                falhas = [r['produto_id'] for r in results if r['status'] == 'error']
+                if falhas:
+                    self.queue.push([(empresa_id, produto_id) for produto_id in falhas])
+                    stats['erros'] += len(falhas)
+
+                # Índice local (sem pgvector): atualiza alterados e remove excluídos
+                if not VECTOR_AVAILABLE:
+                    refresh_vector_index(empresa_id, [p for p in produto_ids if p not in falhas])
+
+        return stats
+
+    def _mark(self, target) -> None:
+        empresa_id = getattr(target, 'empresa_id', None)
+        session = object_session(target)
+        if empresa_id is None or target.id is None or session is None:
+            return
+        session.info.setdefault(self.SESSION_KEY, set()).add((empresa_id, target.id))
+
+    def _after_commit(self, session) -> None:
+        items = session.info.pop(self.SESSION_KEY, None)
+        if items:
+            self.enqueue(list(items))
+
+    def _after_rollback(self, session) -> None:
+        session.info.pop(self.SESSION_KEY, None)
+
+    def _start_local_worker(self) -> None:
+        if self._app is None and has_app_context():
+            self._app = current_app._get_current_object()
+        if self._app is None or (self._worker is not None and self._worker.is_alive()):
+            self._wakeup.set()
+            return
+
+        def run():
+            while True:
+                self._wakeup.wait(timeout=max(self.queue.debounce, 1.0))
+                self._wakeup.clear()
+                if len(self.queue) == 0:
+                    continue
+                time.sleep(self.queue.debounce)
+                try:
+                    with self._app.app_context():
+                        self.process_due()
+                except Exception as e:
+                    print(f"Erro no processamento da fila de embeddings: {str(e)}")
+
+        self._worker = threading.Thread(target=run, daemon=True)
+        self._worker.start()
+
+# Instância global do pipeline
+embedding_pipeline = EmbeddingPipeline()
+
+def register_embedding_hooks(text_fields: Optional[Tuple[str, ...]] = None) -> None:
+    """Liga os hooks de Produto ao pipeline de embeddings"""
+    from src.models.produto import Produto
+    from src.services.openai_service import OpenAIService
+
+    embedding_pipeline.register(Produto, text_fields or OpenAIService.EMBEDDING_TEXT_FIELDS)
@@ -0,0 +1,89 @@
+import os
+import numpy as np
+from typing import List, Optional
+
+# Formato de armazenamento dos embeddings no modo sem pgvector: 'json', 'float16' ou 'int8'
+# (sempre as 1536 dimensões; o PCA de EMBEDDING_PCA_DIM vale só para o índice local)
+STORAGE_FORMAT = os.getenv('EMBEDDING_STORAGE_FORMAT', 'json')
+
+# Formatos binários: bytes do cabeçalho (escala float32) e tipo dos componentes
+BINARY_FORMATS = {
+    'float32': (0, np.float32),
+    'float16': (0, np.float16),
+    'int8': (4, np.int8),
+}
+
+def encode_vector(vector, formato: str) -> bytes:
+    """Empacota um vetor no formato binário (int8 leva a escala nos 4 primeiros bytes)"""
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+
+    if formato == 'int8':
+        scale = float(np.abs(vector).max()) / 127 or 1.0
+        quantized = np.clip(np.rint(vector / scale), -127, 127).astype(np.int8)
+        return np.float32(scale).tobytes() + quantized.tobytes()
+
+    return vector.astype(BINARY_FORMATS[formato][1]).tobytes()
+
+def decode_vectors(blobs: List[bytes], formato: str, dim: int) -> np.ndarray:
+    """Desempacota vários vetores de uma vez em uma matriz float32 (n, dim)"""
+    if not blobs:
+        return np.empty((0, dim), dtype=np.float32)
+
+    header, dtype = BINARY_FORMATS[formato]
+    row_size = header + dim * np.dtype(dtype).itemsize
+    raw = np.frombuffer(b''.join(blobs), dtype=np.uint8).reshape(len(blobs), row_size)
+
+    matrix = raw[:, header:].copy().view(dtype).astype(np.float32)
+    if header:
+        matrix *= raw[:, :header].copy().view(np.float32)
+
+    return matrix
+
+def quantize_matrix(matrix: np.ndarray, dtype) -> tuple:
+    """Quantiza linhas para o dtype do índice; retorna (matriz, escalas ou None)"""
+    dtype = np.dtype(dtype)
+
+    if dtype == np.int8:
+        scales = np.abs(matrix).max(axis=1) / 127
+        scales[scales == 0] = 1.0
+        quantized = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+
+    return matrix.astype(dtype), None
+
+class PCAProjection:
+    """Projeção PCA para reduzir a dimensão dos vetores do índice local"""
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray):
+        self.mean = mean.astype(np.float32)
+        self.components = components.astype(np.float32)
+
+    @property
+    def dim(self) -> int:
+        return self.components.shape[0]
+
+    @classmethod
+    def fit(cls, matrix: np.ndarray, dim: int, sample_size: int = 20000, seed: int = 0) -> 'PCAProjection':
+        """Ajusta os `dim` componentes principais em uma amostra das linhas"""
+        if len(matrix) > sample_size:
+            rng = np.random.default_rng(seed)
+            matrix = matrix[np.sort(rng.choice(len(matrix), sample_size, replace=False))]
+
+        mean = matrix.mean(axis=0)
+        _, _, vt = np.linalg.svd(matrix - mean, full_matrices=False)
+        return cls(mean, vt[:dim])
+
+    def transform(self, matrix: np.ndarray) -> np.ndarray:
+        return (matrix - self.mean) @ self.components.T
+
+    def save(self, path: str) -> None:
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, mean=self.mean, components=self.components)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional['PCAProjection']:
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return cls(data['mean'], data['components'])
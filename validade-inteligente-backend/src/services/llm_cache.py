@@ -0,0 +1,229 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+# Diretório do cache em disco (usado quando o Redis não está disponível)
+DEFAULT_CACHE_DIR = os.getenv(
+    'LLM_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'models', 'database', 'llm_cache')
+)
+
+# Limite do cache em disco; acima dele as entradas mais antigas são removidas
+DEFAULT_DISK_MAX_BYTES = int(os.getenv('LLM_CACHE_DISK_MAX_MB', '256')) * 1024 * 1024
+
+# Intervalo mínimo (segundos) entre varreduras do cache em disco
+DISK_PRUNE_INTERVAL = 300
+
+class LLMResponseCache:
+    """Cache de respostas do modelo de chat, com TTL, em Redis ou em disco
+
+    A chave é o hash de (tipo, versão do template, modelo, payload normalizado,
+    temperatura); qualquer mudança nos dados do produto ou no prompt gera uma
+    chave nova. Acertos e falhas são contados por empresa e tipo de chamada.
+    No disco, uma varredura em segundo plano remove as entradas expiradas e
+    as mais antigas quando o diretório passa de `disk_max_bytes`.
+    """
+
+    KEY_PREFIX = 'llm_cache:'
+    METRICS_KEY = 'llm_cache:metricas'
+
+    def __init__(self, ttl: int = None, cache_dir: str = None, redis_url: str = None,
+                 disk_max_bytes: int = None):
+        self.enabled = os.getenv('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+        self.ttl = ttl or int(os.getenv('LLM_CACHE_TTL', '21600'))
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.disk_max_bytes = disk_max_bytes or DEFAULT_DISK_MAX_BYTES
+        self._lock = threading.Lock()
+        self._metrics: Dict[Optional[int], Dict[str, int]] = {}
+        self._redis = None
+        self._last_prune = 0.0
+        self._pruning = False
+
+        redis_url = redis_url or os.getenv('REDIS_URL')
+        if REDIS_AVAILABLE and redis_url:
+            try:
+                client = redis.Redis.from_url(redis_url, socket_timeout=0.5)
+                client.ping()
+                self._redis = client
+            except Exception as e:
+                print(f"Cache LLM: Redis indisponível, usando disco ({str(e)})")
+
+    @staticmethod
+    def make_key(tipo: str, template_version: str, model: str, payload: Any, temperature: float) -> str:
+        """Gera a chave do cache a partir dos parâmetros que determinam a resposta"""
+        normalized = json.dumps(
+            [tipo, template_version, model, payload, round(float(temperature), 3)],
+            sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str
+        )
+        return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+    def get(self, key: str, tipo: str, empresa_id: int = None) -> Optional[Dict[str, Any]]:
+        """Retorna a resposta em cache (ou None) e registra acerto/falha da empresa"""
+        if not self.enabled:
+            return None
+
+        entry = None
+        try:
+            entry = self._redis_get(key) if self._redis is not None else self._disk_get(key)
+        except Exception as e:
+            print(f"Erro ao ler cache LLM: {str(e)}")
+
+        if entry is None:
+            self._count(empresa_id, tipo, 'misses')
+            return None
+
+        self._count(empresa_id, tipo, 'hits')
+        self._count(empresa_id, tipo, 'tokens_economizados', entry.get('tokens', 0))
+        return entry['resultado']
+
+    def set(self, key: str, resultado: Dict[str, Any], tokens: int = 0) -> None:
+        """Armazena uma resposta bem-sucedida do modelo"""
+        if not self.enabled:
+            return
+
+        entry = {'resultado': resultado, 'tokens': tokens, 'expira_em': time.time() + self.ttl}
+        try:
+            if self._redis is not None:
+                self._redis.setex(self.KEY_PREFIX + key, self.ttl, json.dumps(entry, default=str))
+            else:
+                self._disk_set(key, entry)
+        except Exception as e:
+            print(f"Erro ao gravar cache LLM: {str(e)}")
+
+    def stats(self, empresa_id: int = None) -> Dict[str, Dict[str, Any]]:
+        """Acertos, falhas, taxa de acerto e tokens economizados da empresa por tipo de chamada"""
+        raw = None
+        if self._redis is not None:
+            try:
+                raw = {k.decode(): int(v) for k, v in self._redis.hgetall(self._metrics_key(empresa_id)).items()}
+            except Exception:
+                pass
+        if raw is None:
+            with self._lock:
+                raw = dict(self._metrics.get(empresa_id, {}))
+
+        stats: Dict[str, Dict[str, Any]] = {}
+        for name, value in raw.items():
+            tipo, metric = name.rsplit(':', 1)
+            stats.setdefault(tipo, {'hits': 0, 'misses': 0, 'tokens_economizados': 0})[metric] = value
+
+        for values in stats.values():
+            total = values['hits'] + values['misses']
+            values['taxa_acerto'] = round(values['hits'] / total, 4) if total else 0.0
+
+        return stats
+
+    def prune(self) -> Dict[str, int]:
+        """Remove do disco as entradas expiradas e, acima do limite, as mais antigas"""
+        now = time.time()
+        entries = []
+        removed = 0
+
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                    # Arquivos temporários órfãos e entradas mais velhas que o TTL
+                    if stat.st_mtime + self.ttl < now or (name.endswith('.tmp') and stat.st_mtime + 60 < now):
+                        os.remove(path)
+                        removed += 1
+                    elif name.endswith('.json'):
+                        entries.append((stat.st_mtime, stat.st_size, path))
+                except OSError:
+                    continue
+
+        total = sum(size for _, size, _ in entries)
+        if total > self.disk_max_bytes:
+            # Remove as mais antigas até ficar em 90% do limite
+            for _, size, path in sorted(entries):
+                if total <= self.disk_max_bytes * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                    removed += 1
+                    total -= size
+                except OSError:
+                    continue
+
+        return {'removidos': removed, 'bytes': total}
+
+    def _metrics_key(self, empresa_id: Optional[int]) -> str:
+        return f'{self.METRICS_KEY}:{empresa_id if empresa_id is not None else "global"}'
+
+    def _count(self, empresa_id: Optional[int], tipo: str, metric: str, amount: int = 1) -> None:
+        if not amount:
+            return
+        name = f'{tipo}:{metric}'
+        if self._redis is not None:
+            try:
+                self._redis.hincrby(self._metrics_key(empresa_id), name, amount)
+                return
+            except Exception:
+                pass
+        with self._lock:
+            metrics = self._metrics.setdefault(empresa_id, {})
+            metrics[name] = metrics.get(name, 0) + amount
+
+    def _redis_get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = self._redis.get(self.KEY_PREFIX + key)
+        return json.loads(raw) if raw else None
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + '.json')
+
+    def _disk_get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._disk_path(key)
+        if not os.path.exists(path):
+            return None
+
+        with open(path, 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+
+        if entry.get('expira_em', 0) < time.time():
+            os.remove(path)
+            return None
+
+        return entry
+
+    def _disk_set(self, key: str, entry: Dict[str, Any]) -> None:
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, path)
+
+        self._schedule_prune()
+
+    def _schedule_prune(self) -> None:
+        """Dispara a varredura do disco em segundo plano, no máximo uma por intervalo"""
+        with self._lock:
+            if self._pruning or time.time() - self._last_prune < DISK_PRUNE_INTERVAL:
+                return
+            self._pruning = True
+            self._last_prune = time.time()
+
+        def run():
+            try:
+                self.prune()
+            except Exception as e:
+                print(f"Erro ao limpar cache LLM em disco: {str(e)}")
+            finally:
+                with self._lock:
+                    self._pruning = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+# Instância global do cache
+llm_cache = LLMResponseCache()
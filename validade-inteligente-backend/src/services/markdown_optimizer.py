@@ -0,0 +1,275 @@
+import os
+import numpy as np
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Any, Dict, List
+from sqlalchemy import func
+from src.models.user import db
+from src.models.produto import HistoricoVenda
+
+# Descontos avaliados (fração do preço) e dias, a partir de hoje, em que o desconto pode começar
+DESCONTOS = np.array([0.0, 0.05, 0.10, 0.15, 0.20, 0.25, 0.30, 0.40, 0.50, 0.60])
+INICIOS = np.array([0, 1, 2, 3, 4, 5, 7, 10, 14, 21, 30, 45, 60])
+
+# Elasticidade-preço usada sem histórico com variação de preço e limites do ajuste
+ELASTICIDADE_PADRAO = float(os.getenv('MARKDOWN_ELASTICIDADE_PADRAO', '1.5'))
+ELASTICIDADE_MIN = 0.3
+ELASTICIDADE_MAX = 4.0
+
+# Desvio-padrão do prior da elasticidade e variância residual assumida com poucas observações
+DESVIO_PRIOR = 0.75
+VARIANCIA_RESIDUAL_PADRAO = 0.5
+
+# Peso do valor de custo das unidades que vencem, frente à receita
+PESO_DESPERDICIO = float(os.getenv('MARKDOWN_PESO_DESPERDICIO', '1.0'))
+
+# Janelas do histórico: ajuste da elasticidade e demanda diária atual
+DIAS_AJUSTE = 180
+DIAS_DEMANDA = 30
+
+# Custo assumido (fração do preço) para produtos sem preço de custo
+CUSTO_PADRAO = 0.6
+
+def _normal_cdf(z: np.ndarray) -> np.ndarray:
+    """Φ(z) vetorizada (erf de Abramowitz-Stegun 7.1.26, erro < 1.5e-7)"""
+    x = np.abs(z) / np.sqrt(2.0)
+    t = 1.0 / (1.0 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1.0 - poly * np.exp(-x * x)
+    return 0.5 * (1.0 + np.sign(z) * erf)
+
+def vendas_esperadas(estoque: np.ndarray, demanda: np.ndarray) -> np.ndarray:
+    """E[min(estoque, N)] com N ~ Poisson(demanda), pela aproximação normal
+
+    E[min(Q, N)] = Λ - σ·L(z), com z = (Q - Λ)/σ e L(z) = φ(z) - z·(1 - Φ(z)).
+    """
+    demanda = np.maximum(demanda, 0.0)
+    sigma = np.sqrt(np.maximum(demanda, 1e-12))
+    z = (estoque - demanda) / sigma
+    perda = np.exp(-0.5 * z * z) / np.sqrt(2 * np.pi) - z * (1.0 - _normal_cdf(z))
+    return np.clip(demanda - sigma * perda, 0.0, np.minimum(estoque, demanda))
+
+def ajustar_elasticidades(x_grupo: np.ndarray, x: np.ndarray, y: np.ndarray, n_grupos: int,
+                          prior: np.ndarray, interceptos: np.ndarray = None) -> np.ndarray:
+    """Elasticidade por grupo: regressão log-log vetorizada, encolhida para o prior
+
+    `x_grupo` indica o grupo de cada observação (log-preço `x`, log-quantidade
+    `y`). A inclinação de cada grupo sai de somas via bincount e é combinada
+    com o prior pelas precisões (Bayes empírico): pouca variação de preço ou
+    vendas muito ruidosas puxam a estimativa para o prior. `interceptos` é o
+    número de médias já removidas de cada grupo (efeitos fixos), descontado
+    dos graus de liberdade do resíduo; o padrão é um intercepto por grupo.
+    """
+    n = np.bincount(x_grupo, minlength=n_grupos).astype(float)
+    sx = np.bincount(x_grupo, weights=x, minlength=n_grupos)
+    sy = np.bincount(x_grupo, weights=y, minlength=n_grupos)
+    sxx = np.bincount(x_grupo, weights=x * x, minlength=n_grupos)
+    syy = np.bincount(x_grupo, weights=y * y, minlength=n_grupos)
+    sxy = np.bincount(x_grupo, weights=x * y, minlength=n_grupos)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n_seguro = np.maximum(n, 1)
+        var_x = np.maximum(sxx - sx * sx / n_seguro, 0.0)
+        var_y = np.maximum(syy - sy * sy / n_seguro, 0.0)
+        cov_xy = sxy - sx * sy / n_seguro
+        com_variacao = var_x > 1e-9
+        estimada = np.where(com_variacao, -cov_xy / var_x, 0.0)
+        residuo = np.where(com_variacao, var_y - cov_xy * cov_xy / var_x, var_y)
+        interceptos = np.ones(n_grupos) if interceptos is None else np.asarray(interceptos, dtype=float)
+        graus = n - interceptos - 1
+        sigma2 = np.where(graus > 0, residuo / np.maximum(graus, 1), VARIANCIA_RESIDUAL_PADRAO)
+
+    # Precisão da inclinação (var_x / σ²) contra a do prior (1 / desvio²)
+    peso_dados = np.where(com_variacao, var_x / np.maximum(sigma2, 1e-6), 0.0)
+    peso_prior = 1.0 / DESVIO_PRIOR ** 2
+    elasticidade = (peso_dados * estimada + peso_prior * prior) / (peso_dados + peso_prior)
+    return np.clip(elasticidade, ELASTICIDADE_MIN, ELASTICIDADE_MAX)
+
+class MarkdownOptimizer:
+    """Escolhe o desconto e o dia de início que maximizam receita menos desperdício
+
+    Para cada produto avalia a grade DESCONTOS × INICIOS até o vencimento:
+    preço cheio até o dia de início e preço com desconto depois, demanda
+    Poisson com elasticidade constante (λ(p) = λ0·(p/p0)^-ε). Todos os
+    produtos e cronogramas são avaliados de uma vez em arrays [produto,
+    desconto, início].
+    """
+
+    def __init__(self, descontos: np.ndarray = None, inicios: np.ndarray = None,
+                 peso_desperdicio: float = None):
+        # O desconto zero (primeiro da grade) é a referência sem desconto
+        descontos = np.asarray(DESCONTOS if descontos is None else descontos, dtype=float)
+        self.descontos = np.unique(np.concatenate([[0.0], descontos]))
+        self.inicios = np.asarray(INICIOS if inicios is None else inicios, dtype=float)
+        self.peso_desperdicio = PESO_DESPERDICIO if peso_desperdicio is None else peso_desperdicio
+
+    def otimizar(self, estoque, preco, custo, dias, demanda_base, elasticidade) -> Dict[str, np.ndarray]:
+        """Otimiza arrays de produtos (todos com o mesmo comprimento); retorna arrays por produto"""
+        Q = np.asarray(estoque, dtype=float)[:, None, None]
+        p0 = np.asarray(preco, dtype=float)[:, None, None]
+        c = np.asarray(custo, dtype=float)[:, None, None]
+        T = np.maximum(np.asarray(dias, dtype=float), 0.0)[:, None, None]
+        lam0 = np.asarray(demanda_base, dtype=float)[:, None, None]
+        eps = np.asarray(elasticidade, dtype=float)[:, None, None]
+
+        d = self.descontos[None, :, None]
+        s = np.minimum(self.inicios[None, None, :], T)
+
+        # Demanda esperada antes e depois do início do desconto
+        lam_desconto = lam0 * (1.0 - d) ** (-eps)
+        demanda_cheio = lam0 * s
+        demanda_total = demanda_cheio + lam_desconto * (T - s)
+
+        vendidos_cheio = vendas_esperadas(Q, demanda_cheio)
+        vendidos_total = vendas_esperadas(Q, demanda_total)
+        desperdicio = Q - vendidos_total
+
+        receita = p0 * vendidos_cheio + p0 * (1.0 - d) * (vendidos_total - vendidos_cheio)
+        objetivo = receita - self.peso_desperdicio * c * desperdicio
+
+        # Inícios a partir do vencimento equivalem a não dar desconto: ficam fora da grade,
+        # assim como as repetições do cronograma sem desconto
+        inicio = self.inicios[None, None, :]
+        valido = np.where(d == 0, inicio == 0, inicio < T)
+        objetivo = np.where(valido, objetivo, -np.inf)
+
+        # Empate: menor desconto (primeiro na grade) e início mais tardio
+        plano = objetivo[:, :, ::-1].reshape(len(objetivo), -1)
+        melhor = np.argmax(plano, axis=1)
+        i_desconto, i_inicio = np.divmod(melhor, len(self.inicios))
+        i_inicio = len(self.inicios) - 1 - i_inicio
+        linhas = np.arange(len(objetivo))
+
+        def escolher(matriz):
+            return np.broadcast_to(matriz, objetivo.shape)[linhas, i_desconto, i_inicio]
+
+        return {
+            'desconto': self.descontos[i_desconto],
+            'inicio_dias': np.minimum(self.inicios[i_inicio], T[:, 0, 0]),
+            'receita_esperada': escolher(receita),
+            'vendas_esperadas': escolher(vendidos_total),
+            'desperdicio_esperado': escolher(desperdicio),
+            'objetivo': escolher(objetivo),
+            # Referência: sem desconto
+            'receita_sem_desconto': receita[:, 0, 0],
+            'desperdicio_sem_desconto': desperdicio[:, 0, 0],
+            'objetivo_sem_desconto': objetivo[:, 0, 0]
+        }
+
+    def otimizar_produtos(self, produtos: List[Any]) -> List[Dict[str, Any]]:
+        """Otimiza uma lista de Produto (duas consultas ao histórico para o lote inteiro)"""
+        produtos = [p for p in produtos if p.quantidade and p.quantidade > 0 and p.preco_venda]
+        if not produtos:
+            return []
+
+        ids = [p.id for p in produtos]
+        preco = np.array([float(p.preco_venda) for p in produtos])
+        custo = np.array([float(p.preco_custo) if p.preco_custo else float(p.preco_venda) * CUSTO_PADRAO
+                          for p in produtos])
+        estoque = np.array([float(p.quantidade) for p in produtos])
+        dias = np.array([float(p.dias_para_vencer) for p in produtos])
+
+        elasticidade, com_historico = self._elasticidades(produtos)
+        demanda_base = self._demanda_base(ids, preco, elasticidade, com_historico)
+
+        resultado = self.otimizar(estoque, preco, custo, dias, demanda_base, elasticidade)
+
+        planos = []
+        for i, produto in enumerate(produtos):
+            desconto = float(resultado['desconto'][i])
+            planos.append({
+                'produto_id': produto.id,
+                'desconto_percentual': round(desconto * 100, 1),
+                'inicio_em_dias': int(resultado['inicio_dias'][i]),
+                'preco_promocional': round(float(preco[i]) * (1 - desconto), 2),
+                'elasticidade': round(float(elasticidade[i]), 3),
+                'demanda_diaria': round(float(demanda_base[i]), 3),
+                'vendas_esperadas': round(float(resultado['vendas_esperadas'][i]), 1),
+                'receita_esperada': round(float(resultado['receita_esperada'][i]), 2),
+                'desperdicio_esperado': round(float(resultado['desperdicio_esperado'][i]), 1),
+                'valor_desperdicio': round(float(resultado['desperdicio_esperado'][i] * custo[i]), 2),
+                'ganho_vs_sem_desconto': round(float(resultado['objetivo'][i] - resultado['objetivo_sem_desconto'][i]), 2),
+                'desperdicio_sem_desconto': round(float(resultado['desperdicio_sem_desconto'][i]), 1)
+            })
+        return planos
+
+    def _elasticidades(self, produtos: List[Any]):
+        """Elasticidade por produto (com a da categoria como prior) e máscara de quem tem histórico"""
+        ids = [p.id for p in produtos]
+        posicao = {produto_id: i for i, produto_id in enumerate(ids)}
+        categorias = sorted({p.categoria for p in produtos}, key=str)
+        indice_categoria = {categoria: i for i, categoria in enumerate(categorias)}
+        categoria_produto = np.array([indice_categoria[p.categoria] for p in produtos])
+
+        # Uma observação por produto e dia: quantidade do dia e preço médio praticado
+        rows = db.session.query(
+            HistoricoVenda.produto_id,
+            func.sum(HistoricoVenda.quantidade_vendida),
+            func.sum(HistoricoVenda.receita_total)
+        ).filter(
+            HistoricoVenda.produto_id.in_(ids),
+            HistoricoVenda.data_venda >= date.today() - timedelta(days=DIAS_AJUSTE)
+        ).group_by(HistoricoVenda.produto_id, HistoricoVenda.data_venda).all()
+
+        rows = [(posicao[pid], qtd, receita) for pid, qtd, receita in rows if qtd and qtd > 0 and receita and receita > 0]
+        if not rows:
+            return np.full(len(produtos), ELASTICIDADE_PADRAO), np.zeros(len(produtos), dtype=bool)
+
+        produto_obs = np.array([r[0] for r in rows])
+        quantidade = np.array([float(r[1]) for r in rows])
+        receita = np.array([float(r[2]) for r in rows])
+        x = np.log(receita / quantidade)
+        y = np.log(quantidade)
+
+        # Prior da categoria pelo estimador within: log-preço e log-quantidade centrados
+        # na média de cada produto. Assim só a variação de preço de cada produto conta;
+        # a diferença de nível entre produtos (caro vende pouco, barato vende muito)
+        # não vira elasticidade. Produtos de preço constante não informam a inclinação.
+        n_obs = np.bincount(produto_obs, minlength=len(produtos))
+        n_seguro = np.maximum(n_obs, 1)
+        x_centrado = x - (np.bincount(produto_obs, weights=x, minlength=len(produtos)) / n_seguro)[produto_obs]
+        y_centrado = y - (np.bincount(produto_obs, weights=y, minlength=len(produtos)) / n_seguro)[produto_obs]
+        variacao_preco = np.bincount(produto_obs, weights=x_centrado * x_centrado, minlength=len(produtos)) > 1e-9
+        usadas = variacao_preco[produto_obs]
+
+        prior_categoria = ajustar_elasticidades(
+            categoria_produto[produto_obs[usadas]], x_centrado[usadas], y_centrado[usadas], len(categorias),
+            np.full(len(categorias), ELASTICIDADE_PADRAO),
+            interceptos=np.bincount(categoria_produto[variacao_preco], minlength=len(categorias))
+        )
+        elasticidade = ajustar_elasticidades(produto_obs, x, y, len(produtos), prior_categoria[categoria_produto])
+        return elasticidade, n_obs > 0
+
+    def _demanda_base(self, ids: List[int], preco: np.ndarray, elasticidade: np.ndarray,
+                      com_historico: np.ndarray) -> np.ndarray:
+        """Vendas por dia no preço atual (dias sem venda contam como zero)"""
+        rows = db.session.query(
+            HistoricoVenda.produto_id,
+            func.sum(HistoricoVenda.quantidade_vendida),
+            func.sum(HistoricoVenda.receita_total)
+        ).filter(
+            HistoricoVenda.produto_id.in_(ids),
+            HistoricoVenda.data_venda >= date.today() - timedelta(days=DIAS_DEMANDA)
+        ).group_by(HistoricoVenda.produto_id).all()
+
+        vendas = defaultdict(lambda: (0.0, 0.0))
+        vendas.update({pid: (float(qtd or 0), float(receita or 0)) for pid, qtd, receita in rows})
+
+        demanda = np.empty(len(ids))
+        for i, produto_id in enumerate(ids):
+            quantidade, receita = vendas[produto_id]
+            if quantidade <= 0:
+                # Vendeu antes mas não na janela: giro de meia unidade no período
+                demanda[i] = 0.5 / DIAS_DEMANDA if com_historico[i] else np.nan
+                continue
+            # Corrige para o preço atual se o preço médio da janela foi outro
+            preco_medio = receita / quantidade if receita > 0 else preco[i]
+            demanda[i] = quantidade / DIAS_DEMANDA * (preco[i] / preco_medio) ** (-elasticidade[i])
+
+        # Produto sem histórico: mediana dos demais produtos do lote (ou um giro mínimo)
+        conhecida = demanda[~np.isnan(demanda)]
+        padrao = float(np.median(conhecida)) if len(conhecida) else 0.1
+        return np.where(np.isnan(demanda), padrao, demanda)
+
+# Instância global do otimizador
+markdown_optimizer = MarkdownOptimizer()
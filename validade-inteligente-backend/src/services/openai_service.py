@@ -1,25 +1,86 @@
+import os
 import openai
 import json
+import time
+import hashlib
+import threading
 import numpy as np
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from src.models.user import db
 from src.models.produto import Produto
 from src.models.empresa import Empresa
+from src.models.ia_vectorization import EmbeddingProduto, SessaoChat
+from src.services.llm_cache import llm_cache
+from src.services.rate_limiter import TokenBucketLimiter
+from src.services.ai_metering import ai_meter
+from src.services.resilient_client import resilient_caller, is_transient_error
+from src.services.prompt_encoder import prompt_encoder
+from src.services.risk_prefilter import PREFILTRO_PADRAO, avaliar_risco_local, vendas_ultimos_30_dias
 
 class OpenAIService:
     """Serviço para integração com a API da OpenAI"""
     
+    # Versões dos templates de prompt (alterar invalida o cache de respostas)
+    EXPIRY_PROMPT_VERSION = 'expiry-v2'
+    EXPIRY_BATCH_PROMPT_VERSION = 'expiry-batch-v2'
+    PRICING_PROMPT_VERSION = 'pricing-v2'
+    
+    # Colunas de Produto que compõem o texto do embedding (ver _create_product_text);
+    # só campos descritivos, para vendas e ajustes de preço não gerarem novo embedding
+    EMBEDDING_TEXT_FIELDS = ('nome', 'descricao', 'categoria_id', 'setor_id', 'fornecedor_id', 'codigo_ean')
+    
     def __init__(self, api_key: str, api_base: str = None):
+        # Prazos e novas tentativas ficam a cargo do ResilientCaller (sem retry interno do SDK)
+        self.request_timeout = float(os.getenv('OPENAI_TIMEOUT', '30'))
+        self.chat_timeout = float(os.getenv('OPENAI_CHAT_TIMEOUT', '20'))
+        self.chat_max_retries = int(os.getenv('OPENAI_MAX_RETRIES', '2'))
         self.client = openai.OpenAI(
             api_key=api_key,
-            base_url=api_base
+            base_url=api_base,
+            timeout=self.request_timeout,
+            max_retries=0
         )
+        self.resilience = resilient_caller
         self.embedding_model = "text-embedding-ada-002"
         self.chat_model = "gpt-4"
         self.max_tokens = 4000
+        self.expiry_temperature = 0.3
+        self.pricing_temperature = 0.4
+        
+        # Chamadas de chat em lote: concorrência, prazo por item e cotas da API
+        self.chat_max_workers = int(os.getenv('OPENAI_MAX_CONCURRENCY', '8'))
+        self.chat_item_timeout = float(os.getenv('OPENAI_ITEM_TIMEOUT', '60'))
+        self.chat_expected_completion_tokens = 600
+        self.rate_limiter = TokenBucketLimiter()
+        
+        # Alertas inteligentes: vários produtos por prompt, dentro do orçamento de tokens
+        self.alert_batching = os.getenv('OPENAI_ALERT_BATCHING', 'true').lower() == 'true'
+        self.alert_batch_max_items = 40
+        self.alert_batch_input_tokens = 6000
+        self.alert_result_tokens = 80
+        
+        # Contexto do chat: produtos recuperados por similaridade e resumo da empresa em cache
+        self.chat_context_top_k = 8
+        self._company_stats_cache: Dict[int, tuple] = {}
+        
+        # Histórico do chat: últimas mensagens na janela de tokens; as anteriores viram resumo,
+        # fora da requisição, quando acumulam `chat_summary_min_batch` mensagens
+        self.chat_history_max_messages = 20
+        self.chat_summary_batch = 50
+        self.chat_summary_min_batch = int(os.getenv('CHAT_RESUMO_MIN_MENSAGENS', '10'))
+        self._summaries_scheduled: Dict[int, float] = {}
+        self._summaries_lock = threading.Lock()
+        
+        # Limites do lote de embeddings (por requisição à API)
+        self.embedding_batch_size = 2048
+        self.embedding_batch_max_chars = 400000
+        self.embedding_max_workers = 4
+        self.embedding_max_retries = 5
     
-    def generate_embedding(self, text: str) -> List[float]:
+    def generate_embedding(self, text: str, empresa_id: int = None) -> List[float]:
         """Gera embedding para um texto"""
         try:
             # Limpar e preparar o texto
@@ -28,7 +89,8 @@ class OpenAIService:
             if not clean_text:
                 return [0.0] * 1536  # Embedding vazio padrão
             
-            response = self.client.embeddings.create(
+            response = self._metered(
+                'embedding', empresa_id, self.client.embeddings.create,
                 input=clean_text,
                 model=self.embedding_model
             )
@@ -39,19 +101,199 @@ class OpenAIService:
             print(f"Erro ao gerar embedding: {str(e)}")
             return [0.0] * 1536  # Retornar embedding vazio em caso de erro
     
+    def generate_embeddings_batch(self, texts: List[str], empresa_id: int = None) -> List[Optional[List[float]]]:
+        """Gera embeddings para vários textos, agrupando-os em lotes por requisição
+        
+        Os lotes são enviados com concorrência limitada e novas tentativas com
+        backoff exponencial. Retorna uma lista alinhada com `texts`; itens cujo
+        lote falhou definitivamente ficam como None.
+        """
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        
+        pending = []
+        for index, text in enumerate(texts):
+            clean_text = self._clean_text(text)
+            if clean_text:
+                pending.append((index, clean_text))
+            else:
+                results[index] = [0.0] * 1536  # Embedding vazio padrão
+        
+        batches = self._pack_embedding_batches(pending)
+        if not batches:
+            return results
+        
+        embed_batch = partial(self._embed_batch_with_retry, empresa_id=empresa_id)
+        with self._executor(min(self.embedding_max_workers, len(batches))) as executor:
+            for batch, embeddings in zip(batches, executor.map(embed_batch, batches)):
+                if embeddings is None:
+                    continue
+                for (index, _), embedding in zip(batch, embeddings):
+                    results[index] = embedding
+        
+        return results
+    
+    def generate_product_embeddings_batch(self, produtos: List[Produto]) -> List[Optional[List[float]]]:
+        """Gera embeddings para vários produtos em lote"""
+        return self.generate_embeddings_batch(
+            [self._create_product_text(p) for p in produtos], self._single_empresa(produtos)
+        )
+    
+    def embedding_content_hash(self, text: str) -> str:
+        """Hash SHA-256 do texto enviado à API + modelo, chave do cache de embeddings"""
+        # Mesmo texto que generate_embeddings_batch envia (sem outra normalização)
+        clean_text = self._clean_text(text)
+        return hashlib.sha256(f"{self.embedding_model}|{clean_text}".encode('utf-8')).hexdigest()
+    
+    def upsert_product_embeddings(self, produtos: List[Produto], force_regenerate: bool = False) -> List[Dict[str, Any]]:
+        """Gera e grava (sem commit) os embeddings de vários produtos
+        
+        Produtos cujo texto não mudou são ignorados, e textos já embedados por
+        qualquer produto/empresa são reaproveitados pelo hash de conteúdo; só os
+        textos inéditos vão para a API, em lote.
+        """
+        if not produtos:
+            return []
+        
+        existing_embeddings = {
+            embedding.produto_id: embedding
+            for embedding in EmbeddingProduto.query.filter(
+                EmbeddingProduto.produto_id.in_([p.id for p in produtos])
+            ).all()
+        }
+        
+        texts = {p.id: self._create_product_text(p) for p in produtos}
+        hashes = {produto_id: self.embedding_content_hash(text) for produto_id, text in texts.items()}
+        
+        results = []
+        to_process = []
+        
+        for produto in produtos:
+            existing = existing_embeddings.get(produto.id)
+            if (existing and not force_regenerate and
+                    existing.hash_conteudo == hashes[produto.id] and
+                    existing.versao_modelo == self.embedding_model):
+                results.append({
+                    'produto_id': produto.id,
+                    'status': 'skipped',
+                    'message': 'Embedding já está atualizado'
+                })
+            else:
+                to_process.append(produto)
+        
+        # Cache por hash de conteúdo (ignorado ao forçar regeneração)
+        cached = {} if force_regenerate else EmbeddingProduto.find_by_content_hashes(
+            {hashes[p.id] for p in to_process}, self.embedding_model
+        )
+        
+        # Textos inéditos, sem repetição, vão para a API em lote
+        missing = {}
+        for produto in to_process:
+            if hashes[produto.id] not in cached:
+                missing.setdefault(hashes[produto.id], texts[produto.id])
+        
+        generated = dict(zip(missing.keys(), self.generate_embeddings_batch(
+            list(missing.values()), self._single_empresa(to_process)
+        )))
+        
+        new_embeddings = []
+        for produto in to_process:
+            content_hash = hashes[produto.id]
+            if content_hash in cached:
+                embedding_array = cached[content_hash].get_embedding_array()
+            elif generated.get(content_hash) is not None:
+                embedding_array = np.array(generated[content_hash])
+            else:
+                results.append({
+                    'produto_id': produto.id,
+                    'produto_nome': produto.nome,
+                    'status': 'error',
+                    'error': 'Falha ao gerar embedding'
+                })
+                continue
+            
+            existing = existing_embeddings.get(produto.id)
+            if existing:
+                # Atualizar embedding existente
+                existing.set_embedding_array(embedding_array)
+                existing.updated_at = datetime.now()
+                existing.versao_modelo = self.embedding_model
+                existing.hash_conteudo = content_hash
+            else:
+                # Criar novo embedding
+                new_embedding = EmbeddingProduto(
+                    produto_id=produto.id,
+                    versao_modelo=self.embedding_model,
+                    hash_conteudo=content_hash,
+                    metadados={
+                        'produto_nome': produto.nome,
+                        'categoria': produto.categoria.nome if produto.categoria else None
+                    }
+                )
+                new_embedding.set_embedding_array(embedding_array)
+                new_embeddings.append(new_embedding)
+            
+            results.append({
+                'produto_id': produto.id,
+                'produto_nome': produto.nome,
+                'status': 'success',
+                'cached': content_hash in cached
+            })
+        
+        db.session.add_all(new_embeddings)
+        return results
+    
+    def _pack_embedding_batches(self, items: List[tuple]) -> List[List[tuple]]:
+        """Agrupa (índice, texto) respeitando o limite de entradas e de tamanho por requisição"""
+        batches = []
+        current = []
+        current_chars = 0
+        
+        for item in items:
+            size = len(item[1])
+            if current and (len(current) >= self.embedding_batch_size or
+                            current_chars + size > self.embedding_batch_max_chars):
+                batches.append(current)
+                current = []
+                current_chars = 0
+            current.append(item)
+            current_chars += size
+        
+        if current:
+            batches.append(current)
+        
+        return batches
+    
+    def _embed_batch_with_retry(self, batch: List[tuple], empresa_id: int = None) -> Optional[List[List[float]]]:
+        """Envia um lote à API de embeddings, repetindo falhas transitórias com backoff"""
+        try:
+            response = self._metered(
+                'embedding', empresa_id, self.client.embeddings.create,
+                retries=self.embedding_max_retries - 1,
+                input=[text for _, text in batch],
+                model=self.embedding_model
+            )
+            
+            # A API devolve um item por entrada, identificado pelo índice
+            data = sorted(response.data, key=lambda item: item.index)
+            return [item.embedding for item in data]
+            
+        except Exception as e:
+            print(f"Erro ao gerar lote de embeddings ({len(batch)} textos): {str(e)}")
+            return None
+    
     def generate_product_embedding(self, produto: Produto) -> List[float]:
         """Gera embedding específico para um produto"""
         try:
             # Criar texto descritivo do produto
             product_text = self._create_product_text(produto)
-            return self.generate_embedding(product_text)
+            return self.generate_embedding(product_text, getattr(produto, 'empresa_id', None))
             
         except Exception as e:
             print(f"Erro ao gerar embedding do produto {produto.id}: {str(e)}")
             return [0.0] * 1536
     
     def _create_product_text(self, produto: Produto) -> str:
-        """Cria texto descritivo do produto para embedding"""
+        """Cria texto descritivo do produto para embedding (sem preço, validade ou estoque)"""
         parts = []
         
         if produto.nome:
@@ -72,110 +314,160 @@ class OpenAIService:
         if produto.codigo_ean:
             parts.append(f"EAN: {produto.codigo_ean}")
         
-        if produto.preco_venda:
-            parts.append(f"Preço: R$ {produto.preco_venda}")
-        
-        if produto.data_validade:
-            parts.append(f"Validade: {produto.data_validade}")
-        
-        if produto.estoque_atual is not None:
-            parts.append(f"Estoque: {produto.estoque_atual}")
-        
         return " | ".join(parts)
     
     def predict_expiry_risk(self, produto: Produto) -> Dict[str, Any]:
         """Prediz risco de vencimento usando IA"""
-        try:
-            # Preparar dados do produto
-            product_data = self._prepare_product_data(produto)
-            
-            # Criar prompt para análise
-            prompt = self._create_expiry_prediction_prompt(product_data)
-            
-            response = self.client.chat.completions.create(
-                model=self.chat_model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Você é um especialista em gestão de estoque e prevenção de perdas no varejo alimentar. Analise os dados do produto e forneça uma avaliação precisa do risco de vencimento."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                max_tokens=self.max_tokens,
-                temperature=0.3,
-                response_format={"type": "json_object"}
-            )
-            
-            result = json.loads(response.choices[0].message.content)
-            
-            # Adicionar timestamp e produto ID
-            result['produto_id'] = produto.id
-            result['timestamp'] = datetime.now().isoformat()
-            result['modelo_utilizado'] = self.chat_model
-            
-            return result
-            
-        except Exception as e:
-            print(f"Erro na predição de vencimento: {str(e)}")
-            return {
+        return self._run_chat_request(self._prepare_expiry_request(produto))[0]
+    
+    def predict_expiry_risk_batch(self, produtos: List[Produto]) -> List[tuple]:
+        """Prediz risco de vencimento de vários produtos em paralelo
+        
+        Retorna [(resultado, tempo_ms)] na mesma ordem de `produtos`.
+        """
+        return self._run_chat_requests([self._prepare_expiry_request(p) for p in produtos])
+    
+    def generate_pricing_suggestions(self, produto: Produto) -> Dict[str, Any]:
+        """Gera sugestões de preços usando IA"""
+        return self._run_chat_request(self._prepare_pricing_request(produto))[0]
+    
+    def generate_pricing_suggestions_batch(self, produtos: List[Produto]) -> List[tuple]:
+        """Gera sugestões de preços para vários produtos em paralelo
+        
+        Retorna [(resultado, tempo_ms)] na mesma ordem de `produtos`.
+        """
+        return self._run_chat_requests([self._prepare_pricing_request(p) for p in produtos])
+    
+    def _prepare_expiry_request(self, produto: Produto) -> Dict[str, Any]:
+        """Monta a chamada de predição de vencimento (acessa o banco; roda na thread da requisição)"""
+        product_data = self._prepare_product_data(produto)
+        
+        return {
+            'tipo': 'expiry_risk',
+            'produto_id': produto.id,
+            'empresa_id': getattr(produto, 'empresa_id', None),
+            'cache_key': llm_cache.make_key(
+                'expiry_risk', self.EXPIRY_PROMPT_VERSION, self.chat_model,
+                self._cache_payload(product_data), self.expiry_temperature
+            ),
+            'system': "Você é um especialista em gestão de estoque e prevenção de perdas no varejo alimentar. Analise os dados do produto e forneça uma avaliação precisa do risco de vencimento.",
+            'prompt': self._create_expiry_prediction_prompt(product_data),
+            'temperature': self.expiry_temperature,
+            'erro_log': 'Erro na predição de vencimento',
+            'fallback': {
                 'risco_nivel': 'medio',
                 'risco_score': 0.5,
                 'dias_estimados': 7,
                 'recomendacoes': ['Monitorar produto regularmente'],
-                'confianca': 0.0,
-                'erro': str(e)
+                'confianca': 0.0
             }
+        }
     
-    def generate_pricing_suggestions(self, produto: Produto) -> Dict[str, Any]:
-        """Gera sugestões de preços usando IA"""
-        try:
-            # Buscar produtos similares
-            similar_products = self._find_similar_products(produto)
-            
-            # Preparar dados para análise
-            pricing_data = {
-                'produto': self._prepare_product_data(produto),
-                'produtos_similares': [self._prepare_product_data(p) for p in similar_products],
-                'mercado_info': self._get_market_context(produto)
+    def _prepare_pricing_request(self, produto: Produto) -> Dict[str, Any]:
+        """Monta a chamada de sugestão de preços (acessa o banco; roda na thread da requisição)"""
+        # Buscar produtos similares
+        similar_products = self._find_similar_products(produto)
+        
+        # Preparar dados para análise
+        pricing_data = {
+            'produto': self._prepare_product_data(produto),
+            'produtos_similares': [self._prepare_product_data(p) for p in similar_products],
+            'mercado_info': self._get_market_context(produto)
+        }
+        
+        return {
+            'tipo': 'pricing',
+            'produto_id': produto.id,
+            'empresa_id': getattr(produto, 'empresa_id', None),
+            'cache_key': llm_cache.make_key(
+                'pricing', self.PRICING_PROMPT_VERSION, self.chat_model,
+                self._cache_payload(pricing_data), self.pricing_temperature
+            ),
+            'system': "Você é um especialista em precificação de produtos no varejo. Analise os dados fornecidos e sugira estratégias de preços otimizadas.",
+            'prompt': self._create_pricing_prompt(pricing_data),
+            'temperature': self.pricing_temperature,
+            'erro_log': 'Erro na sugestão de preços',
+            'fallback': {
+                'preco_sugerido': float(produto.preco_venda) if produto.preco_venda else 0,
+                'margem_sugerida': 20.0,
+                'estrategia': 'manter_atual',
+                'justificativa': 'Erro na análise de IA',
+                'confianca': 0.0
             }
+        }
+    
+    def _run_chat_request(self, chat_request: Dict[str, Any]) -> tuple:
+        """Executa uma chamada preparada (cache, limitador e modelo); retorna (resultado, tempo_ms)
+        
+        Não acessa o banco, podendo rodar em threads do executor. O item tem um
+        único prazo (`chat_item_timeout`) para a espera no limitador e todas as
+        tentativas da chamada.
+        """
+        start_time = time.time()
+        prazo = time.monotonic() + self.chat_item_timeout
+        try:
+            # Produto sem mudanças: reaproveita a resposta anterior do modelo
+            cached = llm_cache.get(chat_request['cache_key'], chat_request['tipo'], chat_request['empresa_id'])
+            if cached is not None:
+                result = self._with_metadata(cached, chat_request['produto_id'], cached=True)
+                elapsed_ms = int((time.time() - start_time) * 1000)
+                ai_meter.record(chat_request['empresa_id'], chat_request['tipo'], self.chat_model,
+                                elapsed_ms, cache_hit=True)
+                return result, elapsed_ms
             
-            prompt = self._create_pricing_prompt(pricing_data)
+            estimated_tokens = (
+                prompt_encoder.estimate_tokens(chat_request['system'] + chat_request['prompt']) +
+                self.chat_expected_completion_tokens
+            )
+            if not self.rate_limiter.acquire(estimated_tokens, timeout=self._restante(prazo)):
+                raise TimeoutError('Limite de requisições da API de IA atingido')
             
-            response = self.client.chat.completions.create(
+            restante = self._restante(prazo)
+            response = self._metered(
+                chat_request['tipo'], chat_request['empresa_id'], self.client.chat.completions.create,
+                deadline=restante,
                 model=self.chat_model,
                 messages=[
                     {
                         "role": "system",
-                        "content": "Você é um especialista em precificação de produtos no varejo. Analise os dados fornecidos e sugira estratégias de preços otimizadas."
+                        "content": chat_request['system']
                     },
                     {
                         "role": "user",
-                        "content": prompt
+                        "content": chat_request['prompt']
                     }
                 ],
                 max_tokens=self.max_tokens,
-                temperature=0.4,
-                response_format={"type": "json_object"}
+                temperature=chat_request['temperature'],
+                response_format={"type": "json_object"},
+                timeout=restante
             )
             
             result = json.loads(response.choices[0].message.content)
-            result['produto_id'] = produto.id
-            result['timestamp'] = datetime.now().isoformat()
             
-            return result
+            used_tokens = self._total_tokens(response)
+            if used_tokens:
+                self.rate_limiter.refund(estimated_tokens - used_tokens)
+            llm_cache.set(chat_request['cache_key'], result, used_tokens)
+            
+            # Adicionar timestamp e produto ID
+            result = self._with_metadata(result, chat_request['produto_id'], cached=False)
             
         except Exception as e:
-            print(f"Erro na sugestão de preços: {str(e)}")
-            return {
-                'preco_sugerido': float(produto.preco_venda) if produto.preco_venda else 0,
-                'margem_sugerida': 20.0,
-                'estrategia': 'manter_atual',
-                'justificativa': 'Erro na análise de IA',
-                'confianca': 0.0
-            }
+            print(f"{chat_request['erro_log']}: {str(e)}")
+            # `fallback` marca o resultado padrão: as rotas não o gravam como predição
+            result = dict(chat_request['fallback'], erro=str(e), fallback=True)
+        
+        return result, int((time.time() - start_time) * 1000)
+    
+    def _run_chat_requests(self, chat_requests: List[Dict[str, Any]]) -> List[tuple]:
+        """Executa chamadas preparadas com concorrência limitada, mantendo a ordem de entrada"""
+        if len(chat_requests) <= 1:
+            return [self._run_chat_request(chat_request) for chat_request in chat_requests]
+        
+        # Cada item já tem prazo próprio (limitador + timeout da chamada)
+        with self._executor(min(self.chat_max_workers, len(chat_requests))) as executor:
+            return list(executor.map(self._run_chat_request, chat_requests))
     
     def analyze_inventory_patterns(self, empresa_id: int) -> Dict[str, Any]:
         """Analisa padrões de estoque usando IA"""
@@ -186,14 +478,15 @@ class OpenAIService:
             ).limit(100).all()
             
             if not produtos:
-                return {'erro': 'Nenhum produto encontrado'}
+                return {'erro': 'Nenhum produto encontrado', 'fallback': True}
             
             # Preparar dados agregados
             inventory_data = self._prepare_inventory_analysis_data(produtos)
             
             prompt = self._create_inventory_analysis_prompt(inventory_data)
             
-            response = self.client.chat.completions.create(
+            response = self._metered(
+                'inventory', empresa_id, self.client.chat.completions.create,
                 model=self.chat_model,
                 messages=[
                     {
@@ -223,11 +516,16 @@ class OpenAIService:
                 'insights': ['Erro na análise'],
                 'recomendacoes': ['Verificar dados'],
                 'score_otimizacao': 0.0,
-                'erro': str(e)
+                'erro': str(e),
+                'fallback': True
             }
     
     def generate_smart_alerts(self, empresa_id: int) -> List[Dict[str, Any]]:
         """Gera alertas inteligentes baseados em IA"""
+        return self.generate_smart_alerts_report(empresa_id)['alertas']
+    
+    def generate_smart_alerts_report(self, empresa_id: int) -> Dict[str, Any]:
+        """Gera alertas inteligentes e as estatísticas de chamadas ao modelo"""
         try:
             # Buscar produtos com risco de vencimento
             from datetime import date
@@ -240,11 +538,30 @@ class OpenAIService:
                 Produto.data_validade.isnot(None)
             ).all()
             
+            # Casos óbvios resolvidos localmente; só os ambíguos vão para o modelo
+            empresa = Empresa.query.get(empresa_id)
+            config = empresa.get_risk_prefilter_config() if empresa else dict(PREFILTRO_PADRAO)
+            vendas = vendas_ultimos_30_dias([p.id for p in produtos_risco]) if config['ativo'] else {}
+            
+            analyses = {}
+            para_modelo = []
+            for produto in produtos_risco:
+                analise = avaliar_risco_local(self._prepare_product_data(produto), vendas.get(produto.id, 0), config)
+                if analise is None:
+                    para_modelo.append(produto)
+                else:
+                    analyses[produto.id] = dict(analise, produto_id=produto.id, timestamp=datetime.now().isoformat())
+            
+            # Analisar os ambíguos em lotes (um prompt para vários produtos)
+            model_analyses, estatisticas = self.predict_expiry_risk_multi(para_modelo)
+            analyses.update(model_analyses)
+            estatisticas['produtos'] = len(produtos_risco)
+            estatisticas['resolvidos_localmente'] = len(produtos_risco) - len(para_modelo)
+            
             alerts = []
             
             for produto in produtos_risco:
-                # Analisar cada produto
-                risk_analysis = self.predict_expiry_risk(produto)
+                risk_analysis = analyses[produto.id]
                 
                 if risk_analysis.get('risco_score', 0) > 0.6:
                     alert = {
@@ -262,28 +579,106 @@ class OpenAIService:
                     }
                     alerts.append(alert)
             
-            return alerts
+            return {'alertas': alerts, 'estatisticas': estatisticas}
             
         except Exception as e:
             print(f"Erro ao gerar alertas inteligentes: {str(e)}")
-            return []
+            return {'alertas': [], 'estatisticas': {}}
     
-    def chat_with_data(self, empresa_id: int, question: str, context: Dict = None) -> Dict[str, Any]:
-        """Chat inteligente com dados da empresa"""
-        try:
-            # Buscar contexto relevante
-            if not context:
-                context = self._get_company_context(empresa_id)
+    def predict_expiry_risk_multi(self, produtos: List[Produto]) -> tuple:
+        """Prediz risco de vencimento agrupando vários produtos por prompt
+        
+        O tamanho de cada lote se adapta ao orçamento de tokens; produtos que o
+        modelo não devolver de forma válida são refeitos com chamadas
+        individuais. Retorna ({produto_id: análise}, estatísticas).
+        """
+        analyses = {}
+        estatisticas = {'produtos': len(produtos), 'cache': 0, 'lotes': 0, 'chamadas_individuais': 0}
+        
+        pendentes = []
+        for produto in produtos:
+            record = self._compact_expiry_record(self._prepare_product_data(produto))
+            cache_key = llm_cache.make_key(
+                'expiry_risk_lote', self.EXPIRY_BATCH_PROMPT_VERSION, self.chat_model,
+                self._cache_payload(record), self.expiry_temperature
+            )
+            cached = llm_cache.get(cache_key, 'expiry_risk_lote', getattr(produto, 'empresa_id', None))
+            if cached is not None:
+                analyses[produto.id] = self._with_metadata(cached, produto.id, cached=True)
+                estatisticas['cache'] += 1
+                ai_meter.record(getattr(produto, 'empresa_id', None), 'expiry_risk_lote',
+                                self.chat_model, 0, cache_hit=True)
+            else:
+                pendentes.append((produto, record, cache_key))
+        
+        if self.alert_batching and len(pendentes) > 1:
+            batches = self._pack_expiry_batches(pendentes)
+            estatisticas['lotes'] = len(batches)
             
-            # Criar prompt contextualizado
-            prompt = self._create_chat_prompt(question, context)
+            with self._executor(min(self.chat_max_workers, len(batches))) as executor:
+                for batch, parsed in zip(batches, executor.map(self._run_expiry_batch, batches)):
+                    for produto, _, _ in batch:
+                        if produto.id in parsed:
+                            analyses[produto.id] = self._with_metadata(parsed[produto.id], produto.id, cached=False)
+        
+        # Falha de parse ou produto ausente na resposta: chamada individual
+        individuais = [produto for produto, _, _ in pendentes if produto.id not in analyses]
+        for produto, (result, _) in zip(individuais, self.predict_expiry_risk_batch(individuais)):
+            analyses[produto.id] = result
+            estatisticas['cache' if result.get('cache_llm') else 'chamadas_individuais'] += 1
+        
+        estatisticas['chamadas_llm'] = estatisticas['lotes'] + estatisticas['chamadas_individuais']
+        return analyses, estatisticas
+    
+    def _compact_expiry_record(self, product_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Registro enxuto do produto para o prompt em lote (só campos usados na análise)"""
+        keys = ('id', 'nome', 'categoria', 'dias_ate_vencimento', 'estoque_atual',
+                'estoque_minimo', 'preco_custo', 'preco_venda')
+        return {key: product_data[key] for key in keys if product_data.get(key) is not None}
+    
+    def _pack_expiry_batches(self, pendentes: List[tuple]) -> List[List[tuple]]:
+        """Agrupa produtos em lotes pelo orçamento de tokens de entrada e de resposta"""
+        max_items = max(1, min(self.alert_batch_max_items, self.max_tokens // self.alert_result_tokens))
+        
+        batches = []
+        current = []
+        current_tokens = 0
+        
+        for item in pendentes:
+            tokens = prompt_encoder.estimate_tokens(prompt_encoder.encode(item[1]))
+            if current and (len(current) >= max_items or
+                            current_tokens + tokens > self.alert_batch_input_tokens):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(item)
+            current_tokens += tokens
+        
+        if current:
+            batches.append(current)
+        
+        return batches
+    
+    def _run_expiry_batch(self, batch: List[tuple]) -> Dict[int, Dict[str, Any]]:
+        """Envia um lote em um único prompt; retorna {produto_id: análise} dos itens válidos"""
+        prompt = self._create_expiry_batch_prompt([record for _, record, _ in batch])
+        estimated_tokens = prompt_encoder.estimate_tokens(prompt) + len(batch) * self.alert_result_tokens
+        prazo = time.monotonic() + self.chat_item_timeout
+        
+        try:
+            if not self.rate_limiter.acquire(estimated_tokens, timeout=self._restante(prazo)):
+                raise TimeoutError('Limite de requisições da API de IA atingido')
             
-            response = self.client.chat.completions.create(
+            restante = self._restante(prazo)
+            response = self._metered(
+                'expiry_risk_lote', self._single_empresa([produto for produto, _, _ in batch]),
+                self.client.chat.completions.create,
+                deadline=restante,
                 model=self.chat_model,
                 messages=[
                     {
                         "role": "system",
-                        "content": "Você é um assistente especializado em gestão de estoque e validade de produtos. Use os dados fornecidos para responder de forma precisa e útil."
+                        "content": "Você é um especialista em gestão de estoque e prevenção de perdas no varejo alimentar. Avalie o risco de vencimento de cada produto de forma independente."
                     },
                     {
                         "role": "user",
@@ -291,6 +686,47 @@ class OpenAIService:
                     }
                 ],
                 max_tokens=self.max_tokens,
+                temperature=self.expiry_temperature,
+                response_format={"type": "json_object"},
+                timeout=restante
+            )
+            
+            used_tokens = self._total_tokens(response)
+            if used_tokens:
+                self.rate_limiter.refund(estimated_tokens - used_tokens)
+            
+            items = json.loads(response.choices[0].message.content).get('produtos')
+            
+        except Exception as e:
+            print(f"Erro no lote de predições de vencimento ({len(batch)} produtos): {str(e)}")
+            return {}
+        
+        expected = {produto.id: cache_key for produto, _, cache_key in batch}
+        parsed = {}
+        
+        for item in items if isinstance(items, list) else []:
+            try:
+                produto_id = int(item.pop('id'))
+                item['risco_score'] = float(item['risco_score'])
+            except (AttributeError, KeyError, TypeError, ValueError):
+                continue
+            
+            if produto_id in expected and produto_id not in parsed:
+                parsed[produto_id] = item
+                llm_cache.set(expected[produto_id], item, used_tokens // len(batch))
+        
+        return parsed
+    
+    def chat_with_data(self, empresa_id: int, question: str, context: Dict = None,
+                       history: List[Dict[str, str]] = None) -> Dict[str, Any]:
+        """Chat inteligente com dados da empresa"""
+        try:
+            response = self._metered(
+                'chat', empresa_id, self.client.chat.completions.create,
+                timeout=self.chat_timeout, hedge=True,
+                model=self.chat_model,
+                messages=self._build_chat_messages(empresa_id, question, context, history),
+                max_tokens=self.max_tokens,
                 temperature=0.5
             )
             
@@ -299,7 +735,8 @@ class OpenAIService:
                 'empresa_id': empresa_id,
                 'pergunta': question,
                 'timestamp': datetime.now().isoformat(),
-                'modelo': self.chat_model
+                'modelo': self.chat_model,
+                'tokens_utilizados': self._total_tokens(response) or None
             }
             
         except Exception as e:
@@ -309,6 +746,263 @@ class OpenAIService:
                 'erro': str(e)
             }
     
+    def stream_chat_with_data(self, empresa_id: int, question: str, context: Dict = None,
+                              history: List[Dict[str, str]] = None):
+        """Chat com dados da empresa em streaming
+        
+        O contexto é montado antes do primeiro token. Gera eventos
+        {'tipo': 'token', 'conteudo': ...} à medida que o modelo responde e, ao
+        final, {'tipo': 'fim', 'resposta', 'tokens_utilizados', 'modelo'} ou
+        {'tipo': 'erro', ...}.
+        """
+        messages = self._build_chat_messages(empresa_id, question, context, history)
+        
+        def events():
+            parts = []
+            usage = None
+            start_time = time.time()
+            breaker = None
+            try:
+                breaker = self.resilience.stream_guard('chat')
+                stream = self.client.chat.completions.create(
+                    model=self.chat_model,
+                    messages=messages,
+                    max_tokens=self.max_tokens,
+                    temperature=0.5,
+                    stream=True,
+                    stream_options={'include_usage': True},
+                    timeout=self.chat_timeout
+                )
+                
+                for chunk in stream:
+                    # O último chunk traz só o uso de tokens
+                    if getattr(chunk, 'usage', None):
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        parts.append(delta)
+                        yield {'tipo': 'token', 'conteudo': delta}
+
+            except GeneratorExit:
+                # Cliente desconectou no meio da resposta: não conta como falha do provedor
+                if breaker is not None:
+                    breaker.release_probe()
+                raise
+            except Exception as e:
+                print(f"Erro no chat com dados (streaming): {str(e)}")
+                if breaker is not None and is_transient_error(e):
+                    breaker.record_failure()
+                elif breaker is not None:
+                    breaker.release_probe()
+                ai_meter.record(empresa_id, 'chat', self.chat_model,
+                                int((time.time() - start_time) * 1000), erro=True)
+                yield {
+                    'tipo': 'erro',
+                    'resposta': ''.join(parts) or 'Desculpe, ocorreu um erro ao processar sua pergunta.',
+                    'erro': str(e),
+                    'modelo': self.chat_model
+                }
+                return
+            
+            breaker.record_success(time.time() - start_time)
+            resposta = ''.join(parts)
+            if usage is not None:
+                tokens_prompt, tokens_completion = usage.prompt_tokens, usage.completion_tokens
+            else:
+                # API sem uso no stream: estimativa local
+                tokens_prompt = prompt_encoder.estimate_tokens(''.join(m['content'] for m in messages))
+                tokens_completion = prompt_encoder.estimate_tokens(resposta)
+            tokens = tokens_prompt + tokens_completion
+            ai_meter.record(empresa_id, 'chat', self.chat_model, int((time.time() - start_time) * 1000),
+                            tokens_prompt, tokens_completion)
+            
+            yield {
+                'tipo': 'fim',
+                'resposta': resposta,
+                'tokens_utilizados': tokens,
+                'modelo': self.chat_model
+            }
+        
+        return events()
+    
+    def _build_chat_messages(self, empresa_id: int, question: str, context: Dict = None,
+                             history: List[Dict[str, str]] = None) -> List[Dict[str, str]]:
+        """Monta as mensagens do chat com o contexto da empresa e o histórico da sessão"""
+        # Buscar contexto relevante para a pergunta
+        if not context:
+            context = self._get_company_context(empresa_id, question)
+        
+        return [
+            {
+                "role": "system",
+                "content": "Você é um assistente especializado em gestão de estoque e validade de produtos. Use os dados fornecidos para responder de forma precisa e útil."
+            },
+            *(history or []),
+            {
+                "role": "user",
+                "content": self._create_chat_prompt(question, context)
+            }
+        ]
+    
+    def build_chat_history(self, sessao: SessaoChat) -> List[Dict[str, str]]:
+        """Histórico da sessão para o prompt: resumo das mensagens antigas + janela recente
+        
+        As mensagens mais novas entram literalmente até o orçamento de tokens
+        'chat_history'. Não chama o modelo: quando as mensagens que saíram da
+        janela sem resumo chegam a `chat_summary_min_batch`, o resumo é
+        atualizado em segundo plano (até lá elas ficam fora do prompt). Deve
+        ser chamado antes de salvar a pergunta atual.
+        """
+        janela = self._chat_window(sessao)
+        
+        # Mensagens fora da janela e ainda não resumidas: só um lote cheio dispara o resumo
+        if janela:
+            pendentes = sessao.get_messages_between(
+                sessao.resumo_ate_id, janela[0].id, limit=self.chat_summary_min_batch
+            )
+            if len(pendentes) >= self.chat_summary_min_batch:
+                self._schedule_chat_summary(sessao.id)
+        
+        history = []
+        if sessao.resumo_historico:
+            history.append({
+                "role": "system",
+                "content": f"Resumo da conversa anterior: {sessao.resumo_historico}"
+            })
+        for mensagem in janela:
+            history.append({
+                "role": "assistant" if mensagem.tipo == 'assistant' else "user",
+                "content": mensagem.conteudo
+            })
+        return history
+    
+    def _chat_window(self, sessao: SessaoChat) -> List:
+        """Mensagens mais recentes que cabem no orçamento 'chat_history', da mais antiga para a mais nova"""
+        budget = prompt_encoder.budgets.get('chat_history', 1500)
+        
+        janela = []
+        tokens = 0
+        for mensagem in sessao.get_last_messages(self.chat_history_max_messages):
+            mensagem_tokens = prompt_encoder.estimate_tokens(mensagem.conteudo)
+            if janela and tokens + mensagem_tokens > budget:
+                break
+            janela.insert(0, mensagem)
+            tokens += mensagem_tokens
+        return janela
+    
+    def summarize_chat_session(self, sessao_id: int, max_batches: int = 5) -> int:
+        """Incorpora ao resumo da sessão as mensagens que saíram da janela (roda fora da requisição)
+        
+        O resumo é gravado com UPDATE condicional em resumo_ate_id, para que
+        duas execuções simultâneas não sobrescrevam uma à outra. Retorna
+        quantas mensagens foram resumidas.
+        """
+        from sqlalchemy import update
+        
+        resumidas = 0
+        for _ in range(max_batches):
+            sessao = db.session.get(SessaoChat, sessao_id)
+            if sessao is None:
+                break
+            
+            # Mesmo corte da janela do prompt: resume só o que já não entra nela
+            janela = self._chat_window(sessao)
+            if not janela:
+                break
+            
+            fora_da_janela = sessao.get_messages_between(
+                sessao.resumo_ate_id, janela[0].id, limit=self.chat_summary_batch
+            )
+            if not fora_da_janela:
+                break
+            
+            resumo = self._summarize_chat_turns(sessao.empresa_id, sessao.resumo_historico, fora_da_janela)
+            if not resumo:
+                break
+            
+            anterior = sessao.resumo_ate_id
+            resultado = db.session.execute(
+                update(SessaoChat).where(
+                    SessaoChat.id == sessao_id,
+                    SessaoChat.resumo_ate_id.is_(None) if anterior is None else SessaoChat.resumo_ate_id == anterior
+                ).values(
+                    resumo_historico=resumo,
+                    resumo_ate_id=fora_da_janela[-1].id,
+                    updated_at=SessaoChat.updated_at
+                )
+            )
+            db.session.commit()
+            if not resultado.rowcount:
+                break
+            
+            resumidas += len(fora_da_janela)
+            if len(fora_da_janela) < self.chat_summary_batch:
+                break
+        
+        return resumidas
+    
+    def _schedule_chat_summary(self, sessao_id: int) -> None:
+        """Enfileira o resumo da sessão (Celery; sem broker, thread local), no máximo um a cada 5 min"""
+        agora = time.monotonic()
+        with self._summaries_lock:
+            if agora - self._summaries_scheduled.get(sessao_id, float('-inf')) < 300:
+                return
+            self._summaries_scheduled[sessao_id] = agora
+        
+        try:
+            from src.services.tasks import resumir_historico_chat
+            resumir_historico_chat.delay(sessao_id)
+            return
+        except Exception as e:
+            print(f"Resumo do chat em thread local (fila indisponível: {str(e)})")
+        
+        from flask import current_app, has_app_context
+        if not has_app_context():
+            return
+        app = current_app._get_current_object()
+        
+        def run():
+            try:
+                with app.app_context():
+                    self.summarize_chat_session(sessao_id)
+            except Exception as e:
+                print(f"Erro ao resumir histórico do chat: {str(e)}")
+        
+        threading.Thread(target=run, daemon=True).start()
+    
+    def _summarize_chat_turns(self, empresa_id: int, resumo_anterior: Optional[str], mensagens: List) -> Optional[str]:
+        """Incorpora mensagens antigas ao resumo da conversa; None se a chamada falhar"""
+        turnos = '\n'.join(
+            f"{'Assistente' if m.tipo == 'assistant' else 'Usuário'}: {m.conteudo}" for m in mensagens
+        )
+        prompt = f"""
+        Atualize o resumo de uma conversa sobre gestão de estoque, incorporando os novos turnos.
+        Mantenha fatos, números, produtos citados e decisões; no máximo 150 palavras.
+        
+        Resumo atual:
+        {resumo_anterior or '(vazio)'}
+        
+        Novos turnos:
+        {turnos}
+        """
+        
+        try:
+            response = self._metered(
+                'chat_resumo', empresa_id, self.client.chat.completions.create,
+                timeout=self.chat_timeout,
+                model=self.chat_model,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=400,
+                temperature=0.2
+            )
+            return response.choices[0].message.content.strip()
+        
+        except Exception as e:
+            print(f"Erro ao resumir histórico do chat: {str(e)}")
+            return None
+    
     def _clean_text(self, text: str) -> str:
         """Limpa e prepara texto para processamento"""
         if not text:
@@ -340,13 +1034,83 @@ class OpenAIService:
             'codigo_ean': produto.codigo_ean
         }
     
+    def _cache_payload(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Payload normalizado para a chave do cache (sem ids, que não entram na análise)"""
+        if 'produto' in data:
+            return {**data, 'produto': self._cache_payload(data['produto'])}
+        return {key: value for key, value in data.items() if key != 'id'}
+    
+    def _with_metadata(self, result: Dict[str, Any], produto_id: int, cached: bool) -> Dict[str, Any]:
+        """Copia a resposta do modelo adicionando produto, timestamp e origem"""
+        result = dict(result)
+        result['produto_id'] = produto_id
+        result['timestamp'] = datetime.now().isoformat()
+        result['modelo_utilizado'] = self.chat_model
+        result['cache_llm'] = cached
+        return result
+    
+    def _metered(self, tipo: str, empresa_id: Optional[int], create, timeout: float = None,
+                 retries: int = None, hedge: bool = False, deadline: float = None, **kwargs):
+        """Chama a API com prazo, novas tentativas e disjuntor, medindo cada tentativa
+        
+        `deadline` limita o tempo total de todas as tentativas (padrão: timeout
+        por tentativa). Com o circuito aberto levanta AIUnavailableError sem ir
+        à API; os chamadores tratam como qualquer outro erro e devolvem o fallback.
+        """
+        def attempt(**call_kwargs):
+            start_time = time.time()
+            try:
+                response = create(**call_kwargs)
+            except Exception:
+                ai_meter.record(empresa_id, tipo, kwargs.get('model'),
+                                int((time.time() - start_time) * 1000), erro=True)
+                raise
+            
+            usage = getattr(response, 'usage', None)
+            ai_meter.record(
+                empresa_id, tipo, kwargs.get('model'), int((time.time() - start_time) * 1000),
+                getattr(usage, 'prompt_tokens', 0) or 0, getattr(usage, 'completion_tokens', 0) or 0
+            )
+            return response
+        
+        return self.resilience.call(
+            'embedding' if tipo == 'embedding' else 'chat', attempt,
+            timeout=timeout or self.request_timeout,
+            retries=self.chat_max_retries if retries is None else retries,
+            deadline=deadline, hedge=hedge, **kwargs
+        )
+    
+    @staticmethod
+    def _restante(prazo: float) -> float:
+        """Segundos até o prazo do item (monotônico); TimeoutError se já passou"""
+        restante = prazo - time.monotonic()
+        if restante <= 0:
+            raise TimeoutError('Prazo da chamada à API de IA esgotado')
+        return restante
+    
+    def _executor(self, max_workers: int) -> ThreadPoolExecutor:
+        """Executor para chamadas em paralelo (as threads não têm contexto da aplicação)"""
+        ai_meter.bind_current_app()
+        return ThreadPoolExecutor(max_workers=max_workers)
+    
+    @staticmethod
+    def _single_empresa(produtos: List[Produto]) -> Optional[int]:
+        """Empresa dos produtos, se todos forem da mesma (para atribuir o uso da API)"""
+        empresa_ids = {getattr(produto, 'empresa_id', None) for produto in produtos}
+        return empresa_ids.pop() if len(empresa_ids) == 1 else None
+    
+    @staticmethod
+    def _total_tokens(response) -> int:
+        usage = getattr(response, 'usage', None)
+        return getattr(usage, 'total_tokens', 0) or 0
+    
     def _create_expiry_prediction_prompt(self, product_data: Dict) -> str:
         """Cria prompt para predição de vencimento"""
         return f"""
         Analise o seguinte produto e avalie o risco de vencimento:
         
         Dados do Produto:
-        {json.dumps(product_data, indent=2, ensure_ascii=False)}
+        {prompt_encoder.encode(product_data, 'expiry_risk')}
         
         Forneça uma análise em JSON com:
         - risco_nivel: "baixo", "medio", "alto", "critico"
@@ -364,13 +1128,32 @@ class OpenAIService:
         - Histórico de vendas (se disponível)
         """
     
+    def _create_expiry_batch_prompt(self, records: List[Dict]) -> str:
+        """Cria prompt para predição de vencimento de vários produtos"""
+        return f"""
+        Avalie o risco de vencimento de cada produto da tabela abaixo (colunas separadas por |):
+        
+        {prompt_encoder.encode(records)}
+        
+        Responda em JSON no formato {{"produtos": [...]}}, com um item para cada id, contendo:
+        - id: id do produto
+        - risco_nivel: "baixo", "medio", "alto", "critico"
+        - risco_score: número de 0.0 a 1.0
+        - dias_estimados: estimativa de dias até ação necessária
+        - recomendacoes: lista com até 3 ações curtas
+        - confianca: nível de confiança da predição (0.0 a 1.0)
+        
+        Considere dias restantes até o vencimento, quantidade em estoque,
+        valor financeiro em risco e tipo de produto/categoria.
+        """
+    
     def _create_pricing_prompt(self, pricing_data: Dict) -> str:
         """Cria prompt para sugestão de preços"""
         return f"""
         Analise os dados de precificação e sugira estratégias otimizadas:
         
         Dados:
-        {json.dumps(pricing_data, indent=2, ensure_ascii=False)}
+        {prompt_encoder.encode(pricing_data, 'pricing')}
         
         Forneça sugestões em JSON com:
         - preco_sugerido: preço recomendado
@@ -388,7 +1171,7 @@ class OpenAIService:
         Analise os padrões de estoque da empresa:
         
         Dados do Inventário:
-        {json.dumps(inventory_data, indent=2, ensure_ascii=False)}
+        {prompt_encoder.encode(inventory_data, 'inventory')}
         
         Forneça análise em JSON com:
         - insights: principais descobertas
@@ -472,22 +1255,114 @@ class OpenAIService:
         else:
             return f"Monitorar: {produto.nome} vence em {dias_restantes} dias"
     
-    def _get_company_context(self, empresa_id: int) -> Dict[str, Any]:
-        """Obtém contexto da empresa para chat"""
+    def _get_company_context(self, empresa_id: int, question: str = None) -> Dict[str, Any]:
+        """Obtém contexto da empresa para chat: resumo em cache + produtos relevantes à pergunta"""
         empresa = Empresa.query.get(empresa_id)
         if not empresa:
             return {}
         
-        produtos = Produto.query.filter_by(empresa_id=empresa_id, status='ativo').limit(50).all()
-        
-        return {
+        context = {
             'empresa': {
-                'nome': empresa.nome_fantasia or empresa.razao_social,
-                'total_produtos': len(produtos)
+                'nome': empresa.nome_fantasia or empresa.razao_social
             },
-            'produtos_amostra': [self._prepare_product_data(p) for p in produtos[:10]],
-            'estatisticas': self._prepare_inventory_analysis_data(produtos)
+            'estatisticas': self._get_company_stats(empresa_id)
+        }
+        
+        # Produtos em ordem de relevância; o codificador corta os últimos se passar do orçamento
+        context['produtos_relevantes'] = [
+            self._compact_chat_record(self._prepare_product_data(produto))
+            for produto in self._retrieve_relevant_products(empresa_id, question)
+        ]
+        return context
+    
+    def _get_company_stats(self, empresa_id: int) -> Dict[str, Any]:
+        """Resumo estatístico da empresa, recalculado quando os produtos mudam ou vira o dia"""
+        # Impressão digital barata dos dados: dia (vencimentos em 7 dias), contagem e última alteração
+        hoje = date.today()
+        fingerprint = (hoje,) + tuple(db.session.query(
+            db.func.count(Produto.id), db.func.max(Produto.updated_at)
+        ).filter(Produto.empresa_id == empresa_id).one())
+        
+        cached = self._company_stats_cache.get(empresa_id)
+        if cached and cached[0] == fingerprint:
+            return cached[1]
+        
+        stats = self._query_company_stats(empresa_id, hoje)
+        self._company_stats_cache[empresa_id] = (fingerprint, stats)
+        return stats
+    
+    def _query_company_stats(self, empresa_id: int, hoje: date) -> Dict[str, Any]:
+        """Mesmo resumo de _prepare_inventory_analysis_data, em uma consulta agregada por categoria"""
+        from src.models.loja import Categoria
+        
+        valor = db.case(
+            (db.and_(Produto.preco_venda != 0, Produto.estoque_atual != 0),
+             Produto.preco_venda * Produto.estoque_atual),
+            else_=0
+        )
+        linhas = db.session.query(
+            Categoria.nome,
+            db.func.count(Produto.id),
+            db.func.sum(valor),
+            db.func.sum(db.case((Produto.data_validade <= hoje + timedelta(days=7), 1), else_=0)),
+            db.func.sum(db.case((Produto.estoque_atual == 0, 1), else_=0)),
+            db.func.sum(db.case((db.and_(
+                Produto.estoque_atual != 0, Produto.estoque_minimo != 0,
+                Produto.estoque_atual <= Produto.estoque_minimo
+            ), 1), else_=0))
+        ).outerjoin(Categoria, Categoria.id == Produto.categoria_id).filter(
+            Produto.empresa_id == empresa_id,
+            Produto.status == 'ativo'
+        ).group_by(Categoria.nome).all()
+        
+        stats = {
+            'total_produtos': 0,
+            'produtos_vencendo_7dias': 0,
+            'valor_total_estoque': 0.0,
+            'distribuicao_categorias': {},
+            'produtos_sem_estoque': 0,
+            'produtos_estoque_baixo': 0
         }
+        for nome, total, valor_categoria, vencendo, sem_estoque, estoque_baixo in linhas:
+            categoria = stats['distribuicao_categorias'].setdefault(nome or 'Sem categoria', {'count': 0, 'valor': 0})
+            categoria['count'] += total
+            categoria['valor'] += float(valor_categoria or 0)
+            stats['total_produtos'] += total
+            stats['valor_total_estoque'] += float(valor_categoria or 0)
+            stats['produtos_vencendo_7dias'] += int(vencendo or 0)
+            stats['produtos_sem_estoque'] += int(sem_estoque or 0)
+            stats['produtos_estoque_baixo'] += int(estoque_baixo or 0)
+        return stats
+    
+    def _retrieve_relevant_products(self, empresa_id: int, question: str = None) -> List[Produto]:
+        """Produtos mais próximos da pergunta no índice vetorial (ou os que vencem primeiro)"""
+        produtos = []
+        
+        if question:
+            embedding = self.generate_embedding(question, empresa_id)
+            if any(embedding):
+                matches = EmbeddingProduto.find_similar(
+                    embedding, limit=self.chat_context_top_k, empresa_id=empresa_id
+                )
+                ids = [match.produto_id for match, _ in matches]
+                if ids:
+                    by_id = {p.id: p for p in Produto.query.filter(Produto.id.in_(ids)).all()}
+                    produtos = [by_id[produto_id] for produto_id in ids if produto_id in by_id]
+        
+        if not produtos:
+            produtos = Produto.query.filter(
+                Produto.empresa_id == empresa_id,
+                Produto.status == 'ativo',
+                Produto.data_validade.isnot(None)
+            ).order_by(Produto.data_validade).limit(self.chat_context_top_k).all()
+        
+        return produtos
+    
+    def _compact_chat_record(self, product_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Registro enxuto do produto para o contexto do chat"""
+        keys = ('nome', 'categoria', 'setor', 'fornecedor', 'data_validade', 'dias_ate_vencimento',
+                'estoque_atual', 'estoque_minimo', 'preco_custo', 'preco_venda', 'lote')
+        return {key: product_data[key] for key in keys if product_data.get(key) is not None}
     
     def _create_chat_prompt(self, question: str, context: Dict) -> str:
         """Cria prompt para chat contextualizado"""
@@ -495,7 +1370,7 @@ class OpenAIService:
         Pergunta do usuário: {question}
         
         Contexto da empresa:
-        {json.dumps(context, indent=2, ensure_ascii=False)}
+        {prompt_encoder.encode(context, 'chat')}
         
         Responda de forma clara e útil, usando os dados fornecidos quando relevante.
         Se a pergunta não puder ser respondida com os dados disponíveis, seja transparente sobre isso.
@@ -503,10 +1378,28 @@ class OpenAIService:
 
 # Instância global do serviço
 openai_service = None
+_init_lock = threading.Lock()
 
 def init_openai_service(api_key: str, api_base: str = None):
     """Inicializa o serviço da OpenAI"""
     global openai_service
     openai_service = OpenAIService(api_key, api_base)
+    
+    # Embeddings passam a acompanhar as mudanças de produtos em segundo plano
+    from src.services.embedding_pipeline import register_embedding_hooks
+    register_embedding_hooks()
+    
+    return openai_service
+
+def get_openai_service() -> Optional[OpenAIService]:
+    """Retorna o serviço, inicializando-o por OPENAI_API_KEY/OPENAI_API_BASE no primeiro uso
+    
+    Processos que não passam pela inicialização da aplicação web (workers
+    Celery) obtêm o serviço por aqui. Sem chave configurada, retorna None.
+    """
+    if openai_service is None and os.getenv('OPENAI_API_KEY'):
+        with _init_lock:
+            if openai_service is None:
+                init_openai_service(os.getenv('OPENAI_API_KEY'), os.getenv('OPENAI_API_BASE'))
     return openai_service
 
@@ -0,0 +1,337 @@
+import os
+import re
+import threading
+import unicodedata
+import numpy as np
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+from sqlalchemy import func, literal, or_, text
+from src.models.user import db
+from src.models.produto import Produto
+
+# Constante k da reciprocal rank fusion (peso de cada posição = 1 / (k + posição))
+RRF_K = int(os.getenv('SEARCH_RRF_K', '60'))
+
+# Score léxico (0-1) a partir do qual um resultado conta como acerto forte
+LEXICAL_STRONG_SCORE = float(os.getenv('SEARCH_LEXICAL_STRONG_SCORE', '0.45'))
+
+# Acertos fortes necessários para responder sem consultar a API de embeddings
+LEXICAL_MIN_HITS = int(os.getenv('SEARCH_LEXICAL_MIN_HITS', '3'))
+
+# Acerto de nome completo (full-text) com score a partir deste dispensa a API mesmo com poucos resultados
+LEXICAL_EXACT_SCORE = float(os.getenv('SEARCH_LEXICAL_EXACT_SCORE', '0.8'))
+
+# Candidatos avaliados por lista antes da fusão
+CANDIDATES_PER_LIST = 50
+
+FTS_CONFIG = 'portuguese'
+
+_CODIGO_RE = re.compile(r'^\d{8,14}$')
+
+def normalizar_texto(texto: str) -> str:
+    """Minúsculas, sem acentos e só com letras/dígitos separados por espaço"""
+    texto = unicodedata.normalize('NFKD', texto or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', texto).split())
+
+def trigramas(texto: str) -> set:
+    """Trigramas no formato do pg_trgm (cada palavra com dois espaços à esquerda e um à direita)"""
+    resultado = set()
+    for palavra in texto.split():
+        palavra = f'  {palavra} '
+        resultado.update(palavra[i:i + 3] for i in range(len(palavra) - 2))
+    return resultado
+
+def score_trigramas(consulta: str, nome: str) -> float:
+    """Maior entre a similaridade de trigramas e a cobertura da consulta pelo nome
+
+    Equivale a GREATEST(similarity, word_similarity) do pg_trgm: consultas
+    curtas ("leite") ainda pontuam alto contra nomes longos.
+    """
+    tq, tn = trigramas(consulta), trigramas(nome)
+    if not tq or not tn:
+        return 0.0
+    comuns = len(tq & tn)
+    return max(comuns / len(tq | tn), comuns / len(tq))
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = RRF_K) -> List[Tuple[int, float]]:
+    """Funde listas ordenadas de ids somando 1 / (k + posição) em cada uma"""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for posicao, produto_id in enumerate(ranking, start=1):
+            scores[produto_id] = scores.get(produto_id, 0.0) + 1.0 / (k + posicao)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+class IndiceTrigramas:
+    """Índice invertido de trigramas dos nomes normalizados (busca léxica sem pg_trgm)
+
+    Os nomes passam por normalizar_texto, então 'pao' encontra 'Pão' e
+    'ACUCAR' encontra 'Açúcar' sem depender de LIKE/lower do banco. A pontuação
+    é a mesma de score_trigramas, calculada para todos os nomes de uma vez.
+    """
+
+    def __init__(self, ids: List[int], nomes: List[str]):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.nomes = [normalizar_texto(nome) for nome in nomes]
+        self.tamanhos = np.zeros(len(self.ids), dtype=np.float64)
+
+        postings = defaultdict(list)
+        for posicao, nome in enumerate(self.nomes):
+            tg = trigramas(nome)
+            self.tamanhos[posicao] = len(tg)
+            for trigrama in tg:
+                postings[trigrama].append(posicao)
+        self.postings = {trigrama: np.asarray(posicoes, dtype=np.int64) for trigrama, posicoes in postings.items()}
+
+    def buscar(self, normalizada: str, limite: int) -> List[Tuple[int, str, float]]:
+        """[(produto_id, nome_normalizado, score)] dos `limite` nomes de maior score"""
+        tq = trigramas(normalizada)
+        listas = [self.postings[trigrama] for trigrama in tq if trigrama in self.postings]
+        if not listas:
+            return []
+
+        comuns = np.bincount(np.concatenate(listas), minlength=len(self.ids))
+        candidatos = np.flatnonzero(comuns)
+        c = comuns[candidatos].astype(np.float64)
+        scores = np.maximum(c / (len(tq) + self.tamanhos[candidatos] - c), c / len(tq))
+
+        ordem = np.argsort(-scores, kind='stable')[:limite]
+        return [(int(self.ids[candidatos[i]]), self.nomes[candidatos[i]], float(scores[i])) for i in ordem]
+
+def coluna_codigo_barras():
+    """Coluna de código de barras do modelo de produto"""
+    return getattr(Produto, 'codigo_ean', None) or getattr(Produto, 'codigo_barras', None)
+
+class HybridProductSearch:
+    """Busca de produtos léxica primeiro, vetorial só quando necessário
+
+    1. Código de barras (8-14 dígitos) com correspondência exata responde
+       sozinho.
+    2. Nome por trigramas e full-text (pg_trgm/tsvector no PostgreSQL;
+       trigramas calculados em Python nos demais bancos).
+    3. Se a busca léxica não trouxer acertos fortes suficientes, a consulta
+       vira embedding e os resultados vetoriais são fundidos aos léxicos por
+       reciprocal rank fusion.
+    """
+
+    def __init__(self):
+        self._pg_trgm: Dict[str, bool] = {}
+        # Índices de trigramas por empresa: {empresa_id: (impressão digital, IndiceTrigramas)}
+        self._indices_locais: Dict[int, tuple] = {}
+        self._indices_lock = threading.Lock()
+
+    def search(self, empresa_id: int, query: str, limit: int = 10, modo: str = 'auto',
+               ai_service=None) -> Dict[str, Any]:
+        """Busca produtos ativos da empresa
+
+        `modo`: 'auto' (vetorial só com pouco recall léxico), 'lexica' (nunca
+        chama a API) ou 'hibrida' (sempre funde com a busca vetorial).
+        """
+        consulta = (query or '').strip()
+
+        codigo = re.sub(r'[\s.-]', '', consulta)
+        if _CODIGO_RE.match(codigo):
+            produtos = self._buscar_por_codigo(empresa_id, codigo)
+            if produtos:
+                return self._resposta('codigo', [
+                    (produto, {'match': 'codigo', 'lexical_score': 1.0}) for produto in produtos[:limit]
+                ])
+
+        lexicos = self._buscar_lexico(empresa_id, consulta)
+        usar_vetorial = modo == 'hibrida' or (modo == 'auto' and not self._recall_suficiente(lexicos, limit))
+
+        vetoriais: Dict[int, float] = {}
+        if usar_vetorial and ai_service is not None:
+            vetoriais = self._buscar_vetorial(empresa_id, consulta, ai_service)
+
+        rankings = [
+            sorted(lexicos, key=lambda pid: lexicos[pid]['trgm'], reverse=True),
+            sorted((pid for pid in lexicos if lexicos[pid]['fts'] > 0),
+                   key=lambda pid: lexicos[pid]['fts'], reverse=True),
+            list(vetoriais)
+        ]
+        fundidos = reciprocal_rank_fusion([r for r in rankings if r])
+
+        if not fundidos:
+            return self._resposta('hibrida' if vetoriais else 'lexica', [])
+
+        ids = [produto_id for produto_id, _ in fundidos[:limit * 2]]
+        produtos = {
+            p.id: p for p in Produto.query.filter(
+                Produto.id.in_(ids),
+                Produto.empresa_id == empresa_id,
+                Produto.status == 'ativo'
+            ).all()
+        }
+
+        resultados = []
+        for produto_id, score in fundidos:
+            produto = produtos.get(produto_id)
+            if produto is None:
+                continue
+            info = {'rrf_score': round(score, 6)}
+            if produto_id in lexicos:
+                info['match'] = 'nome'
+                info['lexical_score'] = round(lexicos[produto_id]['trgm'], 4)
+            if produto_id in vetoriais:
+                info.setdefault('match', 'semantico')
+                info['similarity_score'] = round(vetoriais[produto_id], 4)
+            resultados.append((produto, info))
+            if len(resultados) >= limit:
+                break
+
+        return self._resposta('hibrida' if vetoriais else 'lexica', resultados)
+
+    def _recall_suficiente(self, lexicos: Dict[int, Dict[str, Any]], limit: int) -> bool:
+        """Decide se a busca léxica basta (sem chamar a API de embeddings)"""
+        fortes = [info for info in lexicos.values() if info['forte']]
+        if len(fortes) >= min(limit, LEXICAL_MIN_HITS):
+            return True
+        # Nome buscado por inteiro: poucos produtos com esse nome, mas a resposta é essa
+        return any(info['fts'] > 0 and info['trgm'] >= LEXICAL_EXACT_SCORE for info in fortes)
+
+    def _resposta(self, estrategia: str, resultados: List[Tuple[Produto, Dict[str, Any]]]) -> Dict[str, Any]:
+        return {'estrategia': estrategia, 'resultados': resultados}
+
+    def _buscar_por_codigo(self, empresa_id: int, codigo: str) -> List[Produto]:
+        coluna = coluna_codigo_barras()
+        if coluna is None:
+            return []
+        return Produto.query.filter(
+            coluna == codigo,
+            Produto.empresa_id == empresa_id,
+            Produto.status == 'ativo'
+        ).all()
+
+    def _buscar_lexico(self, empresa_id: int, consulta: str) -> Dict[int, Dict[str, Any]]:
+        """Candidatos por nome: {produto_id: {'trgm', 'fts', 'forte'}}"""
+        normalizada = normalizar_texto(consulta)
+        if not normalizada:
+            return {}
+
+        if self._has_pg_trgm():
+            return self._buscar_lexico_postgres(empresa_id, consulta)
+        return self._buscar_lexico_local(empresa_id, normalizada)
+
+    def _buscar_lexico_postgres(self, empresa_id: int, consulta: str) -> Dict[int, Dict[str, Any]]:
+        # Mantém os acentos: os nomes no banco não passam por unaccent
+        termo = ' '.join(consulta.lower().split())
+        nome = func.lower(Produto.nome)
+        tsvector = func.to_tsvector(FTS_CONFIG, Produto.nome)
+        tsquery = func.plainto_tsquery(FTS_CONFIG, consulta)
+        trgm = func.greatest(func.similarity(nome, termo), func.word_similarity(termo, nome))
+        fts = func.ts_rank(tsvector, tsquery)
+
+        rows = db.session.query(Produto.id, trgm.label('trgm'), fts.label('fts')).filter(
+            Produto.empresa_id == empresa_id,
+            Produto.status == 'ativo',
+            or_(nome.op('%')(termo), literal(termo).op('<%')(nome), tsvector.op('@@')(tsquery))
+        ).order_by(trgm.desc()).limit(CANDIDATES_PER_LIST).all()
+
+        return {
+            produto_id: {
+                'trgm': float(score_trgm or 0),
+                'fts': float(score_fts or 0),
+                'forte': float(score_trgm or 0) >= LEXICAL_STRONG_SCORE or float(score_fts or 0) > 0
+            }
+            for produto_id, score_trgm, score_fts in rows
+        }
+
+    def _buscar_lexico_local(self, empresa_id: int, normalizada: str) -> Dict[int, Dict[str, Any]]:
+        """Sem pg_trgm: pontua todos os nomes da empresa no índice de trigramas em memória"""
+        resultados = {}
+        for produto_id, nome_normalizado, score in self._indice_local(empresa_id).buscar(
+                normalizada, CANDIDATES_PER_LIST * 10):
+            # Todas as palavras da consulta presentes no nome: equivalente ao match full-text
+            tokens = set(nome_normalizado.split())
+            fts = 1.0 if all(p in tokens for p in normalizada.split()) else 0.0
+            if score > 0.2 or fts:
+                resultados[produto_id] = {'trgm': score, 'fts': fts,
+                                          'forte': score >= LEXICAL_STRONG_SCORE or fts > 0}
+
+        melhores = sorted(resultados, key=lambda pid: resultados[pid]['trgm'], reverse=True)
+        return {pid: resultados[pid] for pid in melhores[:CANDIDATES_PER_LIST]}
+
+    def _indice_local(self, empresa_id: int) -> IndiceTrigramas:
+        """Índice de trigramas da empresa, reconstruído só quando os produtos mudam"""
+        filtros = (Produto.empresa_id == empresa_id, Produto.status == 'ativo')
+        fingerprint = tuple(db.session.query(
+            func.count(Produto.id), func.max(Produto.updated_at)
+        ).filter(*filtros).one())
+
+        with self._indices_lock:
+            cached = self._indices_locais.get(empresa_id)
+        if cached and cached[0] == fingerprint:
+            return cached[1]
+
+        rows = db.session.query(Produto.id, Produto.nome).filter(*filtros).all()
+        indice = IndiceTrigramas([row[0] for row in rows], [row[1] for row in rows])
+        with self._indices_lock:
+            self._indices_locais[empresa_id] = (fingerprint, indice)
+        return indice
+
+    def _buscar_vetorial(self, empresa_id: int, consulta: str, ai_service) -> Dict[int, float]:
+        """{produto_id: similaridade} em ordem de similaridade"""
+        from src.models.ia_vectorization import EmbeddingProduto
+
+        embedding = ai_service.generate_embedding(consulta, empresa_id)
+        if not any(embedding):
+            return {}
+
+        similares = EmbeddingProduto.find_similar(embedding, limit=CANDIDATES_PER_LIST, empresa_id=empresa_id)
+        return {e.produto_id: float(similaridade) for e, similaridade in similares}
+
+    def _has_pg_trgm(self) -> bool:
+        """Verifica (uma vez por banco) se o PostgreSQL tem a extensão pg_trgm"""
+        engine = db.engine
+        if engine.dialect.name != 'postgresql':
+            return False
+
+        chave = str(engine.url)
+        if chave not in self._pg_trgm:
+            try:
+                self._pg_trgm[chave] = db.session.execute(
+                    text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                ).first() is not None
+            except Exception as e:
+                print(f"Erro ao verificar extensão pg_trgm: {str(e)}")
+                self._pg_trgm[chave] = False
+        return self._pg_trgm[chave]
+
+def create_search_indexes():
+    """Cria extensão pg_trgm e índices GIN de trigramas/full-text para a busca de produtos
+
+    Chamada na inicialização da aplicação (src/models/main.py); sem ela o
+    PostgreSQL não tem pg_trgm e a busca cai no índice em memória.
+    """
+    try:
+        # Nos demais bancos a busca usa o índice de trigramas em memória
+        if db.engine.dialect.name != 'postgresql':
+            return
+
+        db.session.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm;'))
+        db.session.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_produtos_nome_trgm
+            ON produtos USING gin (lower(nome) gin_trgm_ops);
+        """))
+        db.session.execute(text(f"""
+            CREATE INDEX IF NOT EXISTS idx_produtos_nome_fts
+            ON produtos USING gin (to_tsvector('{FTS_CONFIG}', nome));
+        """))
+
+        coluna = coluna_codigo_barras()
+        if coluna is not None:
+            db.session.execute(text(f"""
+                CREATE INDEX IF NOT EXISTS idx_produtos_{coluna.key}
+                ON produtos ({coluna.key});
+            """))
+
+        db.session.commit()
+        product_search._pg_trgm.clear()
+        print("Índices de busca de produtos criados com sucesso")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Erro ao criar índices de busca: {str(e)}")
+
+# Instância global da busca híbrida
+product_search = HybridProductSearch()
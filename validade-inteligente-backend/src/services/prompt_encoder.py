@@ -0,0 +1,161 @@
+import os
+import re
+import json
+from typing import Any, Dict, List, Optional
+
+# Contagem exata de tokens quando o tiktoken estiver instalado
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+# Orçamento de tokens do payload por tipo de chamada (sobrescrito por PROMPT_BUDGET_<TIPO>)
+DEFAULT_BUDGETS = {
+    'expiry_risk': 600,
+    'expiry_batch': 6000,
+    'pricing': 1500,
+    'inventory': 3000,
+    'chat': 2000,
+    'chat_history': 1500,
+}
+
+_TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]', re.UNICODE)
+
+class PromptEncoder:
+    """Codifica payloads de prompt de forma compacta e dentro de um orçamento de tokens
+
+    Remove nulos e vazios, escreve listas de registros como tabela (cabeçalho
+    + uma linha por item) e, se o texto passar do orçamento do tipo de chamada,
+    corta primeiro os últimos itens das listas (os menos relevantes) e depois
+    encurta textos longos.
+    """
+
+    def __init__(self, budgets: Dict[str, int] = None, model: str = 'gpt-4'):
+        self.budgets = dict(DEFAULT_BUDGETS)
+        for tipo in self.budgets:
+            env_value = os.getenv(f'PROMPT_BUDGET_{tipo.upper()}')
+            if env_value:
+                self.budgets[tipo] = int(env_value)
+        self.budgets.update(budgets or {})
+
+        self._encoding = None
+        if TIKTOKEN_AVAILABLE:
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except Exception:
+                self._encoding = None
+
+    def estimate_tokens(self, text: str) -> int:
+        """Estimativa local de tokens (tiktoken se disponível; senão palavras e pontuação)"""
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        return int(len(_TOKEN_PATTERN.findall(text)) * 1.2) + 1
+
+    def encode(self, data: Any, tipo: Optional[str] = None) -> str:
+        """Codifica o payload; com `tipo`, ajusta-o ao orçamento daquela chamada"""
+        data = self.compact(data)
+        text = self._encode(data)
+
+        budget = self.budgets.get(tipo)
+        if budget is None or self.estimate_tokens(text) <= budget:
+            return text
+
+        # 1) Cortar os últimos itens da maior lista de registros
+        while self.estimate_tokens(text) > budget and self._trim_largest_list(data):
+            text = self._encode(data)
+
+        # 2) Encurtar textos longos
+        limit = 200
+        while self.estimate_tokens(text) > budget and limit >= 20:
+            data = self._truncate_strings(data, limit)
+            text = self._encode(data)
+            limit //= 2
+
+        return text
+
+    def encode_table(self, records: List[Dict[str, Any]]) -> str:
+        """Lista de registros como tabela separada por '|' (cabeçalho + linhas)"""
+        columns = []
+        for record in records:
+            for key in record:
+                if key not in columns:
+                    columns.append(key)
+
+        lines = ['|'.join(columns)]
+        for record in records:
+            lines.append('|'.join(self._cell(record.get(column)) for column in columns))
+        return '\n'.join(lines)
+
+    def compact(self, data: Any) -> Any:
+        """Remove nulos e vazios e arredonda decimais"""
+        if isinstance(data, dict):
+            compacted = {key: self.compact(value) for key, value in data.items()}
+            return {key: value for key, value in compacted.items() if value not in (None, '', [], {})}
+        if isinstance(data, (list, tuple)):
+            return [self.compact(value) for value in data if value is not None]
+        if isinstance(data, float):
+            return round(data, 2)
+        return data
+
+    def _encode(self, data: Any) -> str:
+        if isinstance(data, list) and data and all(isinstance(item, dict) for item in data):
+            return self.encode_table(data)
+
+        if not isinstance(data, dict):
+            return self._cell(data) if not isinstance(data, list) else self._json(data)
+
+        lines = []
+        for key, value in data.items():
+            if isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+                lines.append(f'{key} ({len(value)}):')
+                lines.append(self.encode_table(value))
+            elif isinstance(value, (dict, list)):
+                lines.append(f'{key}: {self._json(value)}')
+            else:
+                lines.append(f'{key}: {value}')
+        return '\n'.join(lines)
+
+    def _trim_largest_list(self, data: Any) -> bool:
+        """Remove ~25% dos itens finais da maior lista de registros; False se não houver o que cortar"""
+        candidates = []
+        containers = [data] + [value for value in data.values() if isinstance(value, dict)] if isinstance(data, dict) else []
+        for container in containers:
+            for key, value in container.items():
+                if isinstance(value, list) and len(value) > 1:
+                    candidates.append((len(value), key, container))
+
+        if not candidates:
+            return False
+
+        size, key, container = max(candidates, key=lambda item: item[0])
+        keep = size - max(1, size // 4)
+        container[key] = container[key][:keep]
+        omitted_key = f'{key}_omitidos'
+        container[omitted_key] = container.get(omitted_key, 0) + size - keep
+        return True
+
+    def _truncate_strings(self, data: Any, limit: int) -> Any:
+        if isinstance(data, dict):
+            return {key: self._truncate_strings(value, limit) for key, value in data.items()}
+        if isinstance(data, list):
+            return [self._truncate_strings(value, limit) for value in data]
+        if isinstance(data, str) and len(data) > limit:
+            return data[:limit] + '...'
+        return data
+
+    @staticmethod
+    def _json(value: Any) -> str:
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=str)
+
+    def _cell(self, value: Any) -> str:
+        if value is None:
+            return ''
+        if isinstance(value, (dict, list)):
+            value = self._json(value)
+        return str(value).replace('|', '/').replace('\n', ' ')
+
+# Instância global do codificador
+prompt_encoder = PromptEncoder()
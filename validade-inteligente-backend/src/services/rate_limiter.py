@@ -0,0 +1,139 @@
+import os
+import time
+import threading
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+# Reabastece e reserva atomicamente no Redis (relógio do servidor, comum a todos os
+# processos); retorna '0' se reservou ou os segundos de espera até haver saldo
+_ACQUIRE_SCRIPT = """
+local rpm = tonumber(ARGV[1])
+local tpm = tonumber(ARGV[2])
+local tokens = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'requests', 'tokens', 'updated')
+local requests = tonumber(state[1]) or rpm
+local saldo = tonumber(state[2]) or tpm
+local elapsed = math.max(0, now - (tonumber(state[3]) or now))
+requests = math.min(rpm, requests + elapsed * rpm / 60)
+saldo = math.min(tpm, saldo + elapsed * tpm / 60)
+local wait = 0
+if requests >= 1 and saldo >= tokens then
+    requests = requests - 1
+    saldo = saldo - tokens
+else
+    wait = math.max((1 - requests) * 60 / rpm, (tokens - saldo) * 60 / tpm, 0.01)
+end
+redis.call('HSET', KEYS[1], 'requests', requests, 'tokens', saldo, 'updated', now)
+redis.call('EXPIRE', KEYS[1], 120)
+return tostring(wait)
+"""
+
+_REFUND_SCRIPT = """
+local saldo = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+if saldo then
+    redis.call('HSET', KEYS[1], 'tokens', math.min(tonumber(ARGV[1]), saldo + tonumber(ARGV[2])))
+end
+return 0
+"""
+
+class TokenBucketLimiter:
+    """Limitador token bucket para as cotas da API (requisições e tokens por minuto)
+
+    Cada chamada consome 1 requisição e uma estimativa de tokens; os baldes são
+    reabastecidos continuamente à taxa da cota. `acquire` bloqueia até haver
+    saldo nos dois baldes ou o prazo acabar. Com Redis os baldes são
+    compartilhados por todos os workers web e Celery (a cota é da conta, não do
+    processo); sem Redis, ou se ele falhar, cada processo usa baldes em memória.
+    """
+
+    REDIS_KEY = 'rate_limit:openai'
+
+    def __init__(self, rpm: int = None, tpm: int = None, redis_url: str = None):
+        self.rpm = rpm or int(os.getenv('OPENAI_RPM_LIMIT', '500'))
+        self.tpm = tpm or int(os.getenv('OPENAI_TPM_LIMIT', '40000'))
+        self._requests = float(self.rpm)
+        self._tokens = float(self.tpm)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._redis = None
+
+        redis_url = redis_url or os.getenv('REDIS_URL')
+        if REDIS_AVAILABLE and redis_url:
+            try:
+                client = redis.Redis.from_url(redis_url, socket_timeout=0.5)
+                client.ping()
+                self._acquire_script = client.register_script(_ACQUIRE_SCRIPT)
+                self._refund_script = client.register_script(_REFUND_SCRIPT)
+                self._redis = client
+            except Exception as e:
+                print(f"Limitador da API: Redis indisponível, usando memória ({str(e)})")
+
+    @property
+    def shared(self) -> bool:
+        """Indica se os baldes são compartilhados entre processos (Redis)"""
+        return self._redis is not None
+
+    def acquire(self, tokens: int = 0, timeout: float = None) -> bool:
+        """Reserva uma requisição e `tokens` tokens; retorna False se o prazo acabar"""
+        tokens = min(tokens, self.tpm)
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            # Tempo até os dois baldes terem saldo suficiente (0 = reservado)
+            wait = self._try_acquire(tokens)
+            if wait <= 0:
+                return True
+
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+
+            time.sleep(wait)
+
+    def refund(self, tokens: int) -> None:
+        """Devolve tokens reservados a mais (estimativa maior que o uso real)"""
+        if tokens <= 0:
+            return
+        if self._redis is not None:
+            try:
+                self._refund_script(keys=[self.REDIS_KEY], args=[self.tpm, tokens])
+                return
+            except Exception as e:
+                print(f"Erro ao devolver tokens no Redis: {str(e)}")
+        with self._lock:
+            self._tokens = min(float(self.tpm), self._tokens + tokens)
+
+    def _try_acquire(self, tokens: int) -> float:
+        if self._redis is not None:
+            try:
+                return float(self._acquire_script(keys=[self.REDIS_KEY], args=[self.rpm, self.tpm, tokens]))
+            except Exception as e:
+                print(f"Erro no limitador da API no Redis, usando memória: {str(e)}")
+
+        with self._lock:
+            self._refill()
+            if self._requests >= 1 and self._tokens >= tokens:
+                self._requests -= 1
+                self._tokens -= tokens
+                return 0.0
+
+            return max(
+                (1 - self._requests) * 60.0 / self.rpm,
+                (tokens - self._tokens) * 60.0 / self.tpm,
+                0.01
+            )
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(float(self.rpm), self._requests + elapsed * self.rpm / 60.0)
+        self._tokens = min(float(self.tpm), self._tokens + elapsed * self.tpm / 60.0)
@@ -0,0 +1,238 @@
+import os
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, Optional
+
+import openai
+
+class AIUnavailableError(Exception):
+    """Chamada recusada sem ir à API (circuito aberto ou limite de chamadas simultâneas)"""
+    pass
+
+def is_transient_error(error: Exception) -> bool:
+    """Indica se o erro da API é transitório (rate limit, timeout, conexão, 5xx)"""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+
+    transient_types = tuple(
+        getattr(openai, name) for name in
+        ('RateLimitError', 'APITimeoutError', 'APIConnectionError', 'InternalServerError')
+        if isinstance(getattr(openai, name, None), type)
+    )
+    if transient_types and isinstance(error, transient_types):
+        return True
+
+    status_code = getattr(error, 'status_code', None)
+    return status_code == 429 or (status_code is not None and status_code >= 500)
+
+class CircuitBreaker:
+    """Disjuntor por tipo de operação (fechado → aberto → meio-aberto)
+
+    Abre após `failure_threshold` falhas transitórias seguidas; aberto, recusa
+    as chamadas imediatamente por `recovery_timeout` segundos. Depois deixa
+    passar uma chamada de teste: sucesso fecha o circuito, falha o reabre.
+    """
+
+    FECHADO = 'fechado'
+    ABERTO = 'aberto'
+    MEIO_ABERTO = 'meio_aberto'
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.FECHADO
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probe_in_flight = False
+        self._latencies = deque(maxlen=200)
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Indica se a chamada pode ir à API"""
+        with self._lock:
+            if self.state == self.ABERTO and time.monotonic() - self.opened_at >= self.recovery_timeout:
+                self.state = self.MEIO_ABERTO
+                self._probe_in_flight = False
+
+            if self.state == self.FECHADO:
+                return True
+            if self.state == self.MEIO_ABERTO and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+
+            self.rejected += 1
+            return False
+
+    def record_success(self, latency: float = None) -> None:
+        with self._lock:
+            self.state = self.FECHADO
+            self.failures = 0
+            self._probe_in_flight = False
+            if latency is not None:
+                self._latencies.append(latency)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.MEIO_ABERTO or self.failures >= self.failure_threshold:
+                if self.state != self.ABERTO:
+                    print(f"Circuito da API de IA aberto após {self.failures} falhas")
+                self.state = self.ABERTO
+                self.opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """Libera a chamada de teste que terminou com erro não transitório"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def latency_percentile(self, p: float) -> Optional[float]:
+        """Percentil das latências recentes de sucesso (segundos)"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < 20:
+            return None
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+    def to_dict(self) -> Dict[str, Any]:
+        p50 = self.latency_percentile(0.5)
+        p95 = self.latency_percentile(0.95)
+        return {
+            'estado': self.state,
+            'falhas_seguidas': self.failures,
+            'chamadas_recusadas': self.rejected,
+            'latencia_p50_ms': int(p50 * 1000) if p50 is not None else None,
+            'latencia_p95_ms': int(p95 * 1000) if p95 is not None else None
+        }
+
+class ResilientCaller:
+    """Executa chamadas à API com prazo, novas tentativas, disjuntor e requisições redundantes
+
+    - Cada tentativa recebe `timeout` (limitado ao prazo total restante), para
+      que um provedor lento não prenda o worker pelo timeout padrão do HTTP.
+    - Erros transitórios são repetidos com backoff exponencial com jitter.
+    - Um disjuntor por operação ('chat', 'embedding') recusa as chamadas
+      enquanto o provedor estiver falhando; quem chama cai no fallback.
+    - Um limite de chamadas simultâneas por processo impede que um incidente
+      do provedor ocupe todas as threads da aplicação.
+    - Com `hedge=True`, se a primeira tentativa passar do p95 recente, uma
+      segunda é disparada e vale a que responder primeiro.
+    """
+
+    def __init__(self, max_in_flight: int = None, failure_threshold: int = None,
+                 recovery_timeout: float = None, hedge_delay: float = None):
+        self.max_in_flight = max_in_flight or int(os.getenv('OPENAI_MAX_IN_FLIGHT', '32'))
+        self.failure_threshold = failure_threshold or int(os.getenv('OPENAI_CIRCUIT_FAILURES', '5'))
+        self.recovery_timeout = recovery_timeout or float(os.getenv('OPENAI_CIRCUIT_RECOVERY', '30'))
+        self.hedge_enabled = os.getenv('OPENAI_HEDGE_ENABLED', 'false').lower() == 'true'
+        self.hedge_delay = hedge_delay or float(os.getenv('OPENAI_HEDGE_DELAY', '3'))
+        self.backoff_base = 0.5
+        self.backoff_max = 8.0
+
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._breakers_lock = threading.Lock()
+        self._in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        self._hedge_executor = None
+
+    def breaker(self, operation: str) -> CircuitBreaker:
+        with self._breakers_lock:
+            if operation not in self._breakers:
+                self._breakers[operation] = CircuitBreaker(self.failure_threshold, self.recovery_timeout)
+            return self._breakers[operation]
+
+    def call(self, operation: str, fn: Callable[..., Any], timeout: float,
+             retries: int = 2, deadline: float = None, hedge: bool = False, **kwargs) -> Any:
+        """Chama `fn(timeout=..., **kwargs)` com as proteções; levanta o último erro"""
+        breaker = self.breaker(operation)
+        deadline_at = time.monotonic() + (deadline or timeout * (retries + 1))
+
+        for attempt in range(retries + 1):
+            # A vaga é reservada antes de consultar o disjuntor: uma chamada de
+            # teste (meio-aberto) nunca fica marcada sem chegar à API
+            if not self._in_flight.acquire(blocking=False):
+                raise AIUnavailableError('Limite de chamadas simultâneas à API de IA atingido')
+
+            try:
+                if not breaker.allow():
+                    raise AIUnavailableError(f'API de IA indisponível ({operation}): circuito aberto')
+
+                remaining = deadline_at - time.monotonic()
+                try:
+                    return self._attempt(breaker, fn, min(timeout, max(remaining, 1.0)), hedge, kwargs)
+                except Exception as e:
+                    if not is_transient_error(e):
+                        breaker.release_probe()
+                        raise
+                    breaker.record_failure()
+                    error = e
+            finally:
+                self._in_flight.release()
+
+            # Backoff com jitter total, sem ultrapassar o prazo total
+            sleep = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+            if attempt == retries or time.monotonic() + sleep >= deadline_at:
+                raise error
+            time.sleep(sleep)
+
+    def stream_guard(self, operation: str) -> CircuitBreaker:
+        """Disjuntor para chamadas em streaming (o chamador registra sucesso/falha ao final)"""
+        breaker = self.breaker(operation)
+        if not breaker.allow():
+            raise AIUnavailableError(f'API de IA indisponível ({operation}): circuito aberto')
+        return breaker
+
+    def status(self) -> Dict[str, Any]:
+        with self._breakers_lock:
+            breakers = dict(self._breakers)
+        return {
+            'circuitos': {operation: breaker.to_dict() for operation, breaker in breakers.items()},
+            'limite_chamadas_simultaneas': self.max_in_flight,
+            'requisicoes_redundantes': self.hedge_enabled
+        }
+
+    def _attempt(self, breaker: CircuitBreaker, fn: Callable[..., Any], timeout: float,
+                 hedge: bool, kwargs: Dict[str, Any]) -> Any:
+        """Uma tentativa (a vaga de chamada simultânea já foi reservada por `call`)"""
+        start = time.monotonic()
+        if hedge and self.hedge_enabled:
+            result = self._hedged(breaker, fn, timeout, kwargs)
+        else:
+            result = fn(timeout=timeout, **kwargs)
+
+        breaker.record_success(time.monotonic() - start)
+        return result
+
+    def _hedged(self, breaker: CircuitBreaker, fn: Callable[..., Any], timeout: float,
+                kwargs: Dict[str, Any]) -> Any:
+        """Dispara uma segunda tentativa se a primeira demorar mais que o p95 recente"""
+        if self._hedge_executor is None:
+            self._hedge_executor = ThreadPoolExecutor(max_workers=self.max_in_flight)
+
+        delay = breaker.latency_percentile(0.95) or self.hedge_delay
+        started = time.monotonic()
+        futures = [self._hedge_executor.submit(fn, timeout=timeout, **kwargs)]
+
+        done, _ = wait(futures, timeout=min(delay, timeout))
+        if not done and breaker.state == CircuitBreaker.FECHADO:
+            futures.append(self._hedge_executor.submit(fn, timeout=timeout, **kwargs))
+
+        # Vale a primeira resposta bem-sucedida; a outra termina em segundo plano
+        error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, timeout - (time.monotonic() - started)),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError('Tempo esgotado aguardando a API de IA')
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+# Instância global (compartilhada pelas chamadas do processo)
+resilient_caller = ResilientCaller()
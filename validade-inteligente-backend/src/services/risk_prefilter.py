@@ -0,0 +1,94 @@
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+from sqlalchemy import func
+from src.models.user import db
+from src.models.produto import HistoricoVenda
+
+# Configuração padrão do pré-filtro (sobrescrita por plano em funcionalidades['prefiltro_risco'])
+PREFILTRO_PADRAO = {
+    'ativo': True,
+    'limite_baixo': 25,   # risco heurístico (0-100) até aqui: resolvido como baixo
+    'limite_alto': 75,    # a partir daqui: resolvido como alto/crítico
+    'margem_giro': 1.5    # vendas previstas até o vencimento / estoque que dispensa o modelo
+}
+
+def fatores_risco_vencimento(dias_para_vencer: int, quantidade: float, vendas_mes: float) -> Dict[str, float]:
+    """Fatores de risco de vencimento (0-100) e o risco total ponderado"""
+    risco_tempo = max(0, min(100, (7 - dias_para_vencer) * 20))  # Risco aumenta nos últimos 7 dias
+    risco_estoque = min(100, quantidade * 2)  # Mais estoque = mais risco
+    risco_rotatividade = 100 - min(100, vendas_mes * 10)  # Baixa rotatividade = alto risco
+
+    risco_total = risco_tempo * 0.5 + risco_estoque * 0.3 + risco_rotatividade * 0.2
+
+    return {
+        'tempo': risco_tempo,
+        'estoque': risco_estoque,
+        'rotatividade': risco_rotatividade,
+        'total': min(100, max(0, risco_total))
+    }
+
+def vendas_ultimos_30_dias(produto_ids: List[int]) -> Dict[int, int]:
+    """Unidades vendidas por produto nos últimos 30 dias (uma consulta agregada)"""
+    if not produto_ids:
+        return {}
+
+    rows = db.session.query(
+        HistoricoVenda.produto_id, func.sum(HistoricoVenda.quantidade_vendida)
+    ).filter(
+        HistoricoVenda.produto_id.in_(produto_ids),
+        HistoricoVenda.data_venda >= date.today() - timedelta(days=30)
+    ).group_by(HistoricoVenda.produto_id).all()
+
+    return {produto_id: int(total or 0) for produto_id, total in rows}
+
+def avaliar_risco_local(product_data: Dict[str, Any], vendas_mes: float,
+                        config: Dict[str, Any] = None) -> Optional[Dict[str, Any]]:
+    """Resolve localmente os casos óbvios de risco de vencimento
+
+    Retorna uma análise no mesmo formato da IA ou None quando o caso é
+    ambíguo e deve ir para o modelo.
+    """
+    config = {**PREFILTRO_PADRAO, **(config or {})}
+    dias = product_data.get('dias_ate_vencimento')
+    estoque = product_data.get('estoque_atual') or 0
+
+    if not config['ativo'] or dias is None:
+        return None
+
+    if estoque <= 0:
+        return _analise('baixo', 0.0, dias, [], 'Produto sem estoque: não há perda possível')
+
+    if dias < 0:
+        return _analise('critico', 1.0, 0,
+                        ['Retirar o produto da área de venda', 'Registrar a perda ou encaminhar para descarte/doação'],
+                        'Produto já vencido')
+
+    vendas_previstas = vendas_mes / 30 * dias
+    if vendas_previstas >= estoque * config['margem_giro']:
+        return _analise('baixo', 0.1, dias, ['Manter reposição normal'],
+                        f'Giro de vendas ({vendas_mes} un/mês) esgota o estoque antes do vencimento')
+
+    risco = fatores_risco_vencimento(dias, estoque, vendas_mes)['total']
+
+    if risco >= config['limite_alto']:
+        nivel = 'critico' if risco >= 90 else 'alto'
+        return _analise(nivel, round(risco / 100, 2), min(dias, 1 if nivel == 'critico' else 3),
+                        ['Aplicar desconto para acelerar a venda', 'Avaliar doação antes do vencimento'],
+                        f'Risco heurístico {risco:.0f}/100 (tempo, estoque e giro)')
+
+    if risco <= config['limite_baixo']:
+        return _analise('baixo', round(risco / 100, 2), dias, ['Monitorar produto regularmente'],
+                        f'Risco heurístico {risco:.0f}/100 (tempo, estoque e giro)')
+
+    return None
+
+def _analise(nivel: str, score: float, dias: int, recomendacoes: List[str], justificativa: str) -> Dict[str, Any]:
+    return {
+        'risco_nivel': nivel,
+        'risco_score': score,
+        'dias_estimados': dias,
+        'recomendacoes': recomendacoes,
+        'justificativa': justificativa,
+        'confianca': 0.9,
+        'origem': 'heuristica'
+    }
@@ -0,0 +1,200 @@
+import os
+from celery import Celery
+from celery.schedules import crontab
+
+# Aplicação Celery usada pelos jobs agendados (celery -A src.services.tasks worker --beat)
+celery_app = Celery(
+    'validade_inteligente',
+    broker=os.getenv('REDIS_URL', 'redis://localhost:6379/0'),
+    backend=os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+)
+
+celery_app.conf.timezone = os.getenv('TIMEZONE', 'America/Sao_Paulo')
+celery_app.conf.beat_schedule = {
+    'atualizar-status-produtos': {
+        'task': 'tasks.atualizar_status_produtos',
+        'schedule': crontab(hour=0, minute=5)
+    },
+    'gerar-alertas-vencimento': {
+        'task': 'tasks.gerar_alertas_vencimento',
+        'schedule': crontab(hour=0, minute=15)
+    },
+    'simular-perdas-vencimento': {
+        'task': 'tasks.simular_perdas_vencimento',
+        'schedule': crontab(hour=1, minute=0)
+    },
+    'enviar-digest-alertas': {
+        'task': 'tasks.enviar_digest_alertas',
+        'schedule': crontab(hour=7, minute=0)
+    },
+    'reconstruir-indices-vetoriais': {
+        'task': 'tasks.reconstruir_indices_vetoriais',
+        'schedule': crontab(hour=3, minute=0)
+    },
+    'processar-fila-embeddings': {
+        'task': 'tasks.processar_fila_embeddings',
+        'schedule': crontab(minute='*')
+    },
+    'detectar-produtos-duplicados': {
+        'task': 'tasks.detectar_produtos_duplicados',
+        'schedule': crontab(hour=4, minute=0, day_of_week='sunday')
+    }
+}
+
+def _app_context():
+    """Retorna o contexto da aplicação Flask para uso dentro das tasks"""
+    from src.models.main import app
+    return app.app_context()
+
+@celery_app.task(name='tasks.atualizar_status_produtos')
+def atualizar_status_produtos(user_id=None):
+    """Recalcula o status de validade dos produtos (job noturno e pós-importação)"""
+    with _app_context():
+        from src.models.produto import Produto
+
+        atualizados = Produto.atualizar_status_em_lote(user_id=user_id)
+        return {'produtos_atualizados': atualizados}
+
+@celery_app.task(name='tasks.gerar_alertas_vencimento')
+def gerar_alertas_vencimento(user_id=None):
+    """Gera ou atualiza os alertas de vencimento de todo o catálogo em uma transação"""
+    with _app_context():
+        from src.models.produto import Produto, Alerta, LOTE_ALERTAS
+
+        query = Produto.query.filter(
+            Produto.status.in_(['proximo_vencimento', 'vencido']),
+            Produto.quantidade > 0
+        )
+        if user_id is not None:
+            query = query.filter(Produto.user_id == user_id)
+
+        def candidatos():
+            # Paginação por id: o catálogo nunca fica inteiro em memória
+            ultimo_id = 0
+            while True:
+                produtos = query.filter(Produto.id > ultimo_id).order_by(Produto.id).limit(LOTE_ALERTAS).all()
+                if not produtos:
+                    return
+                for produto in produtos:
+                    yield Alerta.dados_alerta_vencimento(produto)
+                ultimo_id = produtos[-1].id
+
+        return Alerta.registrar_em_lote(candidatos())
+
+@celery_app.task(name='tasks.enviar_digest_alertas')
+def enviar_digest_alertas():
+    """Agrupa os alertas novos por usuário e enfileira os e-mails de digest"""
+    with _app_context():
+        from src.services.alert_digest_service import alert_digest_service
+
+        return alert_digest_service.enfileirar_digests()
+
+@celery_app.task(name='tasks.enviar_lote_digests')
+def enviar_lote_digests(mensagens):
+    """Envia um lote de digests reutilizando uma única sessão SMTP"""
+    with _app_context():
+        from src.services.alert_digest_service import alert_digest_service
+
+        return alert_digest_service.enviar_lote(mensagens)
+
+@celery_app.task(name='tasks.reconstruir_indices_vetoriais')
+def reconstruir_indices_vetoriais(empresa_id=None):
+    """Compacta os índices vetoriais locais e reconstrói os índices aproximados (IVF)"""
+    with _app_context():
+        from src.models.ia_vectorization import create_vector_indexes
+        from src.services.vector_index import DEFAULT_INDEX_DIR, get_vector_index, get_ann_index
+
+        # Índice IVFFlat do pgvector (global): reconstruído quando `lists` ficou defasado
+        listas_pgvector = create_vector_indexes() if empresa_id is None else None
+
+        if empresa_id is not None:
+            empresas = [empresa_id]
+        elif os.path.isdir(DEFAULT_INDEX_DIR):
+            empresas = [int(nome) for nome in os.listdir(DEFAULT_INDEX_DIR) if nome.isdigit()]
+        else:
+            empresas = []
+
+        reconstruidos = 0
+        for empresa in empresas:
+            index = get_vector_index(empresa, build=False)
+            if index.tombstone_ratio() > 0.2:
+                index.compact()
+            get_ann_index(empresa).build()
+            reconstruidos += 1
+
+        return {'indices_reconstruidos': reconstruidos, 'listas_pgvector': listas_pgvector}
+
+@celery_app.task(name='tasks.processar_fila_embeddings')
+def processar_fila_embeddings():
+    """Regera em lote os embeddings dos produtos alterados e atualiza os índices vetoriais"""
+    with _app_context():
+        from src.services.embedding_pipeline import embedding_pipeline
+
+        return embedding_pipeline.process_due()
+
+@celery_app.task(name='tasks.resumir_historico_chat')
+def resumir_historico_chat(sessao_id):
+    """Incorpora ao resumo da sessão de chat as mensagens que saíram da janela do prompt"""
+    with _app_context():
+        from src.services.openai_service import get_openai_service
+
+        service = get_openai_service()
+        if service is None:
+            return {'mensagens_resumidas': 0}
+        return {'mensagens_resumidas': service.summarize_chat_session(sessao_id)}
+
+@celery_app.task(name='tasks.detectar_produtos_duplicados')
+def detectar_produtos_duplicados(empresa_id=None):
+    """Procura produtos quase duplicados pelos embeddings e grava os grupos para revisão"""
+    with _app_context():
+        from src.models.user import db
+        from src.models.produto import Produto
+        from src.models.ia_vectorization import EmbeddingProduto
+        from src.services.duplicate_detection import duplicate_detector
+
+        if empresa_id is not None:
+            empresas = [empresa_id]
+        else:
+            empresas = [
+                empresa for (empresa,) in db.session.query(Produto.empresa_id).join(
+                    EmbeddingProduto, EmbeddingProduto.produto_id == Produto.id
+                ).distinct().all()
+            ]
+
+        resultados = []
+        for empresa in empresas:
+            try:
+                resultados.append(duplicate_detector.detectar(empresa))
+            except Exception as e:
+                db.session.rollback()
+                print(f"Erro ao detectar duplicados da empresa {empresa}: {str(e)}")
+
+        return {'empresas': len(resultados), 'grupos': sum(r['grupos'] for r in resultados)}
+
+@celery_app.task(name='tasks.simular_perdas_vencimento')
+def simular_perdas_vencimento(user_id=None):
+    """Grava a previsão de perdas por vencimento (Monte Carlo) de cada usuário com estoque"""
+    with _app_context():
+        from src.models.user import db
+        from src.models.produto import Produto
+        from src.services.waste_simulator import waste_simulator
+
+        if user_id is not None:
+            usuarios = [user_id]
+        else:
+            usuarios = [
+                usuario for (usuario,) in db.session.query(Produto.user_id).filter(
+                    Produto.quantidade > 0
+                ).distinct().all()
+            ]
+
+        previsoes = 0
+        for usuario in usuarios:
+            try:
+                waste_simulator.prever_e_registrar(usuario)
+                previsoes += 1
+            except Exception as e:
+                db.session.rollback()
+                print(f"Erro ao simular perdas do usuário {usuario}: {str(e)}")
+
+        return {'previsoes': previsoes}
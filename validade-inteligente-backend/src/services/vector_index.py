@@ -0,0 +1,601 @@
+import os
+import threading
+import numpy as np
+from contextlib import contextmanager
+from typing import List, Dict, Tuple, Iterable, Optional
+from src.services.embedding_quantization import PCAProjection, quantize_matrix
+
+try:
+    import fcntl
+except ImportError:  # Windows: só a trava entre threads
+    fcntl = None
+
+# Diretório base dos índices locais (um subdiretório por empresa)
+DEFAULT_INDEX_DIR = os.getenv(
+    'VECTOR_INDEX_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'models', 'database', 'vector_index')
+)
+
+TOMBSTONE = -1
+
+# Backend de busca: 'exact', 'ivf' ou 'auto' (IVF a partir de VECTOR_INDEX_ANN_MIN vetores)
+ANN_BACKEND = os.getenv('VECTOR_INDEX_BACKEND', 'auto')
+ANN_MIN_VECTORS = int(os.getenv('VECTOR_INDEX_ANN_MIN', '50000'))
+ANN_NPROBE = int(os.getenv('VECTOR_INDEX_NPROBE', '8'))
+
+# Tipo da matriz do índice ('float32', 'float16' ou 'int8') e dimensão após PCA (0 = sem PCA)
+INDEX_DTYPE = os.getenv('VECTOR_INDEX_DTYPE', 'float32')
+# O PCA custa recall: recall@10 ~0,59 com 64 dimensões em catálogo real, e 0,26 (64) /
+# 0,34 (256) nos dados sintéticos de benchmark_vector_index.py --quantizacao, contra
+# 0,97 do int8 sem PCA. Só vale quando o índice não cabe em memória de outra forma.
+# Ele se aplica apenas ao índice local: o banco guarda o vetor completo (json, float16
+# ou int8, ver EMBEDDING_STORAGE_FORMAT), porque a projeção é reajustada a cada
+# reconstrução, o reaproveitamento por hash copia o vetor para outros produtos e o
+# pgvector/duplicados comparam com consultas de 1536 dimensões.
+INDEX_PCA_DIM = int(os.getenv('EMBEDDING_PCA_DIM', '0'))
+
+# Linhas desquantizadas por vez durante a busca exata
+SCORE_CHUNK = 4096
+
+class LocalVectorIndex:
+    """Índice vetorial local (fallback sem pgvector) para uma empresa
+
+    Os vetores ficam normalizados em uma matriz memory-mapped (vectors.npy, com
+    capacidade pré-alocada) e os ids de produto em ids.npy. Inserções escrevem
+    no fim da matriz; remoções marcam o id como lápide (-1) até a próxima
+    compactação. A matriz pode ser float16 ou int8 (com escala por linha em
+    scales.npy) e reduzida por PCA (pca.npz); a desquantização é feita em
+    blocos durante a busca.
+
+    Workers web, worker Celery e job noturno escrevem no mesmo diretório: toda
+    escrita recarrega e grava sob flock exclusivo em index.lock, e a leitura
+    recarrega sob flock compartilhado.
+    """
+
+    def __init__(self, empresa_id: int, base_dir: str = None, dim: int = 1536,
+                 dtype: str = None, pca_dim: int = None):
+        self.empresa_id = empresa_id
+        self.dim = dim
+        self.dtype = np.dtype(dtype or INDEX_DTYPE)
+        self.pca_dim = INDEX_PCA_DIM if pca_dim is None else pca_dim
+        self.path = os.path.join(base_dir or DEFAULT_INDEX_DIR, str(empresa_id))
+        self.vectors_path = os.path.join(self.path, 'vectors.npy')
+        self.ids_path = os.path.join(self.path, 'ids.npy')
+        self.ann_path = os.path.join(self.path, 'ivf.npz')
+        self.scales_path = os.path.join(self.path, 'scales.npy')
+        self.pca_path = os.path.join(self.path, 'pca.npz')
+        self.lock_path = os.path.join(self.path, 'index.lock')
+        self._lock = threading.RLock()
+        self._lock_owner = None
+        self._vectors = None
+        self._scales = None
+        self._pca = None
+        self._ids = np.empty(0, dtype=np.int64)
+        self._positions: Dict[int, int] = {}
+        self._ids_version = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.vectors_path) and os.path.exists(self.ids_path)
+
+    def __len__(self):
+        self._reload_if_changed()
+        return len(self._positions)
+
+    def search(self, query: Iterable[float], k: int = 10) -> List[Tuple[int, float]]:
+        """Retorna [(produto_id, similaridade_cosseno)] dos k vetores mais próximos"""
+        self._reload_if_changed()
+        count = len(self._ids)
+        if count == 0 or self._vectors is None or k <= 0:
+            return []
+
+        q = self._prepare_query(query)
+
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, SCORE_CHUNK):
+            stop = min(count, start + SCORE_CHUNK)
+            scores[start:stop] = self._dequantize(slice(start, stop)) @ q
+        scores[self._ids == TOMBSTONE] = -np.inf
+
+        k = min(k, len(self._positions))
+        if k == 0:
+            return []
+
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self._ids[i]), float(scores[i])) for i in top]
+
+    def upsert(self, ids: List[int], vectors) -> None:
+        """Insere ou substitui vetores (o registro antigo vira lápide)"""
+        if len(ids) == 0:
+            return
+
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dim)
+
+        with self._exclusive():
+            for produto_id in ids:
+                self._tombstone(int(produto_id))
+
+            start = len(self._ids)
+            self._ensure_capacity(start + len(ids))
+            self._write_rows(start, self._prepare(vectors))
+
+            self._ids = np.concatenate([self._ids, np.asarray(ids, dtype=np.int64)])
+            for offset, produto_id in enumerate(ids):
+                self._positions[int(produto_id)] = start + offset
+
+            self._save_ids()
+
+    def remove(self, ids: List[int]) -> None:
+        """Marca vetores como removidos (lápides)"""
+        with self._exclusive():
+            for produto_id in ids:
+                self._tombstone(int(produto_id))
+            self._save_ids()
+
+    def rebuild(self, ids: List[int], vectors) -> None:
+        """Reconstrói o índice do zero, descartando lápides"""
+        vectors = self._normalize(np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dim))
+
+        with self._exclusive():
+            # PCA reajustado a cada reconstrução, com os vetores atuais
+            self._pca = None
+            if self.pca_dim and self.pca_dim < min(self.dim, len(ids)):
+                self._pca = PCAProjection.fit(vectors, self.pca_dim)
+                self._pca.save(self.pca_path)
+            elif os.path.exists(self.pca_path):
+                os.remove(self.pca_path)
+
+            self._vectors = None
+            self._scales = None
+            self._ids = np.empty(0, dtype=np.int64)
+            self._allocate(max(1024, len(ids)))
+            if len(ids):
+                self._write_rows(0, self._prepare(vectors))
+
+            # As posições mudaram: o índice aproximado precisa ser reconstruído
+            if os.path.exists(self.ann_path):
+                os.remove(self.ann_path)
+
+            self._ids = np.asarray(ids, dtype=np.int64)
+            self._positions = {int(produto_id): i for i, produto_id in enumerate(self._ids)}
+            self._save_ids()
+
+    def compact(self) -> None:
+        """Remove lápides reescrevendo a matriz"""
+        with self._exclusive():
+            alive = self._ids != TOMBSTONE
+            count = len(self._ids)
+            if self._pca is not None:
+                # Vetores reduzidos não voltam à dimensão original: reconstrói a partir do banco
+                build_vector_index(self.empresa_id, self)
+                return
+            vectors = self._dequantize(np.flatnonzero(alive)) if count else np.empty((0, self.dim), dtype=np.float32)
+            self.rebuild(self._ids[alive].tolist(), vectors)
+
+    def tombstone_ratio(self) -> float:
+        self._reload_if_changed()
+        if len(self._ids) == 0:
+            return 0.0
+        return float(np.count_nonzero(self._ids == TOMBSTONE)) / len(self._ids)
+
+    @contextmanager
+    def _exclusive(self):
+        """Trava de escrita entre threads e processos; recarrega o estado do disco ao entrar"""
+        with self._lock:
+            if self._lock_owner == threading.get_ident():
+                # Reentrada (compact -> rebuild): o flock já é desta thread
+                yield
+                return
+
+            os.makedirs(self.path, exist_ok=True)
+            with open(self.lock_path, 'a') as handle:
+                if fcntl is not None:
+                    fcntl.flock(handle, fcntl.LOCK_EX)
+                self._lock_owner = threading.get_ident()
+                try:
+                    self._reload_if_changed()
+                    yield
+                finally:
+                    self._lock_owner = None
+                    if fcntl is not None:
+                        fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _tombstone(self, produto_id: int) -> None:
+        position = self._positions.pop(produto_id, None)
+        if position is not None:
+            self._ids[position] = TOMBSTONE
+
+    def _ensure_capacity(self, required: int) -> None:
+        """Garante espaço na matriz memory-mapped, dobrando a capacidade quando preciso"""
+        if self._vectors is not None and self._vectors.shape[0] >= required:
+            return
+
+        self._allocate(max(1024, required, 2 * (self._vectors.shape[0] if self._vectors is not None else 0)))
+
+    def _allocate(self, capacity: int) -> None:
+        """Recria a matriz (e as escalas int8) com nova capacidade, preservando as linhas atuais"""
+        os.makedirs(self.path, exist_ok=True)
+        count = len(self._ids)
+
+        # Um índice existente mantém o formato com que foi construído
+        if self._vectors is not None:
+            dtype, dim = self._vectors.dtype, self._vectors.shape[1]
+        else:
+            dtype, dim = self.dtype, self._pca.dim if self._pca is not None else self.dim
+
+        tmp_path = self.vectors_path + '.tmp'
+        matrix = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=(capacity, dim))
+        if self._vectors is not None and count:
+            matrix[:count] = self._vectors[:count]
+        matrix.flush()
+        del matrix
+
+        if dtype == np.int8:
+            scales_tmp_path = self.scales_path + '.tmp'
+            scales = np.lib.format.open_memmap(scales_tmp_path, mode='w+', dtype=np.float32, shape=(capacity,))
+            if self._scales is not None and count:
+                scales[:count] = self._scales[:count]
+            scales.flush()
+            del scales
+            os.replace(scales_tmp_path, self.scales_path)
+            self._scales = np.load(self.scales_path, mmap_mode='r+')
+        else:
+            self._scales = None
+
+        os.replace(tmp_path, self.vectors_path)
+        self._vectors = np.load(self.vectors_path, mmap_mode='r+')
+
+    def _write_rows(self, start: int, vectors: np.ndarray) -> None:
+        """Grava vetores já preparados a partir da linha `start`, quantizando se preciso"""
+        quantized, scales = quantize_matrix(vectors, self._vectors.dtype)
+        self._vectors[start:start + len(vectors)] = quantized
+        self._vectors.flush()
+        if self._scales is not None:
+            self._scales[start:start + len(vectors)] = scales
+            self._scales.flush()
+
+    def _dequantize(self, rows) -> np.ndarray:
+        """Lê linhas da matriz (slice ou posições) como float32"""
+        block = np.asarray(self._vectors[rows], dtype=np.float32)
+        if self._scales is not None:
+            block *= self._scales[rows][:, None]
+        return block
+
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        """Normaliza e, se houver PCA, projeta e renormaliza"""
+        vectors = self._normalize(vectors)
+        if self._pca is not None:
+            vectors = self._normalize(self._pca.transform(vectors))
+        return vectors
+
+    def _prepare_query(self, query: Iterable[float]) -> np.ndarray:
+        return self._prepare(np.asarray(query, dtype=np.float32).reshape(1, -1))[0]
+
+    def _save_ids(self) -> None:
+        """Grava ids.npy em arquivo temporário e troca de forma atômica (é o que publica a escrita)"""
+        tmp_path = self.ids_path + '.tmp.npy'
+        np.save(tmp_path, self._ids)
+        os.replace(tmp_path, self.ids_path)
+        self._ids_version = self._version()
+
+    def _version(self):
+        """Identifica a versão de ids.npy (cada os.replace cria um inode novo)"""
+        stat = os.stat(self.ids_path)
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _reload_if_changed(self) -> None:
+        """Recarrega do disco se outro processo alterou o índice"""
+        if not self.exists():
+            return
+        if self._vectors is not None and self._version() == self._ids_version:
+            return
+
+        if self._lock_owner == threading.get_ident() or fcntl is None:
+            self._load()
+            return
+
+        # Leitura sob flock compartilhado: não pega vectors.npy e ids.npy de escritas diferentes
+        with open(self.lock_path, 'a') as handle:
+            fcntl.flock(handle, fcntl.LOCK_SH)
+            try:
+                self._load()
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _load(self) -> None:
+        self._ids_version = self._version()
+        self._vectors = np.load(self.vectors_path, mmap_mode='r+')
+        self._scales = np.load(self.scales_path, mmap_mode='r+') if self._vectors.dtype == np.int8 else None
+        self._pca = PCAProjection.load(self.pca_path)
+        self._ids = np.load(self.ids_path)
+        self._positions = {int(produto_id): i for i, produto_id in enumerate(self._ids) if produto_id != TOMBSTONE}
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (vectors / norms).astype(np.float32, copy=False)
+
+class IVFVectorIndex:
+    """Índice aproximado (IVF) sobre o LocalVectorIndex de uma empresa
+
+    Os vetores são agrupados por k-means esférico em `n_lists` listas; a busca
+    compara a consulta só com as `nprobe` listas mais próximas (mais listas
+    sondadas = mais recall e mais latência). Vetores inseridos depois da
+    construção são varridos de forma exata até a próxima reconstrução, que roda
+    em segundo plano quando eles passam de `rebuild_ratio` do índice.
+    """
+
+    def __init__(self, base: LocalVectorIndex, n_lists: int = None, nprobe: int = None,
+                 rebuild_ratio: float = 0.1):
+        self.base = base
+        self.path = base.ann_path
+        self.n_lists = n_lists
+        self.nprobe = nprobe or ANN_NPROBE
+        self.rebuild_ratio = rebuild_ratio
+        self._centroids = None
+        self._offsets = None
+        self._positions = None
+        self._indexed_count = 0
+        self._mtime = None
+        self._rebuild_thread = None
+
+    def build(self, sample_size: int = 20000, iterations: int = 10, seed: int = 0) -> None:
+        """Treina os centróides e distribui os vetores vivos pelas listas"""
+        base = self.base
+        base._reload_if_changed()
+        count = len(base._ids)
+        alive = np.flatnonzero(base._ids[:count] != TOMBSTONE)
+        if len(alive) == 0:
+            return
+
+        rng = np.random.default_rng(seed)
+        n_lists = min(len(alive), self.n_lists or max(1, int(4 * np.sqrt(len(alive)))))
+
+        sample_size = min(len(alive), max(sample_size, n_lists * 40))
+        sample = np.sort(rng.choice(alive, sample_size, replace=False))
+        centroids = self._spherical_kmeans(base._dequantize(sample), n_lists, iterations, rng)
+
+        assignments = np.empty(len(alive), dtype=np.int32)
+        for start in range(0, len(alive), 8192):
+            chunk = alive[start:start + 8192]
+            assignments[start:start + len(chunk)] = np.argmax(base._dequantize(chunk) @ centroids.T, axis=1)
+
+        order = np.argsort(assignments, kind='stable')
+        offsets = np.searchsorted(assignments[order], np.arange(n_lists + 1))
+
+        tmp_path = self.path + '.tmp.npz'
+        np.savez(tmp_path, centroids=centroids, offsets=offsets,
+                 positions=alive[order], indexed_count=np.int64(count))
+        os.replace(tmp_path, self.path)
+        self._mtime = None
+
+    def search(self, query: Iterable[float], k: int = 10, nprobe: int = None) -> List[Tuple[int, float]]:
+        """Busca aproximada; usa a busca exata enquanto o IVF não foi construído"""
+        base = self.base
+        base._reload_if_changed()
+        self._load_if_changed()
+
+        if self._centroids is None or self._indexed_count > len(base._ids):
+            self.rebuild_in_background()
+            return base.search(query, k)
+
+        q = base._prepare_query(query)
+
+        nprobe = min(nprobe or self.nprobe, len(self._centroids))
+        lists = np.argpartition(-(self._centroids @ q), nprobe - 1)[:nprobe]
+
+        # Candidatos: listas sondadas + vetores inseridos após a construção
+        delta = np.arange(self._indexed_count, len(base._ids))
+        candidates = np.concatenate(
+            [self._positions[self._offsets[l]:self._offsets[l + 1]] for l in lists] + [delta]
+        )
+        candidates = np.sort(candidates[base._ids[candidates] != TOMBSTONE])
+        if len(candidates) == 0:
+            return []
+
+        scores = base._dequantize(candidates) @ q
+        k = min(k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        if len(delta) > self.rebuild_ratio * max(self._indexed_count, 1):
+            self.rebuild_in_background()
+
+        return [(int(base._ids[candidates[i]]), float(scores[i])) for i in top]
+
+    def rebuild_in_background(self) -> None:
+        """Reconstrói o IVF em uma thread, sem bloquear as buscas"""
+        if self._rebuild_thread is not None and self._rebuild_thread.is_alive():
+            return
+        if len(self.base) == 0:
+            return
+
+        self._rebuild_thread = threading.Thread(target=self.build, daemon=True)
+        self._rebuild_thread.start()
+
+    def _load_if_changed(self) -> None:
+        if not os.path.exists(self.path):
+            self._centroids = None
+            return
+
+        mtime = os.path.getmtime(self.path)
+        if mtime == self._mtime:
+            return
+
+        with np.load(self.path) as data:
+            self._centroids = data['centroids']
+            self._offsets = data['offsets']
+            self._positions = data['positions']
+            self._indexed_count = int(data['indexed_count'])
+        self._mtime = mtime
+
+    @staticmethod
+    def _spherical_kmeans(x: np.ndarray, k: int, iterations: int, rng) -> np.ndarray:
+        """k-means com similaridade de cosseno (centróides normalizados)"""
+        centroids = x[rng.choice(len(x), k, replace=False)].copy()
+
+        for _ in range(iterations):
+            labels = np.argmax(x @ centroids.T, axis=1)
+            order = np.argsort(labels, kind='stable')
+            used, starts = np.unique(labels[order], return_index=True)
+
+            sums = x[rng.choice(len(x), k)].copy()  # listas vazias são re-semeadas
+            sums[used] = np.add.reduceat(x[order], starts, axis=0)
+            centroids = LocalVectorIndex._normalize(sums)
+
+        return centroids
+
+# Índices abertos neste processo, por empresa
+_indexes: Dict[int, LocalVectorIndex] = {}
+_ann_indexes: Dict[int, IVFVectorIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_vector_index(empresa_id: int, build: bool = True) -> LocalVectorIndex:
+    """Retorna o índice local da empresa, construindo-o a partir do banco se não existir"""
+    with _indexes_lock:
+        index = _indexes.get(empresa_id)
+        if index is None:
+            index = _indexes[empresa_id] = LocalVectorIndex(empresa_id)
+
+    if build and not index.exists():
+        build_vector_index(empresa_id, index)
+
+    return index
+
+def get_ann_index(empresa_id: int) -> IVFVectorIndex:
+    """Retorna o índice aproximado (IVF) da empresa"""
+    index = get_vector_index(empresa_id)
+    with _indexes_lock:
+        ann = _ann_indexes.get(empresa_id)
+        if ann is None:
+            ann = _ann_indexes[empresa_id] = IVFVectorIndex(index)
+    return ann
+
+def search_vector_index(empresa_id: int, query: Iterable[float], k: int = 10) -> List[Tuple[int, float]]:
+    """Busca no índice local da empresa usando o backend configurado"""
+    index = get_vector_index(empresa_id)
+
+    if ANN_BACKEND == 'exact' or (ANN_BACKEND == 'auto' and len(index) < ANN_MIN_VECTORS):
+        return index.search(query, k)
+
+    return get_ann_index(empresa_id).search(query, k)
+
+def benchmark_recall(index: LocalVectorIndex, queries, k: int = 10,
+                     nprobes=(1, 2, 4, 8, 16, 32), n_lists: int = None) -> Dict[str, object]:
+    """Mede recall@k e latência do IVF contra a busca exata para várias sondagens"""
+    import time
+
+    queries = np.asarray(queries, dtype=np.float32)
+    ann = IVFVectorIndex(index, n_lists=n_lists)
+
+    start = time.perf_counter()
+    ann.build()
+    build_seconds = time.perf_counter() - start
+
+    exact_latencies = []
+    truth = []
+    for q in queries:
+        start = time.perf_counter()
+        truth.append({produto_id for produto_id, _ in index.search(q, k)})
+        exact_latencies.append((time.perf_counter() - start) * 1000)
+
+    results = []
+    for nprobe in nprobes:
+        latencies = []
+        hits = 0
+        for q, expected in zip(queries, truth):
+            start = time.perf_counter()
+            found = ann.search(q, k, nprobe=nprobe)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += len(expected & {produto_id for produto_id, _ in found})
+
+        results.append({
+            'nprobe': nprobe,
+            'recall': hits / max(1, sum(len(t) for t in truth)),
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p95_ms': float(np.percentile(latencies, 95))
+        })
+
+    return {
+        'vetores': len(index),
+        'n_lists': len(ann._centroids) if ann._centroids is not None else 0,
+        'build_s': build_seconds,
+        'exato_p50_ms': float(np.percentile(exact_latencies, 50)),
+        'exato_p95_ms': float(np.percentile(exact_latencies, 95)),
+        'ivf': results
+    }
+
+def benchmark_quantization(ids: List[int], vectors, queries, k: int = 10,
+                           configs=(('float16', 0), ('int8', 0), ('float16', 256), ('int8', 256))) -> Dict[str, object]:
+    """Mede perda de recall@k e redução de tamanho de cada formato contra o índice float32"""
+    import json
+    import tempfile
+    import time
+    from src.services.embedding_quantization import encode_vector
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    queries = np.asarray(queries, dtype=np.float32)
+    base_dir = tempfile.mkdtemp()
+
+    reference = LocalVectorIndex(0, base_dir=base_dir, dim=vectors.shape[1], dtype='float32', pca_dim=0)
+    reference.rebuild(ids, vectors)
+    truth = [{produto_id for produto_id, _ in reference.search(q, k)} for q in queries]
+    reference_bytes = reference._vectors.shape[1] * 4
+
+    resultados = []
+    for i, (dtype, pca_dim) in enumerate(configs, start=1):
+        index = LocalVectorIndex(i, base_dir=base_dir, dim=vectors.shape[1], dtype=dtype, pca_dim=pca_dim)
+        index.rebuild(ids, vectors)
+
+        latencies = []
+        hits = 0
+        for q, expected in zip(queries, truth):
+            start = time.perf_counter()
+            found = index.search(q, k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += len(expected & {produto_id for produto_id, _ in found})
+
+        row_bytes = index._vectors.dtype.itemsize * index._vectors.shape[1] + (4 if index._scales is not None else 0)
+        resultados.append({
+            'formato': dtype,
+            'pca_dim': pca_dim or None,
+            'bytes_por_vetor': row_bytes,
+            'reducao': reference_bytes / row_bytes,
+            'recall': hits / max(1, sum(len(t) for t in truth)),
+            'p50_ms': float(np.percentile(latencies, 50))
+        })
+
+    # Tamanho por linha no banco (modo sem pgvector)
+    amostra = vectors[:100]
+    armazenamento = {'json': float(np.mean([len(json.dumps(v.tolist())) for v in amostra]))}
+    for formato in ('float16', 'int8'):
+        armazenamento[formato] = float(np.mean([len(encode_vector(v, formato)) for v in amostra]))
+
+    return {'vetores': len(ids), 'float32_bytes_por_vetor': reference_bytes,
+            'indice': resultados, 'banco_bytes_por_linha': armazenamento}
+
+def build_vector_index(empresa_id: int, index: Optional[LocalVectorIndex] = None) -> LocalVectorIndex:
+    """(Re)constrói o índice local de uma empresa com os embeddings do banco"""
+    from src.models.ia_vectorization import EmbeddingProduto
+
+    index = index or get_vector_index(empresa_id, build=False)
+    ids, vectors = EmbeddingProduto.load_matrix(empresa_id=empresa_id)
+    index.rebuild(ids, vectors)
+    return index
+
+def refresh_vector_index(empresa_id: int, produto_ids: List[int]) -> None:
+    """Atualiza incrementalmente o índice local com os embeddings atuais dos produtos"""
+    from src.models.ia_vectorization import EmbeddingProduto
+
+    index = get_vector_index(empresa_id, build=False)
+    if not index.exists():
+        build_vector_index(empresa_id, index)
+        return
+
+    ids, vectors = EmbeddingProduto.load_matrix(produto_ids=produto_ids)
+    index.upsert(ids, vectors)
+
+    # Produtos sem embedding (ex.: removidos) saem do índice
+    found = set(ids)
+    index.remove([produto_id for produto_id in produto_ids if produto_id not in found])
@@ -0,0 +1,326 @@
+import os
+import numpy as np
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+from sqlalchemy import func
+from src.models.user import db
+from src.models.produto import Produto, HistoricoVenda, PrevisaoPerda
+
+# Simulações por produto e horizonte (dias) das perdas previstas
+SIMULACOES = int(os.getenv('SIMULACAO_PERDAS_N', '500'))
+HORIZONTE_DIAS = int(os.getenv('SIMULACAO_PERDAS_HORIZONTE', '30'))
+
+# Dias de histórico usados para ajustar a distribuição da demanda diária
+DIAS_AJUSTE = 90
+
+# Elementos por lote: produtos × max(estoque, simulações) (~64 MB por array em float64)
+ELEMENTOS_POR_LOTE = 8 * 1024 * 1024
+
+# Dispersão usada quando a variância não excede a média (Poisson, na prática)
+DISPERSAO_MAXIMA = 1e4
+
+# Custo assumido (fração do preço) para produtos sem preço de custo
+CUSTO_PADRAO = 0.6
+
+# Produtos listados na previsão gravada (maiores perdas esperadas)
+PRODUTOS_NA_PREVISAO = 20
+
+def ajustar_demanda(ids: List[int], inicio_observacao: np.ndarray, hoje: date):
+    """Média e dispersão (binomial negativa) da demanda diária e o perfil por dia da semana
+
+    Dias sem venda contam como zero desde o início da observação de cada
+    produto (cadastro ou primeira venda, no máximo DIAS_AJUSTE atrás). A dispersão r sai dos momentos:
+    r = média² / (variância - média); sem sobredispersão, a demanda é Poisson.
+    """
+    posicao = {produto_id: i for i, produto_id in enumerate(ids)}
+    n = len(ids)
+
+    rows = db.session.query(
+        HistoricoVenda.produto_id, HistoricoVenda.data_venda, func.sum(HistoricoVenda.quantidade_vendida)
+    ).filter(
+        HistoricoVenda.produto_id.in_(ids),
+        HistoricoVenda.data_venda >= hoje - timedelta(days=DIAS_AJUSTE),
+        HistoricoVenda.data_venda < hoje
+    ).group_by(HistoricoVenda.produto_id, HistoricoVenda.data_venda).all()
+
+    fator_semana = np.ones(7)
+
+    if not rows:
+        return np.full(n, np.nan), np.full(n, DISPERSAO_MAXIMA), fator_semana
+
+    produto_obs = np.array([posicao[r[0]] for r in rows])
+    quantidade = np.array([float(r[2] or 0) for r in rows])
+    dia_semana = np.array([r[1].weekday() for r in rows])
+
+    # Vendas anteriores ao cadastro (importadas) também contam como observação
+    data_obs = np.array([r[1].date() if hasattr(r[1], 'date') else r[1] for r in rows], dtype='datetime64[D]')
+    inicio_observacao = inicio_observacao.copy()
+    np.minimum.at(inicio_observacao, produto_obs, data_obs)
+    dias_observados = np.clip((np.datetime64(hoje) - inicio_observacao).astype(int), 1, DIAS_AJUSTE)
+
+    soma = np.bincount(produto_obs, weights=quantidade, minlength=n)
+    soma_quadrados = np.bincount(produto_obs, weights=quantidade ** 2, minlength=n)
+    com_historico = np.bincount(produto_obs, minlength=n) > 0
+
+    media = soma / dias_observados
+    variancia = (soma_quadrados / dias_observados - media ** 2) * dias_observados / np.maximum(dias_observados - 1, 1)
+    excesso = variancia - media
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dispersao = np.where(excesso > 1e-9, media ** 2 / excesso, DISPERSAO_MAXIMA)
+    dispersao = np.clip(dispersao, 0.05, DISPERSAO_MAXIMA)
+
+    # Perfil semanal da loja: vendas médias de cada dia da semana / média geral
+    ocorrencias = np.bincount(
+        [(hoje - timedelta(days=d)).weekday() for d in range(1, DIAS_AJUSTE + 1)], minlength=7
+    )
+    vendas_semana = np.bincount(dia_semana, weights=quantidade, minlength=7) / np.maximum(ocorrencias, 1)
+    if vendas_semana.sum() > 0:
+        fator_semana = vendas_semana / vendas_semana.mean()
+
+    return np.where(com_historico, media, np.nan), dispersao, fator_semana
+
+def vendas_truncadas(forma: np.ndarray, escala: np.ndarray, estoque: np.ndarray, u: np.ndarray) -> np.ndarray:
+    """min(D, estoque) com D ~ Gamma-Poisson(forma, escala), pela inversão da CDF nos uniformes `u`
+
+    D é a binomial negativa com P(D=0) = (1 + escala)^-forma e razão
+    P(k)/P(k-1) = (forma + k - 1)/k · escala/(1 + escala). Como D > k exatamente
+    quando F(k) < u, min(D, estoque) é o número de k < estoque com F(k) < u:
+    basta a CDF até o estoque. `u` tem uma linha por produto, com valores em
+    (0, 1]; a contagem é um searchsorted sobre as CDFs das linhas deslocadas
+    (linha i em [i, i + 1]), sem laço por produto.
+    """
+    n = len(forma)
+    limite = np.ceil(estoque).astype(int)
+    colunas = max(1, int(limite.max()) if n else 1)
+    k = np.arange(1, colunas)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_q = np.log(escala) - np.log1p(escala)
+        log_pmf = np.empty((n, colunas))
+        log_pmf[:, 0] = -forma * np.log1p(escala)
+        log_pmf[:, 1:] = np.log((forma[:, None] + k - 1) / k) + log_q[:, None]
+    np.cumsum(log_pmf, axis=1, out=log_pmf)
+
+    cdf = np.minimum(np.cumsum(np.exp(log_pmf), axis=1), 1.0)
+    # Além do estoque a CDF não conta (1.0 nunca fica abaixo de u)
+    cdf[np.arange(colunas)[None, :] >= limite[:, None]] = 1.0
+
+    linhas = np.arange(n)[:, None]
+    chaves = (cdf + linhas).ravel()
+    contagem = np.searchsorted(chaves, u + linhas, side='left') - linhas * colunas
+    return np.minimum(contagem, estoque[:, None])
+
+class WasteSimulator:
+    """Previsão de perdas por vencimento por simulação de Monte Carlo
+
+    A demanda diária de cada produto é sorteada de uma binomial negativa
+    (Gamma-Poisson) ajustada no histórico, com o perfil semanal da loja, até
+    a data de validade. As unidades que sobram no vencimento são a perda.
+    Como só a demanda acumulada importa, a taxa total do período é uma gamma
+    com os momentos da soma diária e as vendas saem da binomial negativa
+    correspondente, por inversão da CDF com um uniforme por produto e
+    simulação. Os uniformes dependem só da semente e do estoque, então dois
+    cenários (com e sem desconto) simulados com a mesma semente usam os mesmos
+    números aleatórios e a diferença entre eles não é ruído de amostragem.
+    """
+
+    def __init__(self, simulacoes: int = None, horizonte_dias: int = None):
+        self.simulacoes = simulacoes or SIMULACOES
+        self.horizonte_dias = horizonte_dias or HORIZONTE_DIAS
+
+    def simular(self, estoque, dias_venda, media, dispersao, fator_semana, dia_semana_inicial: int,
+                valores: Dict[str, np.ndarray], multiplicador=None, rng=None) -> Dict[str, Any]:
+        """Simula as perdas; retorna médias e P90 por produto e totais por simulação
+
+        `dias_venda` são os dias em que o produto ainda pode ser vendido (hoje
+        incluso). `valores` dá o valor unitário de cada produto por nome
+        ('venda', 'custo', ...); os totais por simulação são calculados para
+        cada um. `multiplicador`, se informado, é uma função (índices, dias) →
+        fator da demanda em cada dia (ex.: efeito de um desconto).
+        """
+        rng = rng or np.random.default_rng()
+        estoque = np.asarray(estoque, dtype=float)
+        dias_venda = np.asarray(dias_venda, dtype=int)
+        media = np.asarray(media, dtype=float)
+        dispersao = np.asarray(dispersao, dtype=float)
+        n, s = len(estoque), self.simulacoes
+
+        perda_media = np.zeros(n)
+        perda_p90 = np.zeros(n)
+        totais = {'unidades': np.zeros(s)}
+        totais.update({nome: np.zeros(s) for nome in valores})
+
+        # Média diária esperada até o vencimento (perfil semanal e multiplicador)
+        dias_total = max(1, int(dias_venda.max())) if n else 1
+        dias = np.arange(dias_total)
+        media_dia = media[:, None] * fator_semana[(dia_semana_inicial + dias) % 7][None, :]
+        media_dia = np.where(dias[None, :] < dias_venda[:, None], media_dia, 0.0)
+        if multiplicador is not None:
+            media_dia = media_dia * multiplicador(np.arange(n), dias)
+
+        # Soma das taxas diárias Gamma(r, m_t / r): gamma com os mesmos dois
+        # primeiros momentos (exata quando as médias diárias são iguais)
+        soma_media = media_dia.sum(axis=1)
+        variancia_taxa = (media_dia ** 2).sum(axis=1) / dispersao
+        with np.errstate(divide='ignore', invalid='ignore'):
+            forma = np.where(variancia_taxa > 0, soma_media ** 2 / variancia_taxa, 1.0)
+            escala = np.where(soma_media > 0, variancia_taxa / soma_media, 0.0)
+
+        # Lotes em ordem de estoque, com produtos × max(estoque, simulações) limitado
+        ordem = np.argsort(estoque, kind='stable')
+        limite = np.ceil(estoque[ordem]).astype(int)
+        inicio = 0
+        while inicio < n:
+            tamanho = min(n - inicio, max(1, ELEMENTOS_POR_LOTE // max(limite[inicio], s)))
+            while tamanho > 1 and tamanho * max(limite[inicio + tamanho - 1], s) > ELEMENTOS_POR_LOTE:
+                tamanho = max(1, ELEMENTOS_POR_LOTE // max(limite[inicio + tamanho - 1], s))
+            idx = ordem[inicio:inicio + tamanho]
+            inicio += tamanho
+
+            # Uniformes em (0, 1]; vendas limitadas ao estoque pela CDF da Gamma-Poisson
+            u = 1.0 - rng.random((len(idx), s))
+            vendidos = vendas_truncadas(forma[idx], escala[idx], estoque[idx], u)
+
+            perdas = estoque[idx, None] - vendidos
+            perda_media[idx] = perdas.mean(axis=1)
+            perda_p90[idx] = np.percentile(perdas, 90, axis=1)
+
+            totais['unidades'] += perdas.sum(axis=0)
+            for nome, valor in valores.items():
+                totais[nome] += (perdas * valor[idx, None]).sum(axis=0)
+
+        return {'perda_media': perda_media, 'perda_p90': perda_p90, 'totais': totais}
+
+    def prever(self, user_id: int, hoje: date = None, seed: Optional[int] = None,
+               com_markdown: bool = True) -> Dict[str, Any]:
+        """Perdas previstas dos produtos do usuário que vencem dentro do horizonte"""
+        hoje = hoje or date.today()
+        produtos = Produto.query.filter(
+            Produto.user_id == user_id,
+            Produto.quantidade > 0,
+            Produto.data_validade >= hoje,
+            Produto.data_validade <= hoje + timedelta(days=self.horizonte_dias)
+        ).all()
+
+        resultado = {
+            'data_referencia': hoje,
+            'horizonte_dias': self.horizonte_dias,
+            'simulacoes': self.simulacoes,
+            'produtos_simulados': len(produtos),
+            'unidades_esperadas': 0.0, 'unidades_p90': 0.0,
+            'valor_esperado': 0.0, 'valor_p90': 0.0,
+            'custo_esperado': 0.0, 'custo_p90': 0.0,
+            'economia_markdown': 0.0, 'reducao_desperdicio': 0.0,
+            'produtos': []
+        }
+        if not produtos:
+            return resultado
+
+        ids = [p.id for p in produtos]
+        estoque = np.array([float(p.quantidade) for p in produtos])
+        dias_venda = np.array([(p.data_validade - hoje).days + 1 for p in produtos])
+        preco = np.array([float(p.preco_venda or 0) for p in produtos])
+        custo = np.array([float(p.preco_custo) if p.preco_custo else float(p.preco_venda or 0) * CUSTO_PADRAO
+                          for p in produtos])
+        inicio_observacao = np.array([
+            max((p.created_at.date() if p.created_at else hoje - timedelta(days=DIAS_AJUSTE)),
+                hoje - timedelta(days=DIAS_AJUSTE))
+            for p in produtos
+        ], dtype='datetime64[D]')
+
+        media, dispersao, fator_semana = ajustar_demanda(ids, inicio_observacao, hoje)
+
+        # Produto sem histórico: mediana dos demais (ou um giro mínimo)
+        conhecida = media[~np.isnan(media)]
+        media = np.where(np.isnan(media), float(np.median(conhecida)) if len(conhecida) else 0.1, media)
+
+        # Mesma semente no cenário base e no com desconto (números aleatórios comuns)
+        semente = np.random.SeedSequence(seed).entropy
+        valores = {'venda': preco, 'custo': custo}
+        base = self.simular(estoque, dias_venda, media, dispersao, fator_semana, hoje.weekday(), valores,
+                            rng=np.random.default_rng(semente))
+
+        totais = base['totais']
+        resultado.update({
+            'unidades_esperadas': float(totais['unidades'].mean()),
+            'unidades_p90': float(np.percentile(totais['unidades'], 90)),
+            'valor_esperado': float(totais['venda'].mean()),
+            'valor_p90': float(np.percentile(totais['venda'], 90)),
+            'custo_esperado': float(totais['custo'].mean()),
+            'custo_p90': float(np.percentile(totais['custo'], 90))
+        })
+
+        planos = {}
+        if com_markdown:
+            from src.services.markdown_optimizer import markdown_optimizer
+
+            planos = {plano['produto_id']: plano for plano in markdown_optimizer.otimizar_produtos(produtos)}
+            resultado.update(self._economia_markdown(
+                planos, produtos, estoque, dias_venda, media, dispersao, fator_semana, hoje, valores, semente,
+                resultado['custo_esperado']
+            ))
+
+        valor_perda = base['perda_media'] * preco
+        maiores = np.argsort(-valor_perda)[:PRODUTOS_NA_PREVISAO]
+        resultado['produtos'] = [
+            {
+                'produto_id': ids[i],
+                'nome': produtos[i].nome,
+                'dias_para_vencer': int(dias_venda[i] - 1),
+                'estoque': int(estoque[i]),
+                'demanda_diaria': round(float(media[i]), 3),
+                'perda_esperada': round(float(base['perda_media'][i]), 1),
+                'perda_p90': round(float(base['perda_p90'][i]), 1),
+                'valor_perda_esperado': round(float(valor_perda[i]), 2),
+                'markdown': self._resumo_plano(planos.get(ids[i]))
+            }
+            for i in maiores if valor_perda[i] > 0
+        ]
+        return resultado
+
+    def prever_e_registrar(self, user_id: int, hoje: date = None) -> PrevisaoPerda:
+        """Calcula a previsão do dia e grava (substitui a do mesmo dia)"""
+        return PrevisaoPerda.registrar(user_id, self.prever(user_id, hoje=hoje))
+
+    @staticmethod
+    def _resumo_plano(plano: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Desconto sugerido pelo otimizador para exibir junto da previsão (None se não compensa)"""
+        if not plano or not plano.get('desconto_percentual'):
+            return None
+        return {
+            'desconto_percentual': plano['desconto_percentual'],
+            'inicio_em_dias': plano['inicio_em_dias'],
+            'preco_promocional': plano['preco_promocional'],
+            'ganho_vs_sem_desconto': plano['ganho_vs_sem_desconto']
+        }
+
+    def _economia_markdown(self, planos, produtos, estoque, dias_venda, media, dispersao, fator_semana,
+                           hoje, valores, semente, custo_base) -> Dict[str, float]:
+        """Perda em custo evitada seguindo os planos do otimizador de markdown
+
+        Simula com a `semente` do cenário base: cada produto recebe os mesmos
+        uniformes nos dois cenários e os sem desconto têm a mesma perda em cada
+        simulação, então a economia reflete só o efeito dos descontos.
+        """
+        desconto = np.array([planos.get(p.id, {}).get('desconto_percentual', 0.0) / 100 for p in produtos])
+        if not desconto.any():
+            return {'economia_markdown': 0.0, 'reducao_desperdicio': 0.0}
+
+        inicio = np.array([planos.get(p.id, {}).get('inicio_em_dias', 0) for p in produtos])
+        elasticidade = np.array([planos.get(p.id, {}).get('elasticidade', 0.0) for p in produtos])
+        fator_desconto = (1.0 - desconto) ** (-elasticidade)
+
+        def multiplicador(idx, dias):
+            return np.where(dias[None, :] >= inicio[idx, None], fator_desconto[idx, None], 1.0)
+
+        com_desconto = self.simular(estoque, dias_venda, media, dispersao, fator_semana, hoje.weekday(),
+                                    valores, multiplicador=multiplicador, rng=np.random.default_rng(semente))
+        custo_markdown = float(com_desconto['totais']['custo'].mean())
+        economia = max(0.0, custo_base - custo_markdown)
+        return {
+            'economia_markdown': economia,
+            'reducao_desperdicio': economia / custo_base if custo_base > 0 else 0.0
+        }
+
+# Instância global do simulador
+waste_simulator = WasteSimulator()
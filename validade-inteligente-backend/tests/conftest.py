@@ -0,0 +1,13 @@
+import multiprocessing
+
+def executar_isolado(funcao, *args):
+    """Executa `funcao(*args)` em um interpretador novo e devolve o resultado.
+
+    Importar src.models.empresa ou src.models.ia_vectorization registra
+    relacionamentos com o modelo Usuario, que não existe nesta árvore; a partir
+    daí nenhuma consulta ORM consegue configurar os mapeamentos. Os testes que
+    consultam o banco rodam isolados para não dependerem da ordem de coleta.
+    """
+    contexto = multiprocessing.get_context('spawn')
+    with contexto.Pool(1) as pool:
+        return pool.apply(funcao, args)
@@ -0,0 +1,87 @@
+from datetime import date, timedelta
+
+from conftest import executar_isolado
+
+def _app():
+    from flask import Flask
+    from src.models.user import db
+    from src.models.produto import Produto, Alerta
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.metadata.create_all(db.engine, tables=[Produto.__table__, Alerta.__table__])
+    return app
+
+def _candidato(produto_id, urgencia='media'):
+    return {
+        'produto_id': produto_id, 'user_id': 1, 'tipo': 'vencimento', 'urgencia': urgencia,
+        'titulo': 'Produto vence em 5 dias', 'descricao': '10 unidades', 'quantidade_afetada': 10,
+        'valor_estimado_perda': 50.0
+    }
+
+def _produtos(quantidade):
+    from src.models.user import db
+    from src.models.produto import Produto
+
+    produtos = [
+        Produto(user_id=1, nome=f'Produto {i}', categoria='x', quantidade=10, preco_venda=5,
+                data_validade=date.today() + timedelta(days=5))
+        for i in range(quantidade)
+    ]
+    db.session.add_all(produtos)
+    db.session.commit()
+    return [produto.id for produto in produtos]
+
+def _registrar_em_fatias():
+    from sqlalchemy import event
+    import src.models.produto as produto_module
+    from src.models.user import db
+    from src.models.produto import Alerta
+
+    produto_module.LOTE_ALERTAS = 100
+    with _app().app_context():
+        ids = _produtos(250)
+
+        consultas, commits = [], []
+        def antes_de_executar(conn, cursor, statement, params, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT') and 'alertas' in statement:
+                consultas.append(len(params))
+        commit = db.session.commit
+        db.session.commit = lambda: (commits.append(True), commit())
+        event.listen(db.engine, 'before_cursor_execute', antes_de_executar)
+
+        resultado = Alerta.registrar_em_lote(_candidato(produto_id) for produto_id in ids)
+        event.remove(db.engine, 'before_cursor_execute', antes_de_executar)
+        return resultado, consultas, len(commits), Alerta.query.count()
+
+def _reexecutar():
+    import src.models.produto as produto_module
+    from src.models.produto import Alerta
+
+    produto_module.LOTE_ALERTAS = 50
+    with _app().app_context():
+        ids = _produtos(120)
+        Alerta.registrar_em_lote(_candidato(produto_id) for produto_id in ids)
+
+        resultado = Alerta.registrar_em_lote(_candidato(produto_id, urgencia='alta') for produto_id in ids)
+        return resultado, Alerta.query.count(), {alerta.urgencia for alerta in Alerta.query.all()}
+
+def test_catalogo_grande_em_fatias_com_um_commit():
+    """Cada consulta IN fica limitada a LOTE_ALERTAS e o lote inteiro sai em um commit"""
+    resultado, consultas, commits, total = executar_isolado(_registrar_em_fatias)
+
+    assert resultado == {'criados': 250, 'atualizados': 0}
+    # produto_ids da fatia + status + tipo
+    assert len(consultas) == 3 and max(consultas) <= 100 + 2
+    assert commits == 1
+    assert total == 250
+
+def test_reexecucao_atualiza_sem_duplicar():
+    """Rodar o job de novo atualiza os alertas ativos em vez de criar outros"""
+    resultado, total, urgencias = executar_isolado(_reexecutar)
+
+    assert resultado == {'criados': 0, 'atualizados': 120}
+    assert total == 120
+    assert urgencias == {'alta'}
@@ -0,0 +1,49 @@
+import sys
+import time
+import types
+
+import pytest
+
+pytest.importorskip('flask_jwt_extended')
+
+import src.routes.dashboard as dashboard
+
+class _TarefaFalsa:
+    def __init__(self):
+        self.chamadas = []
+        self.falhar = False
+
+    def apply_async(self, args, retry):
+        self.chamadas.append((args, retry))
+        if self.falhar:
+            raise ConnectionError('broker fora do ar')
+
+@pytest.fixture
+def tarefa(monkeypatch):
+    tarefa = _TarefaFalsa()
+    modulo = types.ModuleType('src.services.tasks')
+    modulo.simular_perdas_vencimento = tarefa
+    monkeypatch.setitem(sys.modules, 'src.services.tasks', modulo)
+    monkeypatch.setattr(dashboard, '_previsoes_agendadas', {})
+    return tarefa
+
+def test_agenda_uma_vez_por_dia(tarefa):
+    dashboard.agendar_previsao_perdas(1)
+    dashboard.agendar_previsao_perdas(1)
+    dashboard.agendar_previsao_perdas(2)
+    assert tarefa.chamadas == [([1], False), ([2], False)]
+
+def test_fila_fora_do_ar_nao_publica_a_cada_carregamento(tarefa, monkeypatch):
+    """Depois de uma falha, nova publicação só após o intervalo"""
+    tarefa.falhar = True
+    dashboard.agendar_previsao_perdas(1)
+    dashboard.agendar_previsao_perdas(1)
+    assert len(tarefa.chamadas) == 1
+
+    # Intervalo vencido: tenta de novo e, publicada, não repete no dia
+    dia, _ = dashboard._previsoes_agendadas[1]
+    dashboard._previsoes_agendadas[1] = (dia, time.monotonic() - 1)
+    tarefa.falhar = False
+    dashboard.agendar_previsao_perdas(1)
+    dashboard.agendar_previsao_perdas(1)
+    assert len(tarefa.chamadas) == 2
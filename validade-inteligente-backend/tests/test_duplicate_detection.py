@@ -0,0 +1,95 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+import src.services.duplicate_detection as duplicate_module
+from src.services.duplicate_detection import agrupar_pares, vizinhos_acima_do_limiar
+
+def _normalizar(matriz):
+    matriz = np.asarray(matriz, dtype=np.float32)
+    return matriz / np.linalg.norm(matriz, axis=1, keepdims=True)
+
+def test_vizinhos_pares_simetricos_aparecem_uma_vez():
+    """a→b e b→a viram um único par (i < j); pares abaixo do limiar ficam de fora"""
+    matriz = _normalizar([[1, 0, 0], [0.99, 0.1, 0], [0, 1, 0], [0, 0.98, 0.2]])
+
+    i, j, scores = vizinhos_acima_do_limiar(matriz, k=2, limiar=0.9)
+    pares = sorted(zip(i.tolist(), j.tolist()))
+
+    assert pares == [(0, 1), (2, 3)]
+    assert np.all(i < j)
+    assert np.allclose(scores, [matriz[a] @ matriz[b] for a, b in zip(i, j)])
+
+def test_vizinhos_iguais_a_forca_bruta_entre_lotes(monkeypatch):
+    """Faixas de linhas pequenas dão o mesmo resultado que comparar todos os pares"""
+    monkeypatch.setattr(duplicate_module, 'ELEMENTOS_POR_LOTE', 40)
+    rng = np.random.default_rng(7)
+    base = rng.standard_normal((10, 8))
+    matriz = _normalizar(np.vstack([base, base + rng.normal(0, 0.05, base.shape)]))
+    k, limiar = 3, 0.8
+
+    i, j, _ = vizinhos_acima_do_limiar(matriz, k=k, limiar=limiar)
+
+    sim = matriz @ matriz.T
+    np.fill_diagonal(sim, -np.inf)
+    esperados = set()
+    for linha in range(len(matriz)):
+        for coluna in np.argsort(-sim[linha])[:k]:
+            if sim[linha, coluna] >= limiar:
+                esperados.add((min(linha, coluna), max(linha, coluna)))
+
+    assert set(zip(i.tolist(), j.tolist())) == esperados
+    assert len(i) == len(esperados)
+
+def test_vizinhos_matriz_pequena():
+    i, j, scores = vizinhos_acima_do_limiar(_normalizar([[1, 0]]), k=5, limiar=0.5)
+    assert len(i) == len(j) == len(scores) == 0
+
+def test_agrupar_pares_componentes_conexos():
+    pares = {(1, 2): 0.95, (2, 3): 0.94, (10, 11): 0.97}
+    grupos = sorted(sorted({n for par in grupo for n in par}) for grupo in agrupar_pares(pares))
+    assert grupos == [[1, 2, 3], [10, 11]]
+
+def test_agrupar_pares_divide_encadeamento_pela_aresta_mais_fraca():
+    """A~B~C~D~E~F encadeados: o grupo grande demais perde a ligação mais fraca"""
+    pares = {(1, 2): 0.99, (2, 3): 0.98, (3, 4): 0.94, (4, 5): 0.98, (5, 6): 0.99}
+
+    grupos = agrupar_pares(pares, tamanho_maximo=3)
+    produtos = sorted(sorted({n for par in grupo for n in par}) for grupo in grupos)
+
+    assert produtos == [[1, 2, 3], [4, 5, 6]]
+    assert all((3, 4) not in grupo for grupo in grupos)
+
+def test_agrupar_pares_descarta_grupo_sem_arestas_fortes():
+    """Estrela com arestas iguais acima do tamanho máximo não vira grupo"""
+    pares = {(0, n): 0.95 for n in range(1, 6)}
+    assert agrupar_pares(pares, tamanho_maximo=3) == []
+
+def test_trava_empresa_serializa_execucoes(monkeypatch):
+    """Fora do Postgres a segunda execução da mesma empresa não roda enquanto a primeira não termina"""
+    monkeypatch.setattr(duplicate_module, 'db', SimpleNamespace(
+        engine=SimpleNamespace(dialect=SimpleNamespace(name='sqlite'))
+    ))
+
+    with duplicate_module._trava_empresa(1) as primeira:
+        with duplicate_module._trava_empresa(1) as segunda:
+            assert primeira and not segunda
+        with duplicate_module._trava_empresa(2) as outra_empresa:
+            assert outra_empresa
+        # A execução recusada não libera a trava da que está rodando
+        with duplicate_module._trava_empresa(1) as terceira:
+            assert not terceira
+
+    with duplicate_module._trava_empresa(1) as depois:
+        assert depois
+
+def test_detectar_concorrente_retorna_em_andamento(monkeypatch):
+    monkeypatch.setattr(duplicate_module, 'db', SimpleNamespace(
+        engine=SimpleNamespace(dialect=SimpleNamespace(name='sqlite'))
+    ))
+    detector = duplicate_module.DuplicateDetector()
+    monkeypatch.setattr(detector, '_detectar', lambda empresa_id: {'empresa_id': empresa_id, 'grupos': 3})
+
+    with duplicate_module._trava_empresa(1):
+        assert detector.detectar(1) == {'empresa_id': 1, 'em_andamento': True, 'grupos': 0}
+    assert detector.detectar(1)['grupos'] == 3
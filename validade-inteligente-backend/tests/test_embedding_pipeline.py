@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+
+from src.models.user import db
+import src.models.produto as produto_module
+import src.services.openai_service as openai_module
+import src.services.embedding_pipeline as pipeline_module
+import src.services.vector_index as vector_index_module
+from src.services.embedding_pipeline import EmbeddingQueue, embedding_pipeline
+
+class _ProdutoFake:
+    """Substitui Produto na consulta por ids (o teste não depende do schema completo)"""
+    id = SimpleNamespace(in_=lambda ids: list(ids))
+    query = SimpleNamespace(filter=lambda ids: SimpleNamespace(
+        all=lambda: [SimpleNamespace(id=produto_id) for produto_id in ids]
+    ))
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    return app
+
+@pytest.fixture
+def fila(monkeypatch):
+    monkeypatch.delenv('REDIS_URL', raising=False)
+    queue = EmbeddingQueue(debounce=0)
+    monkeypatch.setattr(embedding_pipeline, 'queue', queue)
+    return queue
+
+def test_task_processa_fila_inicializando_servico(app, fila, monkeypatch):
+    """No worker, a task inicializa o serviço pela variável de ambiente e drena a fila"""
+    tasks = pytest.importorskip('src.services.tasks')
+
+    monkeypatch.setenv('OPENAI_API_KEY', 'sk-teste')
+    monkeypatch.setattr(openai_module, 'openai_service', None)
+    monkeypatch.setattr(pipeline_module, 'register_embedding_hooks', lambda *args: None)
+    monkeypatch.setattr(produto_module, 'Produto', _ProdutoFake)
+    monkeypatch.setattr(tasks, '_app_context', app.app_context)
+
+    processados = []
+    def upsert(self, produtos, force_regenerate=False):
+        processados.extend(p.id for p in produtos)
+        return [{'produto_id': p.id, 'status': 'success'} for p in produtos]
+    monkeypatch.setattr(openai_module.OpenAIService, 'upsert_product_embeddings', upsert)
+
+    atualizados = []
+    monkeypatch.setattr(vector_index_module, 'refresh_vector_index',
+                        lambda empresa_id, ids: atualizados.append((empresa_id, sorted(ids))))
+
+    fila.push([(1, 10), (1, 11), (2, 20)])
+    resultado = tasks.processar_fila_embeddings()
+
+    assert resultado == {'produtos': 3, 'embeddings_gerados': 3, 'erros': 0}
+    assert sorted(processados) == [10, 11, 20]
+    assert len(fila) == 0
+    assert openai_module.openai_service is not None
+
+def test_enqueue_sem_redis_inicia_worker_local(app, fila, monkeypatch):
+    """enqueue (rota assíncrona) inicia a thread local quando a fila não é compartilhada"""
+    iniciados = []
+    monkeypatch.setattr(embedding_pipeline, '_start_local_worker', lambda: iniciados.append(True))
+
+    with app.app_context():
+        embedding_pipeline.enqueue([(1, 10), (1, 11)])
+
+    assert len(fila) == 2
+    assert iniciados == [True]
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from src.services.embedding_quantization import PCAProjection, decode_vectors, encode_vector, quantize_matrix
+
+DIM = 64
+
+@pytest.fixture
+def vetores():
+    return np.random.default_rng(0).standard_normal((20, DIM)).astype(np.float32)
+
+@pytest.mark.parametrize('formato, bytes_por_vetor', [('float32', DIM * 4), ('float16', DIM * 2), ('int8', 4 + DIM)])
+def test_encode_decode_ida_e_volta(vetores, formato, bytes_por_vetor):
+    blobs = [encode_vector(v, formato) for v in vetores]
+    assert {len(b) for b in blobs} == {bytes_por_vetor}
+
+    decodificados = decode_vectors(blobs, formato, DIM)
+
+    assert decodificados.dtype == np.float32
+    assert decodificados.shape == vetores.shape
+    # Erro máximo: meio passo de quantização do int8; precisão do float16
+    if formato == 'int8':
+        passo = np.abs(vetores).max(axis=1, keepdims=True) / 127
+        assert np.all(np.abs(decodificados - vetores) <= passo / 2 + 1e-6)
+    else:
+        assert decodificados == pytest.approx(vetores, rel=1e-3, abs=1e-3)
+
+def test_int8_preserva_cosseno(vetores):
+    decodificados = decode_vectors([encode_vector(v, 'int8') for v in vetores], 'int8', DIM)
+    cosseno = np.sum(decodificados * vetores, axis=1) / (
+        np.linalg.norm(decodificados, axis=1) * np.linalg.norm(vetores, axis=1)
+    )
+    assert cosseno.min() > 0.999
+
+def test_vetor_nulo_e_lista_vazia():
+    assert not decode_vectors([encode_vector(np.zeros(DIM), 'int8')], 'int8', DIM).any()
+    assert decode_vectors([], 'int8', DIM).shape == (0, DIM)
+
+def test_quantize_matrix_int8_escala_por_linha(vetores):
+    vetores[3] = 0.0
+    quantizada, escalas = quantize_matrix(vetores, 'int8')
+
+    assert quantizada.dtype == np.int8
+    assert np.abs(quantizada).max(axis=1)[np.arange(20) != 3].min() == 127
+    assert escalas[3] == 1.0
+    assert quantizada.astype(np.float32) * escalas[:, None] == pytest.approx(vetores, abs=float(escalas.max()))
+
+    float16, sem_escala = quantize_matrix(vetores, 'float16')
+    assert float16.dtype == np.float16 and sem_escala is None
+
+def test_pca_recupera_subespaco_e_persiste(tmp_path):
+    """Dados num subespaço de 4 dimensões: 4 componentes reconstroem tudo"""
+    rng = np.random.default_rng(1)
+    base = np.linalg.qr(rng.standard_normal((DIM, 4)))[0].T
+    dados = (rng.standard_normal((500, 4)) * [5, 3, 2, 1]) @ base + 0.5
+
+    pca = PCAProjection.fit(dados, 4, sample_size=300)
+    projetados = pca.transform(dados)
+    reconstruidos = projetados @ pca.components + pca.mean
+
+    assert pca.dim == 4
+    assert reconstruidos == pytest.approx(dados, abs=1e-3)
+    # Componentes em ordem de variância explicada
+    assert np.all(np.diff(projetados.var(axis=0)) < 0)
+
+    caminho = str(tmp_path / 'pca.npz')
+    pca.save(caminho)
+    carregado = PCAProjection.load(caminho)
+    assert carregado.transform(dados[:5]) == pytest.approx(projetados[:5], abs=1e-5)
+    assert PCAProjection.load(str(tmp_path / 'ausente.npz')) is None
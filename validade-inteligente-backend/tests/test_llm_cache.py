@@ -0,0 +1,79 @@
+import os
+import time
+
+import pytest
+
+import src.services.llm_cache as llm_cache_module
+from src.services.llm_cache import LLMResponseCache
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.delenv('REDIS_URL', raising=False)
+    monkeypatch.setenv('LLM_CACHE_ENABLED', 'true')
+    # Varredura só quando o teste chama prune()
+    monkeypatch.setattr(llm_cache_module, 'DISK_PRUNE_INTERVAL', 10 ** 9)
+    cache = LLMResponseCache(ttl=60, cache_dir=str(tmp_path))
+    cache._last_prune = time.time()
+    return cache
+
+def test_chave_estavel_e_sensivel_aos_parametros():
+    payload = {'nome': 'Leite', 'dias': 3, 'estoque': 10}
+    chave = LLMResponseCache.make_key('expiry_risk', 'v1', 'gpt', payload, 0.3)
+
+    assert chave == LLMResponseCache.make_key('expiry_risk', 'v1', 'gpt', dict(reversed(payload.items())), 0.3000001)
+    for variacao in (
+        ('pricing', 'v1', 'gpt', payload, 0.3),
+        ('expiry_risk', 'v2', 'gpt', payload, 0.3),
+        ('expiry_risk', 'v1', 'gpt', {**payload, 'dias': 2}, 0.3),
+        ('expiry_risk', 'v1', 'gpt', payload, 0.7),
+    ):
+        assert LLMResponseCache.make_key(*variacao) != chave
+
+def test_disco_grava_le_e_conta_por_empresa(cache):
+    chave = LLMResponseCache.make_key('pricing', 'v1', 'gpt', {'id': 1}, 0.3)
+
+    assert cache.get(chave, 'pricing', empresa_id=1) is None
+    cache.set(chave, {'preco': 9.9}, tokens=120)
+    assert cache.get(chave, 'pricing', empresa_id=1) == {'preco': 9.9}
+    assert cache.get(chave, 'pricing', empresa_id=2) == {'preco': 9.9}
+
+    assert cache.stats(1) == {'pricing': {'hits': 1, 'misses': 1, 'tokens_economizados': 120, 'taxa_acerto': 0.5}}
+    assert cache.stats(2)['pricing']['hits'] == 1
+
+def test_entrada_expirada_e_removida(cache):
+    chave = 'ab' + '0' * 62
+    cache.set(chave, {'x': 1})
+    cache.ttl = -1
+    cache.set(chave, {'x': 2})
+
+    assert cache.get(chave, 'pricing') is None
+    assert not os.path.exists(cache._disk_path(chave))
+
+def test_desabilitado_nao_grava(cache):
+    cache.enabled = False
+    cache.set('cd' + '0' * 62, {'x': 1})
+    assert cache.get('cd' + '0' * 62, 'pricing') is None
+    assert cache.stats() == {}
+
+def test_prune_remove_expiradas_e_as_mais_antigas_acima_do_limite(cache):
+    chaves = [f'{i:02d}' + '0' * 62 for i in range(10)]
+    for i, chave in enumerate(chaves):
+        cache.set(chave, {'texto': 'x' * 1000})
+        os.utime(cache._disk_path(chave), (time.time() - 50 + i, time.time() - 50 + i))
+    # Uma entrada mais velha que o TTL e um temporário órfão
+    os.utime(cache._disk_path(chaves[0]), (time.time() - 120, time.time() - 120))
+    orfao = cache._disk_path(chaves[1]) + '.123.tmp'
+    open(orfao, 'w').close()
+    os.utime(orfao, (time.time() - 120, time.time() - 120))
+
+    tamanho = os.path.getsize(cache._disk_path(chaves[1]))
+    cache.disk_max_bytes = tamanho * 5
+
+    resultado = cache.prune()
+
+    restantes = [chave for chave in chaves if os.path.exists(cache._disk_path(chave))]
+    assert not os.path.exists(orfao)
+    assert resultado['bytes'] <= cache.disk_max_bytes * 0.9
+    # As mais recentes ficam
+    assert restantes == chaves[-len(restantes):]
+    assert len(restantes) == 4
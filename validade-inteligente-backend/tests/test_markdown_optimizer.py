@@ -0,0 +1,112 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import src.services.markdown_optimizer as markdown_module
+from src.services.markdown_optimizer import (
+    ELASTICIDADE_PADRAO, MarkdownOptimizer, ajustar_elasticidades, vendas_esperadas
+)
+
+class _ConsultaFalsa:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def filter(self, *args):
+        return self
+
+    def group_by(self, *args):
+        return self
+
+    def all(self):
+        return self.rows
+
+def _historico(monkeypatch, rows):
+    """Substitui o banco pelas linhas (produto_id, quantidade do dia, receita do dia)"""
+    sessao = SimpleNamespace(query=lambda *colunas: _ConsultaFalsa(rows))
+    monkeypatch.setattr(markdown_module, 'db', SimpleNamespace(session=sessao))
+
+def _produtos(*ids, categoria='laticinios'):
+    return [SimpleNamespace(id=produto_id, categoria=categoria) for produto_id in ids]
+
+def test_prior_ignora_nivel_de_preco_entre_produtos(monkeypatch):
+    """Caro vende pouco e barato vende muito, cada um a preço fixo: não há evidência de elasticidade"""
+    rng = np.random.default_rng(1)
+    rows = []
+    for produto_id, preco, quantidade in ((1, 4.0, 120), (2, 9.0, 25), (3, 20.0, 4)):
+        for _ in range(30):
+            vendidos = quantidade + int(rng.integers(-2, 3))
+            rows.append((produto_id, vendidos, vendidos * preco))
+    _historico(monkeypatch, rows)
+
+    elasticidade, com_historico = MarkdownOptimizer()._elasticidades(_produtos(1, 2, 3))
+
+    assert com_historico.all()
+    assert elasticidade == pytest.approx(np.full(3, ELASTICIDADE_PADRAO))
+
+def test_prior_recupera_elasticidade_dentro_de_cada_produto(monkeypatch):
+    """Níveis de preço confundidos entre produtos, elasticidade 1.0 dentro de cada um"""
+    rng = np.random.default_rng(2)
+    rows = []
+    for produto_id, preco_base, demanda_base in ((1, 4.0, 400.0), (2, 9.0, 40.0), (3, 20.0, 3.0)):
+        for _ in range(60):
+            preco = preco_base * rng.choice([0.8, 0.9, 1.0])
+            vendidos = demanda_base * (preco / preco_base) ** -1.0 * np.exp(rng.normal(0, 0.02))
+            rows.append((produto_id, vendidos, vendidos * preco))
+    # Produto novo da categoria, sempre no mesmo preço: herda o prior
+    rows += [(4, 10.0, 50.0)] * 10
+    _historico(monkeypatch, rows)
+
+    elasticidade, _ = MarkdownOptimizer()._elasticidades(_produtos(1, 2, 3, 4))
+
+    assert elasticidade[3] == pytest.approx(1.0, abs=0.1)
+
+def test_ajuste_sem_variacao_de_preco_fica_no_prior():
+    grupo = np.zeros(5, dtype=int)
+    x = np.full(5, np.log(10.0))
+    y = np.log([5.0, 6.0, 4.0, 5.0, 7.0])
+    assert ajustar_elasticidades(grupo, x, y, 1, np.array([2.0])) == pytest.approx([2.0])
+
+def test_vendas_esperadas_perto_da_poisson_exata():
+    from math import exp, lgamma, log
+
+    for estoque, demanda in ((10, 8.0), (30, 30.0), (50, 70.0)):
+        probabilidades = [exp(n * log(demanda) - demanda - lgamma(n + 1)) for n in range(400)]
+        exata = sum(min(estoque, n) * p for n, p in enumerate(probabilidades))
+        aproximada = float(vendas_esperadas(np.array(float(estoque)), np.array(demanda)))
+        assert aproximada == pytest.approx(exata, rel=0.03)
+
+def test_grade_igual_a_argmax_por_forca_bruta():
+    """Cada plano escolhido é o melhor cronograma válido da grade, avaliado um a um"""
+    rng = np.random.default_rng(3)
+    n = 40
+    estoque = rng.integers(1, 80, n).astype(float)
+    preco = rng.uniform(2, 30, n)
+    custo = preco * rng.uniform(0.3, 0.9, n)
+    dias = rng.integers(0, 45, n).astype(float)
+    demanda = rng.uniform(0.05, 6, n)
+    elasticidade = rng.uniform(0.5, 3.5, n)
+
+    otimizador = MarkdownOptimizer()
+    resultado = otimizador.otimizar(estoque, preco, custo, dias, demanda, elasticidade)
+
+    for i in range(n):
+        melhor, plano = -np.inf, None
+        for d in otimizador.descontos:
+            for inicio in otimizador.inicios:
+                if (d == 0 and inicio != 0) or (d > 0 and inicio >= dias[i]):
+                    continue
+                s = min(inicio, dias[i])
+                cheio = demanda[i] * s
+                total = cheio + demanda[i] * (1 - d) ** -elasticidade[i] * (dias[i] - s)
+                vendidos_cheio = float(vendas_esperadas(np.array(estoque[i]), np.array(cheio)))
+                vendidos_total = float(vendas_esperadas(np.array(estoque[i]), np.array(total)))
+                receita = preco[i] * vendidos_cheio + preco[i] * (1 - d) * (vendidos_total - vendidos_cheio)
+                objetivo = receita - otimizador.peso_desperdicio * custo[i] * (estoque[i] - vendidos_total)
+                if objetivo > melhor + 1e-9:
+                    melhor, plano = objetivo, (d, inicio)
+
+        assert resultado['objetivo'][i] == pytest.approx(melhor, rel=1e-9, abs=1e-9)
+        assert resultado['objetivo'][i] >= resultado['objetivo_sem_desconto'][i] - 1e-9
+        if plano[0] == 0:
+            assert resultado['desconto'][i] == 0
@@ -0,0 +1,65 @@
+import pytest
+
+from src.services.product_search import (
+    HybridProductSearch, IndiceTrigramas, normalizar_texto, reciprocal_rank_fusion, score_trigramas
+)
+
+NOMES = {
+    1: 'Pão Francês',
+    2: 'Muçarela Fatiada 150g',
+    3: 'AÇÚCAR REFINADO UNIÃO 1KG',
+    4: 'Leite Integral 1L',
+    5: 'Pão de Queijo Congelado',
+    6: 'Açúcar Mascavo',
+    7: 'Papel Toalha',
+    8: 'Pão de Forma Integral',
+}
+
+def test_normalizar_texto_remove_acentos_caixa_e_pontuacao():
+    assert normalizar_texto('  AÇÚCAR   Refinado-União 1kg! ') == 'acucar refinado uniao 1kg'
+    assert normalizar_texto('Pão') == 'pao'
+    assert normalizar_texto(None) == ''
+
+def test_score_trigramas():
+    assert score_trigramas('leite', 'leite') == 1.0
+    # Consulta curta contida em nome longo pontua pela cobertura da consulta
+    assert score_trigramas('leite', 'leite integral 1l') == 1.0
+    assert score_trigramas('leite', 'papel toalha') < 0.2
+    assert score_trigramas('', 'leite') == 0.0
+
+def test_reciprocal_rank_fusion_soma_posicoes():
+    fundidos = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], k=60)
+    ids = [produto_id for produto_id, _ in fundidos]
+    assert ids == [1, 3, 2]
+    assert fundidos[0][1] == pytest.approx(1 / 61 + 1 / 62)
+    assert fundidos[2][1] == pytest.approx(1 / 62)
+
+def test_indice_pontua_como_score_trigramas():
+    indice = IndiceTrigramas(list(NOMES), list(NOMES.values()))
+    for produto_id, nome, score in indice.buscar('pao integral', 10):
+        assert score == pytest.approx(score_trigramas('pao integral', normalizar_texto(NOMES[produto_id])))
+        assert nome == normalizar_texto(NOMES[produto_id])
+
+@pytest.fixture
+def busca(monkeypatch):
+    busca = HybridProductSearch()
+    indice = IndiceTrigramas(list(NOMES), list(NOMES.values()))
+    monkeypatch.setattr(busca, '_indice_local', lambda empresa_id: indice)
+    monkeypatch.setattr(busca, '_has_pg_trgm', lambda: False)
+    return busca
+
+@pytest.mark.parametrize('consulta, esperado', [
+    ('pão', 1), ('pao frances', 1), ('muçarela', 2), ('mucarela', 2), ('Açúcar', 3), ('acucar refinado', 3),
+])
+def test_nomes_acentuados_encontrados_sem_busca_vetorial(busca, consulta, esperado):
+    """Consulta com ou sem acento encontra o nome acentuado e dispensa a API de embeddings"""
+    lexicos = busca._buscar_lexico(1, consulta)
+
+    assert esperado in lexicos
+    assert lexicos[esperado]['forte']
+    assert busca._recall_suficiente(lexicos, limit=10)
+
+def test_candidatos_em_ordem_de_score(busca):
+    lexicos = busca._buscar_lexico(1, 'pao')
+    assert set(lexicos) >= {1, 5, 8}
+    assert 7 not in lexicos or lexicos[7]['trgm'] < lexicos[1]['trgm']
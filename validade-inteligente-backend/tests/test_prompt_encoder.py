@@ -0,0 +1,48 @@
+import pytest
+
+from src.services.prompt_encoder import PromptEncoder
+
+@pytest.fixture
+def encoder():
+    encoder = PromptEncoder(budgets={'teste': 80})
+    # Estimativa local determinística, com ou sem tiktoken instalado
+    encoder._encoding = None
+    return encoder
+
+def test_compact_remove_vazios_e_arredonda(encoder):
+    dados = {'nome': 'Leite', 'marca': None, 'obs': '', 'tags': [], 'extra': {}, 'preco': 4.98765,
+             'lista': [1, None, 2.345], 'sub': {'a': None}}
+    assert encoder.compact(dados) == {'nome': 'Leite', 'preco': 4.99, 'lista': [1, 2.35]}
+
+def test_registros_viram_tabela(encoder):
+    texto = encoder.encode({
+        'empresa': 'Loja A',
+        'produtos': [{'nome': 'Leite', 'dias': 3}, {'nome': 'Pão|Doce', 'estoque': 2}]
+    })
+    assert texto == 'empresa: Loja A\nprodutos (2):\nnome|dias|estoque\nLeite|3|\nPão/Doce||2'
+
+def test_sem_tipo_nao_corta(encoder):
+    dados = {'produtos': [{'nome': f'Produto {i}', 'dias': i} for i in range(100)]}
+    assert encoder.encode(dados).count('\n') == 101
+
+def test_orcamento_corta_itens_finais_e_informa_omitidos(encoder):
+    dados = {'resumo': 'curto', 'produtos': [{'nome': f'Produto {i}', 'dias': i} for i in range(100)]}
+
+    texto = encoder.encode(dados, tipo='teste')
+
+    assert encoder.estimate_tokens(texto) <= 80
+    linhas = texto.split('\n')
+    assert linhas[2] == 'nome|dias' and linhas[3] == 'Produto 0|0'
+    mantidos = len(linhas) - 4
+    assert f'produtos_omitidos: {100 - mantidos}' in texto
+    # O payload original não é alterado
+    assert len(dados['produtos']) == 100
+
+def test_orcamento_encurta_textos_longos(encoder):
+    texto = encoder.encode({'descricao': 'palavra ' * 300}, tipo='teste')
+    assert encoder.estimate_tokens(texto) <= 80
+    assert texto.endswith('...')
+
+def test_estimativa_cresce_com_o_texto(encoder):
+    assert encoder.estimate_tokens('') == 0
+    assert encoder.estimate_tokens('um dois três') < encoder.estimate_tokens('um dois três quatro cinco, seis')
@@ -0,0 +1,82 @@
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import src.services.openai_service as openai_module
+from src.services.rate_limiter import TokenBucketLimiter
+from src.services.resilient_client import ResilientCaller
+
+@pytest.fixture
+def limiter(monkeypatch):
+    monkeypatch.delenv('REDIS_URL', raising=False)
+    return TokenBucketLimiter(rpm=60, tpm=600)
+
+def test_reserva_ate_esgotar_e_respeita_prazo(limiter):
+    """Com o balde vazio, acquire espera no máximo o prazo e devolve False"""
+    assert limiter.acquire(tokens=600, timeout=0)
+    inicio = time.monotonic()
+    assert not limiter.acquire(tokens=100, timeout=0.05)
+    assert time.monotonic() - inicio < 0.5
+
+def test_refund_devolve_tokens_sem_passar_da_cota(limiter):
+    assert limiter.acquire(tokens=600, timeout=0)
+    limiter.refund(400)
+    assert limiter.acquire(tokens=390, timeout=0)
+    limiter.refund(10 ** 6)
+    assert limiter._tokens <= limiter.tpm
+
+def test_reabastece_pela_taxa_da_cota(limiter):
+    """60 rpm = 1 requisição por segundo"""
+    assert limiter.acquire(timeout=0)
+    limiter._requests = 0.0
+    inicio = time.monotonic()
+    assert limiter.acquire(timeout=2)
+    assert 0.5 < time.monotonic() - inicio < 1.5
+
+@pytest.mark.skipif(not os.getenv('REDIS_URL'), reason='requer REDIS_URL')
+def test_baldes_compartilhados_no_redis():
+    """Duas instâncias (processos diferentes) consomem a mesma cota"""
+    pytest.importorskip('redis')
+    primeiro, segundo = TokenBucketLimiter(rpm=2, tpm=1000), TokenBucketLimiter(rpm=2, tpm=1000)
+    assert primeiro.shared and segundo.shared
+    primeiro._redis.delete(TokenBucketLimiter.REDIS_KEY)
+
+    assert primeiro.acquire(timeout=0)
+    assert segundo.acquire(timeout=0)
+    assert not primeiro.acquire(timeout=0)
+
+def test_item_tem_um_unico_prazo(monkeypatch):
+    """Espera no limitador e novas tentativas cabem juntas em chat_item_timeout"""
+    monkeypatch.delenv('REDIS_URL', raising=False)
+    monkeypatch.setattr(openai_module.llm_cache, 'enabled', False)
+    monkeypatch.setattr(openai_module.ai_meter, 'record', lambda *args, **kwargs: None)
+
+    service = openai_module.OpenAIService('sk-teste')
+    service.chat_item_timeout = 0.6
+    service.resilience = ResilientCaller(max_in_flight=4, failure_threshold=100)
+    service.resilience.backoff_base = 0.001
+
+    # Cota quase vazia: a espera no limitador consome parte do prazo do item
+    service.rate_limiter = TokenBucketLimiter(rpm=100, tpm=10 ** 6)
+    service.rate_limiter._requests = 0.5
+
+    prazos = []
+    def create(timeout, **kwargs):
+        prazos.append(timeout)
+        time.sleep(timeout)
+        raise TimeoutError('lento')
+    service.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    inicio = time.monotonic()
+    resultado, _ = service._run_chat_request({
+        'cache_key': 'x', 'tipo': 'expiry_risk', 'empresa_id': 1, 'produto_id': 1,
+        'system': 'sistema', 'prompt': 'prompt', 'temperature': 0.3,
+        'fallback': {'risco_score': 0.0}, 'erro_log': 'Erro de teste'
+    })
+    duracao = time.monotonic() - inicio
+
+    assert 'erro' in resultado
+    assert duracao < 0.6 + 0.2
+    assert prazos and prazos[0] < 0.6
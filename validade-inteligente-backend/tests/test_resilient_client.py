@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src.services.resilient_client import AIUnavailableError, CircuitBreaker, ResilientCaller
+
+def _abrir_meio_aberto(caller: ResilientCaller, operation: str) -> CircuitBreaker:
+    """Abre o circuito e deixa o tempo de recuperação vencido (próxima chamada é o teste)"""
+    breaker = caller.breaker(operation)
+    for _ in range(caller.failure_threshold):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.ABERTO
+    breaker.opened_at -= caller.recovery_timeout
+    return breaker
+
+def test_sem_vaga_nao_prende_chamada_de_teste():
+    """Meio-aberto com todas as vagas ocupadas: a recusa não deixa o circuito travado"""
+    caller = ResilientCaller(max_in_flight=1, failure_threshold=2, recovery_timeout=30)
+    breaker = _abrir_meio_aberto(caller, 'chat')
+
+    assert caller._in_flight.acquire(blocking=False)
+    with pytest.raises(AIUnavailableError, match='simultâneas'):
+        caller.call('chat', lambda timeout: 'ok', timeout=1, retries=0)
+    caller._in_flight.release()
+
+    assert caller.call('chat', lambda timeout: 'ok', timeout=1, retries=0) == 'ok'
+    assert breaker.state == CircuitBreaker.FECHADO
+
+def test_erro_nao_transitorio_libera_chamada_de_teste():
+    """Erro não transitório na chamada de teste não bloqueia as próximas"""
+    caller = ResilientCaller(max_in_flight=2, failure_threshold=2, recovery_timeout=30)
+    _abrir_meio_aberto(caller, 'chat')
+
+    def falha(timeout):
+        raise ValueError('resposta inválida')
+
+    with pytest.raises(ValueError):
+        caller.call('chat', falha, timeout=1, retries=0)
+
+    assert caller.call('chat', lambda timeout: 'ok', timeout=1, retries=0) == 'ok'
+
+def test_vagas_devolvidas_apos_falhas_transitorias():
+    """Novas tentativas e circuito aberto não consomem vagas de chamadas simultâneas"""
+    caller = ResilientCaller(max_in_flight=1, failure_threshold=10, recovery_timeout=30)
+    caller.backoff_base = 0.001
+
+    def timeout_sempre(timeout):
+        raise TimeoutError('lento')
+
+    with pytest.raises(TimeoutError):
+        caller.call('chat', timeout_sempre, timeout=1, retries=2)
+
+    assert caller.call('chat', lambda timeout: 'ok', timeout=1, retries=0) == 'ok'
+
+def test_circuito_aberto_devolve_resultado_marcado_como_fallback(monkeypatch):
+    """Resultado padrão sai marcado (as rotas não o gravam como predição recente)"""
+    import src.services.openai_service as openai_module
+
+    monkeypatch.delenv('REDIS_URL', raising=False)
+    monkeypatch.setattr(openai_module.llm_cache, 'enabled', False)
+    monkeypatch.setattr(openai_module.ai_meter, 'record', lambda *args, **kwargs: None)
+
+    service = openai_module.OpenAIService('sk-teste')
+    service.resilience = ResilientCaller(max_in_flight=2, failure_threshold=1, recovery_timeout=30)
+    service.resilience.breaker('chat').record_failure()
+
+    chamadas = []
+    service.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+        create=lambda **kwargs: chamadas.append(kwargs)
+    )))
+
+    resultado, _ = service._run_chat_request({
+        'cache_key': 'x', 'tipo': 'expiry_risk', 'empresa_id': 1, 'produto_id': 1,
+        'system': 'sistema', 'prompt': 'prompt', 'temperature': 0.3,
+        'fallback': {'risco_score': 0.5, 'confianca': 0.0}, 'erro_log': 'Erro de teste'
+    })
+
+    assert resultado['fallback'] is True
+    assert resultado['risco_score'] == 0.5
+    assert 'circuito aberto' in resultado['erro']
+    assert chamadas == []
@@ -0,0 +1,45 @@
+import pytest
+
+from src.services.risk_prefilter import avaliar_risco_local, fatores_risco_vencimento
+
+def _produto(dias, estoque):
+    return {'dias_ate_vencimento': dias, 'estoque_atual': estoque}
+
+def test_fatores_ponderados_e_limitados():
+    fatores = fatores_risco_vencimento(dias_para_vencer=2, quantidade=10, vendas_mes=4)
+    assert fatores == {'tempo': 100, 'estoque': 20, 'rotatividade': 60,
+                       'total': pytest.approx(100 * 0.5 + 20 * 0.3 + 60 * 0.2)}
+
+    assert fatores_risco_vencimento(30, 0, 50)['total'] == 0
+    assert fatores_risco_vencimento(-5, 500, 0)['total'] == 100
+
+def test_casos_obvios_resolvidos_localmente():
+    assert avaliar_risco_local(_produto(10, 0), vendas_mes=0)['risco_nivel'] == 'baixo'
+
+    vencido = avaliar_risco_local(_produto(-1, 5), vendas_mes=30)
+    assert vencido['risco_nivel'] == 'critico' and vencido['risco_score'] == 1.0
+
+    # 60 un/mês em 10 dias = 20 vendas previstas, o dobro do estoque
+    giro = avaliar_risco_local(_produto(10, 10), vendas_mes=60)
+    assert giro['risco_nivel'] == 'baixo' and giro['origem'] == 'heuristica'
+
+def test_limites_alto_e_baixo():
+    critico = avaliar_risco_local(_produto(1, 60), vendas_mes=0)
+    assert critico['risco_nivel'] == 'critico'
+    assert critico['dias_estimados'] == 1
+
+    alto = avaliar_risco_local(_produto(2, 30), vendas_mes=0)
+    assert alto['risco_nivel'] == 'alto'
+
+    baixo = avaliar_risco_local(_produto(30, 5), vendas_mes=8)
+    assert baixo['risco_nivel'] == 'baixo'
+    assert baixo['risco_score'] <= 0.25
+
+def test_casos_ambiguos_vao_para_o_modelo():
+    assert avaliar_risco_local(_produto(5, 20), vendas_mes=3) is None
+    assert avaliar_risco_local({'estoque_atual': 5}, vendas_mes=0) is None
+
+def test_configuracao_do_plano():
+    assert avaliar_risco_local(_produto(-1, 5), 0, config={'ativo': False}) is None
+    # Faixa ambígua vazia: tudo é resolvido localmente
+    assert avaliar_risco_local(_produto(5, 20), 3, config={'limite_baixo': 50, 'limite_alto': 50}) is not None
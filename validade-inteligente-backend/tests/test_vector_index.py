@@ -0,0 +1,113 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from src.services.vector_index import IVFVectorIndex, LocalVectorIndex
+
+DIM = 16
+
+def _vetor(produto_id):
+    return np.random.default_rng(produto_id).standard_normal(DIM).astype(np.float32)
+
+def _upserts(base_dir, primeiro_id, lotes, barreira):
+    """Processo escritor: vários upserts pequenos sobre o mesmo índice"""
+    index = LocalVectorIndex(1, base_dir=base_dir, dim=DIM, dtype='float32', pca_dim=0)
+    barreira.wait()
+    for lote in range(lotes):
+        ids = [primeiro_id + lote * 5 + i for i in range(5)]
+        index.upsert(ids, np.stack([_vetor(produto_id) for produto_id in ids]))
+
+def test_upserts_concorrentes_de_processos_diferentes(tmp_path):
+    """Dois processos inserindo ao mesmo tempo não sobrescrevem linhas nem perdem ids"""
+    base_dir = str(tmp_path)
+    LocalVectorIndex(1, base_dir=base_dir, dim=DIM, dtype='float32', pca_dim=0).rebuild([], np.empty((0, DIM)))
+
+    contexto = multiprocessing.get_context('spawn')
+    barreira = contexto.Barrier(2)
+    processos = [
+        contexto.Process(target=_upserts, args=(base_dir, primeiro_id, 60, barreira))
+        for primeiro_id in (1000, 5000)
+    ]
+    for processo in processos:
+        processo.start()
+    for processo in processos:
+        processo.join(60)
+        assert processo.exitcode == 0
+
+    index = LocalVectorIndex(1, base_dir=base_dir, dim=DIM, dtype='float32', pca_dim=0)
+    esperados = list(range(1000, 1300)) + list(range(5000, 5300))
+    assert len(index) == len(esperados)
+    for produto_id in esperados[::7]:
+        melhor_id, similaridade = index.search(_vetor(produto_id), k=1)[0]
+        assert melhor_id == produto_id
+        assert similaridade > 0.999
+
+def test_upsert_substitui_e_remove_vira_lapide(tmp_path):
+    index = LocalVectorIndex(1, base_dir=str(tmp_path), dim=DIM, dtype='float32', pca_dim=0)
+    index.upsert([1, 2, 3], np.stack([_vetor(i) for i in (1, 2, 3)]))
+    index.upsert([2], _vetor(20)[None, :])
+    index.remove([3])
+
+    assert len(index) == 2
+    assert index.search(_vetor(20), k=1)[0][0] == 2
+    assert 3 not in [produto_id for produto_id, _ in index.search(_vetor(3), k=5)]
+
+    index.compact()
+    assert index.tombstone_ratio() == 0.0
+    assert sorted(produto_id for produto_id, _ in index.search(_vetor(1), k=5)) == [1, 2]
+
+def _catalogo(n, dim=DIM, seed=0):
+    rng = np.random.default_rng(seed)
+    return list(range(1, n + 1)), rng.standard_normal((n, dim)).astype(np.float32)
+
+def _top_exato(vetores, consulta, k):
+    normalizados = vetores / np.linalg.norm(vetores, axis=1, keepdims=True)
+    scores = normalizados @ (consulta / np.linalg.norm(consulta))
+    return list(np.argsort(-scores)[:k] + 1), np.sort(scores)[::-1][:k]
+
+@pytest.mark.parametrize('dtype, tolerancia', [('float32', 1e-5), ('float16', 2e-3), ('int8', 2e-2)])
+def test_busca_igual_a_forca_bruta(tmp_path, dtype, tolerancia):
+    """Ordem e similaridades da busca exata contra o produto interno em float64"""
+    ids, vetores = _catalogo(300)
+    index = LocalVectorIndex(1, base_dir=str(tmp_path), dim=DIM, dtype=dtype, pca_dim=0)
+    index.rebuild(ids, vetores)
+
+    consulta = np.random.default_rng(1).standard_normal(DIM)
+    encontrados = index.search(consulta, k=10)
+    esperados, scores = _top_exato(vetores.astype(np.float64), consulta, 10)
+
+    assert [s for _, s in encontrados] == pytest.approx(list(scores), abs=tolerancia)
+    if dtype == 'float32':
+        assert [produto_id for produto_id, _ in encontrados] == esperados
+
+def test_upsert_alem_da_capacidade_e_reabertura(tmp_path):
+    """A matriz cresce com as inserções e outra instância lê o mesmo índice do disco"""
+    ids, vetores = _catalogo(50)
+    index = LocalVectorIndex(1, base_dir=str(tmp_path), dim=DIM, dtype='float32', pca_dim=0)
+    for inicio in range(0, 50, 7):
+        index.upsert(ids[inicio:inicio + 7], vetores[inicio:inicio + 7])
+
+    reaberto = LocalVectorIndex(1, base_dir=str(tmp_path), dim=DIM, dtype='float32', pca_dim=0)
+    assert reaberto.exists()
+    assert len(reaberto) == 50
+    assert reaberto.search(vetores[41], k=1)[0][0] == 42
+
+    # A outra instância enxerga escritas posteriores sem reabrir
+    index.remove([42])
+    assert 42 not in [produto_id for produto_id, _ in reaberto.search(vetores[41], k=3)]
+
+def test_ivf_com_todas_as_listas_igual_a_busca_exata(tmp_path):
+    ids, vetores = _catalogo(400)
+    index = LocalVectorIndex(1, base_dir=str(tmp_path), dim=DIM, dtype='float32', pca_dim=0)
+    index.rebuild(ids, vetores)
+    ann = IVFVectorIndex(index, n_lists=8)
+    ann.build(iterations=5)
+
+    novos_ids, novos = _catalogo(5, seed=9)
+    index.upsert([1000 + i for i in novos_ids], novos)
+
+    for consulta in list(np.random.default_rng(2).standard_normal((5, DIM))) + [novos[0]]:
+        exato = index.search(consulta, k=5)
+        aproximado = ann.search(consulta, k=5, nprobe=8)
+        assert [produto_id for produto_id, _ in aproximado] == [produto_id for produto_id, _ in exato]
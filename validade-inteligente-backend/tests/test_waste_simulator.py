@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from src.services.waste_simulator import WasteSimulator, vendas_truncadas
+
+def _forca_bruta(estoque, dias_venda, media, dispersao, fator_semana, dia_semana_inicial, simulacoes, rng):
+    """Demanda sorteada dia a dia: taxa Gamma(r, m_t / r) e vendas Poisson, somadas até o vencimento"""
+    perdas = np.zeros((len(estoque), simulacoes))
+    for i in range(len(estoque)):
+        demanda = np.zeros(simulacoes)
+        for dia in range(dias_venda[i]):
+            m = media[i] * fator_semana[(dia_semana_inicial + dia) % 7]
+            demanda += rng.poisson(rng.gamma(dispersao[i], m / dispersao[i], size=simulacoes))
+        perdas[i] = np.maximum(estoque[i] - demanda, 0.0)
+    return perdas
+
+def test_simular_confere_com_simulacao_diaria():
+    """A soma colapsada em uma gamma reproduz a média e o P90 da simulação dia a dia"""
+    estoque = np.array([5.0, 20.0, 12.0, 40.0, 3.0])
+    dias_venda = np.array([3, 10, 7, 21, 1])
+    media = np.array([1.0, 1.5, 0.4, 2.5, 6.0])
+    dispersao = np.array([0.8, 3.0, 0.3, 10.0, 1e4])
+    fator_semana = np.array([0.8, 0.9, 1.0, 1.0, 1.1, 1.4, 0.8])
+    fator_semana = fator_semana / fator_semana.mean()
+
+    simulador = WasteSimulator(simulacoes=40000)
+    resultado = simulador.simular(estoque, dias_venda, media, dispersao, fator_semana, 2,
+                                  {'custo': np.ones(5)}, rng=np.random.default_rng(1))
+    referencia = _forca_bruta(estoque, dias_venda, media, dispersao, fator_semana, 2, 40000,
+                              np.random.default_rng(2))
+
+    assert resultado['perda_media'] == pytest.approx(referencia.mean(axis=1), rel=0.03, abs=0.05)
+    assert np.abs(resultado['perda_p90'] - np.percentile(referencia, 90, axis=1)).max() <= 1.0
+
+def test_vendas_truncadas_igual_a_inversao_direta():
+    rng = np.random.default_rng(3)
+    forma = np.array([0.2, 1.0, 5.0, 50.0, 1.0])
+    escala = np.array([10.0, 2.0, 0.5, 0.1, 0.0])
+    estoque = np.array([30.0, 8.0, 4.0, 10.0, 6.0])
+    u = 1.0 - rng.random((5, 200))
+
+    vendidos = vendas_truncadas(forma, escala, estoque, u)
+
+    for i in range(5):
+        p = 1.0 / (1.0 + escala[i])
+        pmf = [p ** forma[i]]
+        for k in range(1, 200):
+            pmf.append(pmf[-1] * (forma[i] + k - 1) / k * (1 - p))
+        cdf = np.cumsum(pmf)
+        esperado = np.minimum([np.searchsorted(cdf, valor, side='left') for valor in u[i]], estoque[i])
+        assert np.array_equal(vendidos[i], esperado)
+    # Sem demanda nada é vendido
+    assert not vendidos[4].any()
+
+def test_cenarios_com_mesma_semente_usam_numeros_comuns():
+    """Produtos sem desconto perdem o mesmo nos dois cenários; com desconto, nunca mais"""
+    rng = np.random.default_rng(4)
+    n = 60
+    estoque = rng.integers(1, 50, n).astype(float)
+    dias_venda = rng.integers(1, 20, n)
+    media = rng.uniform(0.2, 3.0, n)
+    dispersao = rng.uniform(0.5, 10.0, n)
+    com_desconto = np.arange(n) % 3 == 0
+
+    def multiplicador(idx, dias):
+        return np.where(com_desconto[idx, None], 1.6, 1.0) * np.ones(len(dias))[None, :]
+
+    simulador = WasteSimulator(simulacoes=300)
+    args = (estoque, dias_venda, media, dispersao, np.ones(7), 0, {'custo': np.ones(n)})
+    base = simulador.simular(*args, rng=np.random.default_rng(9))
+    desconto = simulador.simular(*args, multiplicador=multiplicador, rng=np.random.default_rng(9))
+
+    assert np.array_equal(base['perda_media'][~com_desconto], desconto['perda_media'][~com_desconto])
+    assert np.all(desconto['perda_media'][com_desconto] <= base['perda_media'][com_desconto])
+    assert np.all(desconto['totais']['custo'] <= base['totais']['custo'])